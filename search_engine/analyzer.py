@@ -0,0 +1,166 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+# File with the stop words (one per line), next to this module so it does not depend on the working directory
+STOP_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stopwords.txt")
+MIN_TOKEN_LENGTH = 3                # Tokens must be longer than this number of characters
+MAX_TOKEN_LENGTH = 70               # Tokens must be shorter than this number of characters
+LEMMA_CACHE_SIZE = 500000           # Maximum number of lemmatized words kept in the cache
+
+# Same expression as the WordPunctTokenizer of NLTK (words and runs of punctuation)
+regex_tokens = re.compile(r"\w+|[^\w\s]+")
+
+
+def load_stop_words(path: str = STOP_WORDS_PATH) -> set:
+    """
+    Loads all the stop words from the text file to a set.
+    """
+
+    stop_words = set()
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for word in file:
+                stop_words.add(word.strip())
+    except IOError:
+        print("Stop words file not found in the directory.")
+
+    return stop_words
+
+
+class Analyzer:
+    """
+    This class is responsible for the text analysis shared by the index and the queries:
+    tokenization (with or without positional index), stop word filtering, lemmatization,
+    word frequency and bi-gram frequency.
+
+    It only depends on the standard library at import time. NLTK (WordNet) is imported
+    the first time a word is lemmatized, so the query path of the API does not load the
+    indexing toolchain (TidyLib, BeautifulSoup, LXML). Preprocessing delegates to this
+    class, so the index and the queries always use the same rules.
+    """
+
+    def __init__(self, stop_words: set = None):
+        self.stop_words = load_stop_words() if stop_words is None else stop_words
+        self.lemmatizer = None
+        self.lemmas = {}        # Cache of the lemmatized words
+        # The LazyCorpusLoader of WordNet is not thread-safe, so it's only loaded by one thread
+        # (the warm-up of Search runs while the requests can already lemmatize)
+        self.lock = threading.Lock()
+
+
+    def preload(self):
+        """
+        Imports NLTK and loads WordNet into memory by using the lemmatizer for the first time.
+        Other threads wait until it's loaded.
+        """
+
+        if self.lemmatizer is None:
+            with self.lock:
+                if self.lemmatizer is None:
+                    from nltk.stem import WordNetLemmatizer
+                    lemmatizer = WordNetLemmatizer()
+                    lemmatizer.lemmatize("preloading")
+                    self.lemmatizer = lemmatizer
+
+
+    def lemmatize(self, word: str) -> str:
+        """
+        Lemmatizes the word with the WordNetLemmatizer (results are cached).
+        """
+
+        lemma = self.lemmas.get(word)
+        if lemma is None:
+            if self.lemmatizer is None:
+                self.preload()
+            if len(self.lemmas) >= LEMMA_CACHE_SIZE:
+                self.lemmas.clear()
+            lemma = self.lemmas[word] = self.lemmatizer.lemmatize(word)
+        return lemma
+
+
+    def is_term(self, word: str) -> bool:
+        """
+        Filter of the tokens: removes all stop words, words shorter than 4 characters,
+        and any special characters that do not belong to ascii.
+        """
+
+        return (word.isalnum() and
+                word not in self.stop_words and
+                word.isascii() and
+                len(word) > MIN_TOKEN_LENGTH and len(word) < MAX_TOKEN_LENGTH)
+
+
+    def tokenize(self, content: str) -> 'List[tokens]':
+        """
+        Tokenizer that uses punctuation as delimiter and filters the tokens (is_term).
+        Returns a list of strings (tokens)
+        """
+
+        if not content:
+            return []
+        return [word for word in regex_tokens.findall(content.lower()) if self.is_term(word)]
+
+
+    def tokenize_span(self, content: str) -> 'List[tuples]':
+        """
+        Tokenizer that accounts for the positional index of each of the tokens inside
+        the original text. Uses punctuation as delimiter and filters the tokens (is_term).
+        Returns a list of tuples (token, index)
+        """
+
+        if not content:
+            return []
+        return [(match.group(), match.start()) for match in regex_tokens.finditer(content.lower())
+                if self.is_term(match.group())]
+
+
+    def lemmatize_span(self, tokens: 'List[(token, span)]') -> 'List[(lemma, span)]':
+        """
+        Lemmatizes the list of tuples (token, index) keeping the positional index of each token.
+        """
+
+        return [(self.lemmatize(word[0]), word[1]) for word in tokens]
+
+
+    def word_frequency(self, tokens: 'List[token] or List[(token, span)]') -> 'Dict':
+        """
+        Calculates the word frequency of the list of tokens (lemmatized).
+        For a List[token] it returns the token as key and the frequency as value.
+        For a List[(token, span/index)] it returns the token as key, and a nested list
+        [frequency, [indexes it appears]] as value.
+        """
+
+        freq_dict = defaultdict(list)
+
+        # Checks if the incoming container is a List of tokens
+        # or a List of Tuples (token, span)
+        if any(isinstance(i, tuple) for i in tokens):
+            for lemma, idx in self.lemmatize_span(tokens):
+                if freq_dict.get(lemma):
+                    freq_dict[lemma][0] = freq_dict[lemma][0] + 1
+                    freq_dict[lemma][1].append(idx)
+                else:
+                    freq_dict[lemma].insert(0, 1)
+                    freq_dict[lemma].insert(1, [idx])
+
+        elif isinstance(tokens, list):
+            freq_dict = dict(Counter(self.lemmatize(word) for word in tokens))
+
+        return freq_dict
+
+
+    def bigram_freq(self, content: str) -> 'Dict':
+        """
+        Calculates the word frequency using bi-grams or bi-words of the lemmatized tokens.
+        The keys are the (first, second) pairs of lemmas, so different pairs can't share a key.
+        """
+
+        lemmatized = [self.lemmatize(word) for word in self.tokenize(content)]
+        return dict(Counter(zip(lemmatized, lemmatized[1:])))
@@ -6,31 +6,54 @@
 from flask import Flask, request, Response
 from flask_restful import Resource, Api, reqparse
 from flask_cors import CORS
-from search import Search
+from search import Search, MODES, MODE_AUTO, RESULTS_DISPLAYED, TOP_K
+from sharding import Coordinator, SHARD_ADDRESSES
+from metrics import metrics
+from scoring import SCORERS, DEFAULT_SCORER
+from suggest import SUGGEST_LIMIT
+import profiling
 
 app = Flask(__name__)
 api = Api(app)
 
 # Cross-origin resource sharing (CORS) allows request of restricted resources
 # from another domain
-cors = CORS(app, resources={r"/api*": {"origins": "*"}})
+cors = CORS(app, resources={r"/api*": {"origins": "*"}, r"/suggest*": {"origins": "*"}})
 
-s = Search()
+# With a sharded index the searches are sent to the shard workers (GUGOL_SHARD_ADDRESSES)
+s = Coordinator(SHARD_ADDRESSES) if SHARD_ADDRESSES else Search()
 last_results = []
 last_query = ""
 last_number_results_found = 0
 last_query_speed = 0
 last_search_lemmatized = []
+last_did_you_mean = None
 
 # Handling of the parameters from the URL
 parser = reqparse.RequestParser()
 parser.add_argument('query', type = str, required = True, help = "Enter query words")
 parser.add_argument('start', type = int, required = True, help = "Enter start number")
+parser.add_argument('mode', type = str, default = MODE_AUTO, choices = MODES, help = "Enter the matching mode (or, and, auto)")
+parser.add_argument('scorer', type = str, default = DEFAULT_SCORER, choices = SCORERS, help = "Enter the ranking model (cosine, bm25, bm25f)")
+
+# Handling of the parameters of the autocomplete
+def suggest_limit(value) -> int:
+    limit = int(value)
+    if not 1 <= limit <= SUGGEST_LIMIT:
+        raise ValueError("The limit must be between 1 and {}".format(SUGGEST_LIMIT))
+    return limit
+
+suggest_parser = reqparse.RequestParser()
+suggest_parser.add_argument('prefix', type = str, required = True, help = "Enter the prefix to complete")
+suggest_parser.add_argument('limit', type = suggest_limit, default = None,
+                            help = "Enter the number of completions (1 to {})".format(SUGGEST_LIMIT))
 
 class SearchAPI(Resource):
     def __init__(self):
         self.__query = parser.parse_args().get('query', None)
         self.__start = parser.parse_args().get('start', None)
+        self.__mode = parser.parse_args().get('mode', MODE_AUTO)
+        self.__scorer = parser.parse_args().get('scorer', DEFAULT_SCORER)
 
     # This method handles the GET requests
     def get(self):
@@ -39,28 +62,65 @@ class SearchAPI(Resource):
         global last_number_results_found
         global last_query_speed
         global last_search_lemmatized
+        global last_did_you_mean
 
         # print("Query: "+self.__query)
         # print("Start: {}".format(self.__start))
         
-        # If the query terms changed it will refresh the cache with new results
-        if self.__query != last_query:
-            last_query = self.__query
-            temp = s.retrieve_results(self.__query)
+        # Searches that ask to be profiled always run (the cached results are not profiled)
+        profiler = profiling.Profiler('search') if profiling.requested(request.headers, request.args) else None
+
+        # If the query terms (or the matching mode or the scorer) changed it will refresh the cache with new results.
+        # Also if the page goes beyond the results that were ranked (early termination)
+        needed = self.__start + RESULTS_DISPLAYED
+        if ((self.__query, self.__mode, self.__scorer) != last_query or
+                len(last_results) < min(needed, last_number_results_found) or profiler is not None):
+            last_query = (self.__query, self.__mode, self.__scorer)
+            if profiler is not None:
+                profiler.start(self.__query)
+            try:
+                temp = s.retrieve_results(self.__query, self.__mode, max(TOP_K, needed), self.__scorer)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
             last_results = temp[0]
             last_number_results_found = temp[1]
             last_query_speed = temp[2]
             last_search_lemmatized = temp[3]
+            last_did_you_mean = temp[4]
 
-        results = s.construct_results(last_results, self.__start)
+        results = s.construct_results(last_results, self.__start, last_search_lemmatized)
 
-        return {'results':results,
-                'number_results_found': last_number_results_found,
-                'query_speed': last_query_speed,
-                'search_lemmatized': last_search_lemmatized}
+        response = {'results':results,
+                    'number_results_found': last_number_results_found,
+                    'query_speed': last_query_speed,
+                    'search_lemmatized': last_search_lemmatized,
+                    'did_you_mean': last_did_you_mean}
+        if profiler is not None:
+            response['profile'] = profiler.dump()
+        return response
         
 
+class SuggestAPI(Resource):
+    # This method returns the completions of the last word of the query, ranked
+    # by the number of documents that contain them
+    def get(self):
+        args = suggest_parser.parse_args()
+        # The autocomplete is built in the background after startup
+        if s.suggester is None:
+            return {'suggestions': []}
+        return {'suggestions': s.suggester.suggest_query(args['prefix'], args['limit'])}
+
+
+class MetricsAPI(Resource):
+    # This method exposes the query telemetry in the Prometheus text format
+    def get(self):
+        return Response(metrics.render(), mimetype = 'text/plain; version=0.0.4')
+
+
 api.add_resource(SearchAPI, '/api')
+api.add_resource(SuggestAPI, '/suggest')
+api.add_resource(MetricsAPI, '/metrics')
 
 if __name__ == '__main__':
     app.run(debug = True)
\ No newline at end of file
@@ -0,0 +1,509 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import json
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+from time import perf_counter, time
+from concurrent.futures import ProcessPoolExecutor
+logger = logging.getLogger(__name__)
+
+"""
+Indexing throughput benchmark with a deterministic synthetic corpus.
+
+The generator writes a corpus in the layout of WEBPAGES_RAW (<folder>/<file> pages and
+bookkeeping.json) with the same seed always giving the same pages:
+    - HTML pages with the usual tag mix (title, headers, paragraphs, strong/b/em/i,
+        lists, tables, scripts and styles) and links to other pages of the corpus
+        (absolute and relative, more links to the popular pages).
+    - Pages with broken markup (no body, unclosed and unopened tags).
+    - Numeric-heavy pages (tables of numbers, above preprocessing.NUMBER_ALPHA).
+    - Text-like pages (no tags, numbers and URLs in the text).
+The words follow a Zipf distribution over a synthetic vocabulary.
+
+Each corpus size runs in a fresh process through the stages of the indexing (fetch_content,
+the tokenize/frequency/bi-gram analysis, the whole preprocess_all with the writes to MongoDB,
+calculate_scores, the bi-gram pairs and PageRank), and the docs/sec and memory of each
+stage are written to a JSON report that can be compared against a baseline report:
+
+    python benchmark.py --docs 500 2000 --output baseline.json
+    python benchmark.py --docs 500 2000 --baseline baseline.json
+
+The memory of a stage is measured during that stage only (Linux, /proc): the peak RSS of
+the process is reset when the stage starts (/proc/self/clear_refs), or the current RSS is
+sampled every SAMPLE_INTERVAL if it can't be reset. stage_peak_rss_mb is the highest RSS
+during the stage and rss_growth_mb its difference with the RSS at the start of the stage
+(the memory the stage added on top of the previous ones).
+
+The indexes are written to a separate database (BENCHMARK_DB) of the configured mongod,
+or to mongomock (--mongomock) if it is installed.
+"""
+
+BENCHMARK_DB = 'gugol_benchmark'        # Database of the benchmark (dropped before each run)
+REPORT_PATH = 'benchmark_report.json'   # File where the report of the benchmark is written
+SEED = 42                   # Seed of the synthetic corpus
+DOCS = (500,)               # Default corpus sizes
+VOCABULARY = 5000           # Number of words of the synthetic vocabulary
+FOLDER_SIZE = 500           # Pages per folder (as WEBPAGES_RAW)
+HOST = 'www.gugol-benchmark.test'   # Host of the URLs of the synthetic pages
+SAMPLE_INTERVAL = 0.01      # Seconds between the samples of the RSS (if the peak can't be reset)
+KINDS = (('html', 0.70), ('broken', 0.12), ('numeric', 0.10), ('text', 0.08))  # Mix of page kinds
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'shi', 'po', 'ven', 'dar', 'qu', 'el', 'bri', 'son',
+             'at', 'ex', 'ing', 'or', 'um', 'tra', 'gle', 'ph', 'ost', 'ic']
+STRONG_TAGS = ['strong', 'b', 'em', 'i', 'u']
+
+
+class CorpusGenerator:
+    """
+    This class is responsible for generating the synthetic corpus. All the randomness comes
+    from the seed, so the same number of documents and seed give the same corpus.
+    """
+
+    def __init__(self, documents: int, seed: int = SEED, vocabulary: int = VOCABULARY):
+        self.documents = documents
+        self.random = random.Random(seed)
+        words = set()
+        while len(words) < vocabulary:
+            words.add(''.join(self.random.choice(SYLLABLES) for _ in range(self.random.randint(2, 4))))
+        self.words = sorted(words)
+        self.random.shuffle(self.words)
+        # Zipf distribution of the words and of the popularity of the pages (links)
+        self.word_weights = self.cumulative([1 / rank for rank in range(1, len(self.words) + 1)])
+        self.page_weights = self.cumulative([1 / rank for rank in range(1, documents + 1)])
+        self.paths = ['{}/{}'.format(idx // FOLDER_SIZE, idx % FOLDER_SIZE) for idx in range(documents)]
+        self.urls = { path: '{}/{}/page{}.html'.format(HOST, *path.split('/')) for path in self.paths }
+
+
+    def cumulative(self, weights: list) -> list:
+        total = 0
+        values = []
+        for weight in weights:
+            total += weight
+            values.append(total)
+        return values
+
+
+    def text(self, length: int) -> str:
+        return ' '.join(self.random.choices(self.words, cum_weights = self.word_weights, k = length))
+
+
+    def sentence(self) -> str:
+        words = self.text(self.random.randint(6, 18))
+        return words[0].upper() + words[1:] + '.'
+
+
+    def link(self, path: str) -> str:
+        """
+        Returns an anchor to a page of the corpus (popular pages are linked more), relative
+        to the page if both are in the same folder.
+        """
+
+        target = self.random.choices(self.paths, cum_weights = self.page_weights)[0]
+        url = self.urls[target]
+        if target.split('/')[0] == path.split('/')[0] and self.random.random() < 0.5:
+            href = url.rsplit('/', 1)[1]
+        else:
+            href = 'http://' + url
+        return '<a href="{}">{}</a>'.format(href, self.text(self.random.randint(1, 3)))
+
+
+    def paragraph(self, path: str) -> str:
+        parts = []
+        for _ in range(self.random.randint(2, 6)):
+            sentence = self.sentence()
+            roll = self.random.random()
+            if roll < 0.25:
+                tag = self.random.choice(STRONG_TAGS)
+                sentence = '<{0}>{1}</{0}> {2}'.format(tag, self.text(self.random.randint(1, 4)), sentence)
+            elif roll < 0.5:
+                sentence = '{} {}'.format(sentence, self.link(path))
+            parts.append(sentence)
+        return '<p>{}</p>'.format(' '.join(parts))
+
+
+    def table(self, rows: int, columns: int) -> str:
+        lines = ['<table>']
+        for _ in range(rows):
+            cells = ''.join('<td>{}</td>'.format(self.random.choice([
+                str(self.random.randint(0, 100000)),
+                '{:.3f}'.format(self.random.uniform(-1000, 1000)),
+                '{:.2e}'.format(self.random.uniform(0, 1e6))])) for _ in range(columns))
+            lines.append('<tr>{}</tr>'.format(cells))
+        lines.append('</table>')
+        return '\n'.join(lines)
+
+
+    def html_page(self, path: str) -> str:
+        lines = ['<!DOCTYPE html>', '<html>', '<head>',
+                 '<title>{}</title>'.format(self.text(self.random.randint(2, 8))),
+                 '<meta charset="utf-8">',
+                 '<style>body {{ font-family: sans-serif; }} .{} {{ color: #333; }}</style>'.format(self.words[0]),
+                 '</head>', '<body>',
+                 '<h1>{}</h1>'.format(self.text(self.random.randint(2, 6)))]
+        for _ in range(self.random.randint(2, 8)):
+            lines.append('<h{0}>{1}</h{0}>'.format(self.random.randint(2, 6), self.text(self.random.randint(2, 6))))
+            for _ in range(self.random.randint(1, 5)):
+                lines.append(self.paragraph(path))
+            if self.random.random() < 0.3:
+                lines.append('<ul>{}</ul>'.format(''.join('<li>{}</li>'.format(self.link(path))
+                                                          for _ in range(self.random.randint(2, 10)))))
+            if self.random.random() < 0.1:
+                lines.append(self.table(self.random.randint(2, 10), self.random.randint(2, 5)))
+        lines.append('<script>var {} = {};</script>'.format(self.words[1], self.random.randint(0, 100)))
+        lines.extend(['</body>', '</html>'])
+        return '\n'.join(lines)
+
+
+    def broken_page(self, path: str) -> str:
+        """
+        HTML page without body tags, with unclosed and unopened tags.
+        """
+
+        lines = ['<title>{}'.format(self.text(self.random.randint(2, 6)))]
+        for _ in range(self.random.randint(3, 15)):
+            roll = self.random.random()
+            if roll < 0.3:
+                lines.append('<p>{}'.format(self.sentence()))
+            elif roll < 0.5:
+                lines.append('{}</strong> {}'.format(self.text(3), self.sentence()))
+            elif roll < 0.6:
+                lines.append('<h2>{}</div>'.format(self.text(4)))
+            else:
+                lines.append(self.paragraph(path))
+        return '\n'.join(lines)
+
+
+    def numeric_page(self, path: str) -> str:
+        lines = ['<html><head><title>{} data</title></head><body>'.format(self.text(2)),
+                 '<h1>{}</h1>'.format(self.text(3)), self.paragraph(path)]
+        for _ in range(self.random.randint(1, 4)):
+            lines.append(self.table(self.random.randint(10, 60), self.random.randint(3, 8)))
+        lines.append('</body></html>')
+        return '\n'.join(lines)
+
+
+    def text_page(self, path: str) -> str:
+        """
+        Plain text page (no tags) with numbers and URLs.
+        """
+
+        lines = []
+        for _ in range(self.random.randint(20, 200)):
+            roll = self.random.random()
+            if roll < 0.1:
+                lines.append('http://{}'.format(self.urls[self.random.choice(self.paths)]))
+            elif roll < 0.3:
+                lines.append(' '.join(str(self.random.randint(0, 9999)) for _ in range(self.random.randint(2, 12))))
+            else:
+                lines.append(self.sentence())
+        return '\n'.join(lines)
+
+
+    def page(self, path: str) -> str:
+        kind = self.random.choices([kind for kind, _ in KINDS], weights = [weight for _, weight in KINDS])[0]
+        return getattr(self, '{}_page'.format(kind))(path)
+
+
+    def write(self, location: str) -> int:
+        """
+        Writes the pages and the bookkeeping file to the directory. Returns the size of the
+        corpus in bytes.
+        """
+
+        size = 0
+        for path in self.paths:
+            os.makedirs(os.path.join(location, path.split('/')[0]), exist_ok = True)
+            data = self.page(path).encode('utf-8')
+            size += len(data)
+            with open(os.path.join(location, path), 'wb') as file:
+                file.write(data)
+
+        with open(os.path.join(location, 'bookkeeping.json'), 'w', encoding = 'utf-8') as file:
+            json.dump(self.urls, file)
+
+        return size
+
+
+def read_rss(field: str = 'VmRSS') -> float:
+    """
+    Resident set size of the process in MB from /proc/self/status (VmRSS: current, VmHWM:
+    peak since the start or the last reset). None if it can't be read (not Linux).
+    """
+
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith(field + ':'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+class StageMemory:
+    """
+    This class is responsible for measuring the memory of a single stage: the peak RSS
+    of the process is reset at the start of the stage (or the current RSS is sampled by a
+    thread during the stage if the peak can't be reset), so the peak of the stage doesn't
+    include the peaks of the previous stages.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_rss = None
+        self.peak = None
+        self.sampler = None
+        self.stopped = threading.Event()
+
+
+    def reset_peak(self) -> bool:
+        try:
+            with open('/proc/self/clear_refs', 'w') as file:
+                file.write('5')
+            return True
+        except IOError:
+            return False
+
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            rss = read_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+
+    def start(self):
+        self.start_rss = read_rss()
+        if self.start_rss is None or self.reset_peak():
+            return
+        self.peak = self.start_rss
+        self.sampler = threading.Thread(target = self.sample, daemon = True)
+        self.sampler.start()
+
+
+    def stop(self) -> dict:
+        """
+        Returns the peak RSS of the stage, its growth over the RSS at the start of the stage
+        (MB, None if they can't be measured) and how the peak was measured.
+        """
+
+        if self.start_rss is None:
+            return {'stage_peak_rss_mb': None, 'rss_growth_mb': None, 'memory_method': None}
+
+        if self.sampler is None:
+            peak, method = read_rss('VmHWM'), 'peak_reset'
+        else:
+            self.stopped.set()
+            self.sampler.join()
+            peak, method = max(self.peak, read_rss() or 0), 'sampled'
+
+        return {'stage_peak_rss_mb': peak,
+                'rss_growth_mb': round(peak - self.start_rss, 1),
+                'memory_method': method}
+
+
+def run_stage(stages: list, name: str, documents: int, function, *args):
+    """
+    Runs a stage of the benchmark and records its time, docs/sec and the memory used
+    during the stage (see StageMemory). Returns the result of the stage.
+    """
+
+    memory = StageMemory()
+    memory.start()
+    start = perf_counter()
+    result = function(*args)
+    seconds = perf_counter() - start
+    stages.append(dict({'stage': name,
+                        'seconds': round(seconds, 3),
+                        'docs_per_sec': round(documents / seconds, 2) if seconds else 0},
+                       **memory.stop()))
+    logger.info("{} docs ... {} ... {}s ... {} docs/sec ... stage peak RSS {} MB (+{} MB)".format(
+        documents, name, stages[-1]['seconds'], stages[-1]['docs_per_sec'], stages[-1]['stage_peak_rss_mb'],
+        stages[-1]['rss_growth_mb']))
+    return result
+
+
+def run(documents: int, seed: int, layout: str, num_shards: int, database: str, mongomock: bool,
+        location: str) -> dict:
+    """
+    Generates a corpus of the number of documents and runs all the stages of the indexing
+    on it. Runs in its own process, so the memory of the other corpus sizes isn't counted.
+    """
+
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+
+    # Imported here, the database must be chosen before any module gets a collection
+    import database as db
+    db.DB_NAME = database
+    if mongomock:
+        import mongomock as mock
+        db.set_client(mock.MongoClient())
+    db.get_client().drop_database(database)
+
+    import main
+    import bigrams
+    import networkx as nx
+    from corpus import Corpus
+    from preprocessing import Preprocessing
+    from query import Query
+    from storage import Storage
+    from telemetry import IndexTelemetry
+    from duplicates import DuplicateDetector
+    from pagerank import outgoing_links
+
+    location = os.path.join(location, str(documents))
+    size = CorpusGenerator(documents, seed).write(location)
+    corpus = Corpus(location)
+    main.corpus = corpus
+    main.dict_path = corpus.dict_path
+    main.paths_list = corpus.paths
+
+    t = IndexTelemetry()
+    p = Preprocessing(t)
+    storages = [Storage(layout, shard) for shard in db.shards(num_shards)]
+    queries = [Query(layout, shard = shard) for shard in db.shards(num_shards)]
+    stages = []
+
+    def fetch():
+        return [p.fetch_content(path, raw) for path, raw in corpus.stream(corpus.paths)]
+
+    def analyze(contents):
+        # Tokenize, lemmatize, word frequency and bi-grams of the fields (see main.preprocess_all)
+        for content in contents:
+            tokens = p.tokenize_span(content.get('title')) + p.tokenize_span(content.get('body'))
+            p.word_frequency(tokens)
+            for field in ('h1h2', 'h3h6', 'strong', 'anchor'):
+                p.word_frequency(p.tokenize(content.get(field)))
+            p.bigram_freq(content.get('title'))
+            p.bigram_freq(content.get('body'))
+
+    def index():
+        main.create_database_docs(storages)
+        main.preprocess_all(p, storages, t, DuplicateDetector())
+
+    def scores():
+        statistics = main.global_statistics(queries)
+        for s, q in zip(storages, queries):
+            main.calculate_scores(s, q, t, statistics)
+        main.length_statistics(storages[0], queries, statistics[0])
+        return len(statistics[1])
+
+    def pairs():
+        statistics = main.global_statistics_bigrams(queries)
+        for s, q in zip(storages, queries):
+            bigrams.build(q, s, statistics)
+
+    def pagerank():
+        # outgoing_links prints the progress of every page
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            outgoing = outgoing_links(corpus.dict_path, corpus)
+        page_rank = nx.pagerank(nx.DiGraph(outgoing), alpha = 0.9)
+        url_paths = { url: path for path, url in corpus.dict_path.items() }
+        for shard, s in zip(db.shards(num_shards), storages):
+            partition = { url: rank for url, rank in page_rank.items()
+                          if db.shard_of(url_paths[url], num_shards) == shard }
+            if partition:
+                s.insert_pagerank(partition)
+
+    contents = run_stage(stages, 'fetch_content', documents, fetch)
+    run_stage(stages, 'analyze', documents, analyze, contents)
+    del contents
+    run_stage(stages, 'preprocess_all', documents, index)
+    terms = run_stage(stages, 'calculate_scores', documents, scores)
+    run_stage(stages, 'bigram_pairs', documents, pairs)
+    run_stage(stages, 'pagerank', documents, pagerank)
+    t.end_phase()
+
+    db.get_client().drop_database(database)
+    return {'documents': documents,
+            'bytes': size,
+            'terms': terms,
+            'stages': stages,
+            'telemetry': [phase.summary() for phase in t.phases]}
+
+
+def compare(report: dict, baseline: dict):
+    """
+    Logs the change of the docs/sec of every stage against the baseline report (runs with
+    the same number of documents).
+    """
+
+    baseline_runs = { entry['documents']: { stage['stage']: stage for stage in entry['stages'] }
+                      for entry in baseline.get('runs', []) }
+    for entry in report['runs']:
+        previous = baseline_runs.get(entry['documents'])
+        if previous is None:
+            logger.info("No baseline for {} docs".format(entry['documents']))
+            continue
+        for stage in entry['stages']:
+            before = previous.get(stage['stage'])
+            if not before or not before['docs_per_sec']:
+                continue
+            change = (stage['docs_per_sec'] / before['docs_per_sec'] - 1) * 100
+            stage['baseline_docs_per_sec'] = before['docs_per_sec']
+            logger.info("{} docs ... {} ... {} -> {} docs/sec ({:+.1f}%) ... stage peak RSS {} -> {} MB".format(
+                entry['documents'], stage['stage'], before['docs_per_sec'], stage['docs_per_sec'], change,
+                before.get('stage_peak_rss_mb'), stage['stage_peak_rss_mb']))
+
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+
+    from database import LAYOUT_FLAT, LAYOUT_BUCKETS, INDEX_LAYOUT, DB_NAME
+
+    parser = argparse.ArgumentParser(description = "Benchmarks the indexing stages with a synthetic corpus.")
+    parser.add_argument('--docs', type = int, nargs = '+', default = list(DOCS),
+                        help = "Sizes of the synthetic corpus (number of documents)")
+    parser.add_argument('--seed', type = int, default = SEED, help = "Seed of the synthetic corpus")
+    parser.add_argument('--layout', choices = [LAYOUT_FLAT, LAYOUT_BUCKETS], default = INDEX_LAYOUT,
+                        help = "Storage layout of the postings of the terms")
+    parser.add_argument('--shards', type = int, default = 1,
+                        help = "Number of document-partitioned shards of the index")
+    parser.add_argument('--database', default = BENCHMARK_DB,
+                        help = "Database of the benchmark (dropped before and after each run)")
+    parser.add_argument('--mongomock', action = 'store_true',
+                        help = "Uses mongomock (in memory) instead of the configured mongod")
+    parser.add_argument('--corpus-dir', help = "Directory of the synthetic corpus (temporary by default)")
+    parser.add_argument('--output', default = REPORT_PATH, help = "File where the report is written")
+    parser.add_argument('--baseline', help = "Report of a previous run to compare with")
+    args = parser.parse_args()
+
+    if args.database == DB_NAME and not args.mongomock:
+        parser.error("The benchmark drops its database, it can't be the database of the index ({})".format(DB_NAME))
+
+    report = {'started': time(), 'seed': args.seed, 'layout': args.layout, 'shards': args.shards,
+              'backend': 'mongomock' if args.mongomock else 'mongod', 'runs': []}
+
+    with tempfile.TemporaryDirectory() as temporary:
+        location = args.corpus_dir or temporary
+        for documents in args.docs:
+            # A fresh process per size, so the memory of each size is its own
+            with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context('spawn')) as pool:
+                report['runs'].append(pool.submit(run, documents, args.seed, args.layout, args.shards,
+                                                  args.database, args.mongomock, location).result())
+
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r', encoding = 'utf-8') as file:
+                compare(report, json.load(file))
+        except IOError:
+            print("Baseline report not found.")
+
+    try:
+        with open(args.output, 'w', encoding = 'utf-8') as file:
+            json.dump(report, file, indent = 2)
+        logger.info("Benchmark report written to {}".format(args.output))
+    except IOError:
+        print("Error writing the benchmark report.")
@@ -0,0 +1,174 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import math
+import logging
+from array import array
+from bisect import bisect_left
+from query import Query
+from storage import Storage, path_key, key_path
+from quantize import pack, unpack
+logger = logging.getLogger(__name__)
+
+"""
+Index of the bi-grams keyed by integer pairs of term IDs.
+
+The bi-grams are collected during the indexing in the bi-grams collection (test_bigrams_v6,
+keyed by the two lemmas separated by a space) and then compacted into the pairs collection:
+    - The terms of the bi-grams get an integer ID, and every bi-gram is the pair of the IDs
+        of its terms packed in a 64-bit integer (first ID in the high 32 bits).
+    - Bi-grams found in fewer than MIN_DF documents are not stored.
+    - The pairs are sorted and written in blocks of packed arrays: the pairs, the offsets of
+        their postings, the keys of the documents (see storage.path_key) and the TF-IDF (float32).
+The table of the terms is kept in the collection of metadata. Search loads the blocks into
+memory and finds the postings of each bi-gram of the query with a binary search of the pairs.
+"""
+
+MIN_DF = int(os.environ.get('GUGOL_BIGRAM_MIN_DF', 2))    # Bi-grams in fewer documents are not stored
+SEPARATOR = ' '             # Separator of the terms in the keys of the bi-grams collection
+BLOCK_POSTINGS = 500000     # Maximum number of postings in each block (below the 16 MB of a MongoDB document)
+
+
+def bigram_key(pair: tuple) -> str:
+    """
+    Converts a pair of terms to the key of the bi-gram in the bi-grams collection.
+    """
+
+    return SEPARATOR.join(pair)
+
+
+def pack_pair(first: int, second: int) -> int:
+    """
+    Packs the IDs of the two terms of a bi-gram in a single integer.
+    """
+
+    return (first << 32) | second
+
+
+def build(q: Query, s: Storage, statistics: tuple = None, min_df: int = MIN_DF) -> dict:
+    """
+    Calculates the TF-IDF of the bi-grams collected in the index (q) found in at least
+    min_df documents and writes them as blocks of integer pairs (s).
+    If the index is sharded, the statistics (number of documents and postings count of the
+    bi-grams) are the global ones of all the shards.
+    Returns the statistics of the build (pairs, skipped bi-grams, postings, bytes).
+    """
+
+    count_unique_paths, dict_postings_count = statistics or (q.bigram_doc_count(), q.postings_bigrams_count())
+    term_ids = {}
+    entries = []        # (pair, keys, scores)
+    build_statistics = {'pairs': 0, 'skipped': 0, 'postings': 0, 'bytes': 0}
+
+    for bigram in q.iter_bigram_freq():
+        count = dict_postings_count.get(bigram['term']) or 0
+        if count < min_df:
+            build_statistics['skipped'] += 1
+            continue
+
+        first, second = bigram['term'].split(SEPARATOR)
+        idf = math.log10(count_unique_paths / count)
+        keys = array('I')
+        scores = array('f')
+        for key, freq in sorted((path_key(posting['path_id']), posting['bigram_wt_freq'])
+                                for posting in bigram['postings']):
+            # Checks if weighted frequency is 0, because log(0) = 1
+            tf = 1 + math.log10(freq) if freq != 0 else 0
+            keys.append(key)
+            scores.append(tf * idf)
+
+        pair = pack_pair(term_ids.setdefault(first, len(term_ids)), term_ids.setdefault(second, len(term_ids)))
+        entries.append((pair, keys, scores))
+
+    entries.sort(key = lambda entry: entry[0])
+    blocks = []
+    block = None
+    for pair, keys, scores in entries:
+        if block is None or block['offsets'][-1] + len(keys) > BLOCK_POSTINGS:
+            block = {'pairs': array('Q'), 'offsets': array('I', [0]), 'keys': array('I'), 'scores': array('f')}
+            blocks.append(block)
+        block['pairs'].append(pair)
+        block['keys'].extend(keys)
+        block['scores'].extend(scores)
+        block['offsets'].append(len(block['keys']))
+
+        build_statistics['pairs'] += 1
+        build_statistics['postings'] += len(keys)
+
+    terms = sorted(term_ids, key = term_ids.get)
+    s.insert_pairs(terms, min_df, [{name: pack(values) for name, values in block.items()} for block in blocks])
+
+    build_statistics['bytes'] = sum(len(values) * values.itemsize for block in blocks for values in block.values())
+    logger.info("Bi-gram pairs of shard {}: {}".format(q.shard, build_statistics))
+    return build_statistics
+
+
+class BigramIndex:
+    """
+    In-memory index of the bi-grams: the sorted pairs of term IDs with the offsets of their
+    postings in the packed arrays of document keys and TF-IDF.
+    """
+
+    def __init__(self, terms: list):
+        self.term_ids = { term: idx for idx, term in enumerate(terms) }
+        self.pairs = array('Q')
+        self.offsets = array('I', [0])
+        self.keys = array('I')
+        self.scores = array('f')
+        self.paths = {}     # Key: key of the document, Value: path ID (shared strings)
+
+
+    @classmethod
+    def load(cls, q: Query) -> 'BigramIndex':
+        """
+        Loads the blocks of pairs of the index (q). Returns None if the pairs were not built.
+        """
+
+        meta = q.get_pairs_meta()
+        if not meta:
+            return None
+
+        index = cls(meta['terms'])
+        for block in q.get_pair_blocks(meta['version']):
+            base = len(index.keys)
+            index.pairs.extend(unpack('Q', block['pairs']))
+            index.offsets.extend(base + offset for offset in unpack('I', block['offsets'])[1:])
+            index.keys.extend(unpack('I', block['keys']))
+            index.scores.extend(unpack('f', block['scores']))
+
+        for key in index.keys:
+            if key not in index.paths:
+                index.paths[key] = key_path(key)
+
+        return index
+
+
+    def __len__(self):
+        return len(self.pairs)
+
+
+    def get_term_impacts(self, pair: tuple, paths: list = None) -> list:
+        """
+        Returns the (path ID, TF-IDF) pairs of the postings of the bi-gram (only of the
+        given paths if any). Bi-grams that were not stored have no postings.
+        """
+
+        first = self.term_ids.get(pair[0])
+        second = self.term_ids.get(pair[1])
+        if first is None or second is None:
+            return []
+
+        key = pack_pair(first, second)
+        idx = bisect_left(self.pairs, key)
+        if idx == len(self.pairs) or self.pairs[idx] != key:
+            return []
+
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        postings = [(self.paths[doc], score) for doc, score in zip(self.keys[start:end], self.scores[start:end])]
+        if paths is not None:
+            paths = set(paths)
+            postings = [posting for posting in postings if posting[0] in paths]
+
+        return postings
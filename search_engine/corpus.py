@@ -0,0 +1,354 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import gzip
+import io
+import json
+import os
+import queue
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+CORPUS_PATH = os.environ.get('GUGOL_CORPUS', 'WEBPAGES_RAW')   # Directory or archive of the corpus
+BOOKKEEPING = 'bookkeeping.json'    # Mapping of the path IDs to the URLs
+READ_WORKERS = 8                    # Number of threads reading files ahead of the indexing
+READ_AHEAD = 64                     # Maximum number of documents read ahead
+MAX_BUFFERED = 1024                 # Maximum number of out of order pages kept in memory by the sequential archives
+WARC_PATH_HEADER = 'WARC-Gugol-Path'    # Header of the WARC records with the path ID
+
+
+def path_sort_key(path: str) -> tuple:
+    """
+    Key used to sort the path IDs, as the json data is not correctly ordered.
+    """
+
+    return tuple(map(int, path.split('/')))
+
+
+def decode(data: bytes) -> str:
+    """
+    Decodes the content of a page the same way open() does in text mode
+    (utf-8 with universal new lines).
+    """
+
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+
+class DirectoryBackend:
+    """
+    Pages stored as files of a directory (WEBPAGES_RAW/<path ID>).
+    """
+
+    sequential = False
+
+    def __init__(self, location: str):
+        self.location = location
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.location, name), "rb") as file:
+            return file.read()
+
+
+class ZipBackend:
+    """
+    Pages stored inside a zip archive (compressed members are read without extracting).
+    The members can be inside a top directory (e.g. WEBPAGES_RAW/).
+    """
+
+    sequential = False
+
+    def __init__(self, location: str):
+        self.archive = zipfile.ZipFile(location)
+        names = [name for name in self.archive.namelist() if name.endswith(BOOKKEEPING)]
+        self.prefix = names[0][:-len(BOOKKEEPING)] if names else ''
+
+    def read(self, name: str) -> bytes:
+        try:
+            return self.archive.read(self.prefix + name)
+        except KeyError:
+            raise IOError(name)
+
+
+class TarBackend:
+    """
+    Pages stored inside a tar archive (optionally gz, bz2 or xz compressed).
+    Compressed tar files can only be read efficiently in order, so the documents
+    are streamed sequentially (see Corpus.pack to write the archive in the order
+    of the corpus).
+    """
+
+    sequential = True
+
+    def __init__(self, location: str):
+        self.location = location
+        self.prefix = None
+
+    def members(self):
+        """
+        Yields (name, content) for all the files of the archive in order.
+        """
+
+        with tarfile.open(self.location, "r:*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = member.name
+                if self.prefix is None and name.endswith(BOOKKEEPING):
+                    self.prefix = name[:-len(BOOKKEEPING)]
+                if self.prefix and name.startswith(self.prefix):
+                    name = name[len(self.prefix):]
+                yield name, archive.extractfile(member).read()
+
+    def read(self, name: str) -> bytes:
+        for member, content in self.members():
+            if member == name:
+                return content
+        raise IOError(name)
+
+
+class WarcBackend:
+    """
+    Pages stored as records of a WARC bundle (optionally gzip compressed).
+    The path ID of each record is taken from the WARC-Gugol-Path header, or from
+    the WARC-Target-URI matched against the URLs of the bookkeeping file.
+    HTTP headers of response records are removed from the content.
+    Records are streamed sequentially like the tar archives.
+    """
+
+    sequential = True
+
+    def __init__(self, location: str):
+        self.location = location
+        self.urls = {}      # Key: URL (without protocol), Value: path ID
+
+    def records(self):
+        """
+        Yields (headers, content) for all the records of the bundle.
+        """
+
+        opener = gzip.open if self.location.endswith('.gz') else open
+        with opener(self.location, "rb") as file:
+            while True:
+                line = file.readline()
+                if not line:
+                    break
+                if not line.startswith(b'WARC/'):
+                    continue
+
+                headers = {}
+                for line in iter(file.readline, b''):
+                    line = line.strip()
+                    if not line:
+                        break
+                    key, _, value = line.decode("utf-8", errors="replace").partition(':')
+                    headers[key.strip()] = value.strip()
+
+                content = file.read(int(headers.get('Content-Length', 0)))
+                if headers.get('WARC-Type') == 'response':
+                    content = content.split(b'\r\n\r\n', 1)[-1]
+                yield headers, content
+
+    def members(self):
+        """
+        Yields (name, content) for all the records of the bundle in order.
+        """
+
+        for headers, content in self.records():
+            name = headers.get(WARC_PATH_HEADER)
+            uri = headers.get('WARC-Target-URI', '')
+            if name is None:
+                name = self.urls.get(uri.split('://', 1)[-1])
+            if name is None and uri.endswith(BOOKKEEPING):
+                name = BOOKKEEPING
+            if name is not None:
+                yield name, content
+
+    def read(self, name: str) -> bytes:
+        for member, content in self.members():
+            if member == name:
+                return content
+        raise IOError(name)
+
+
+def open_backend(location: str):
+    """
+    Chooses the backend of the corpus by its location (directory or archive extension).
+    """
+
+    if os.path.isdir(location):
+        return DirectoryBackend(location)
+    if location.endswith('.zip'):
+        return ZipBackend(location)
+    if location.endswith(('.warc', '.warc.gz')):
+        return WarcBackend(location)
+    if location.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')):
+        return TarBackend(location)
+    return DirectoryBackend(location)
+
+
+class Corpus:
+    """
+    This class is responsible for reading the corpus of pages.
+    Loads the bookkeeping file once and streams the documents in the order of the corpus
+    while the following documents are read ahead by a pool of threads (or by a background
+    thread for the archives that can only be read sequentially), so the indexing never
+    waits for the file I/O.
+
+    The corpus can be a directory (WEBPAGES_RAW), or a zip, tar (gz, bz2, xz) or WARC
+    bundle containing the bookkeeping file and the pages.
+    """
+
+    def __init__(self, location: str = CORPUS_PATH):
+        self.location = location
+        self.backend = open_backend(location)
+        self.dict_path = {}     # Key: path ID, Value: URL
+        self.paths = []         # Path IDs sorted in the order of the corpus
+
+        try:
+            self.dict_path = json.loads(self.backend.read(BOOKKEEPING).decode("utf-8"))
+        except IOError:
+            print("Json file not found in the directory.")
+
+        if isinstance(self.backend, WarcBackend):
+            self.backend.urls = { url: path for path, url in self.dict_path.items() }
+
+        self.paths = sorted(self.dict_path, key = path_sort_key)
+
+
+    def read(self, path: str) -> str:
+        """
+        Reads the content of a single page.
+        """
+
+        return decode(self.backend.read(path))
+
+
+    def stream(self, paths: list = None, workers: int = READ_WORKERS, read_ahead: int = READ_AHEAD):
+        """
+        Generator of (path ID, content) for the paths in the given order (by default
+        all the paths of the corpus). Pages that can't be read are returned as empty
+        content.
+        """
+
+        if paths is None:
+            paths = self.paths
+
+        if self.backend.sequential:
+            yield from self.prefetch(self.stream_sequential(paths), read_ahead)
+            return
+
+        def read(path):
+            try:
+                return self.read(path)
+            except IOError:
+                print("HTML file not found in the directory.")
+                return ""
+
+        iterator = iter(paths)
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            pending = deque((path, pool.submit(read, path)) for path in islice(iterator, read_ahead))
+            while pending:
+                path, future = pending.popleft()
+                following = next(iterator, None)
+                if following is not None:
+                    pending.append((following, pool.submit(read, following)))
+                yield path, future.result()
+
+
+    def stream_sequential(self, paths: list, max_buffered: int = MAX_BUFFERED):
+        """
+        Reads a sequential archive in order and yields the pages in the order of the paths.
+        Pages found before they are needed are kept in a buffer (empty if the archive
+        follows the order of the corpus). The buffer keeps at most max_buffered pages in
+        memory, the following out of order pages are written to a temporary file with the
+        offset of each page, so an archive in any order (e.g. tar czf of WEBPAGES_RAW, with
+        10/ before 2/) is read once without loading it into memory. A page is only reported
+        as missing once the whole archive has been read.
+        """
+
+        buffered = {}
+        spilled = {}        # Key: path ID, Value: (offset, size) in the temporary file
+        # Only the pages still to be yielded are kept (not the bookkeeping file or other files)
+        wanted = set(paths)
+        members = self.backend.members()
+        with tempfile.TemporaryFile() as spill:
+            for path in paths:
+                while path not in buffered and path not in spilled:
+                    member = next(members, None)
+                    if member is None:
+                        break
+                    name, content = member
+                    if name not in wanted or name in buffered or name in spilled:
+                        continue
+                    if len(buffered) < max_buffered or name == path:
+                        buffered[name] = content
+                    else:
+                        spill.seek(0, os.SEEK_END)
+                        spilled[name] = (spill.tell(), len(content))
+                        spill.write(content)
+
+                wanted.discard(path)
+                if path in buffered:
+                    yield path, decode(buffered.pop(path))
+                elif path in spilled:
+                    offset, size = spilled.pop(path)
+                    spill.seek(offset)
+                    yield path, decode(spill.read(size))
+                else:
+                    print("HTML file not found in the directory.")
+                    yield path, ""
+
+
+    def prefetch(self, generator, read_ahead: int):
+        """
+        Runs the generator in a background thread keeping up to read_ahead items ready.
+        """
+
+        items = queue.Queue(maxsize = read_ahead)
+        done = object()
+
+        def produce():
+            try:
+                for item in generator:
+                    items.put(item)
+            finally:
+                items.put(done)
+
+        threading.Thread(target = produce, daemon = True).start()
+        for item in iter(items.get, done):
+            yield item
+
+
+    def pack(self, destination: str):
+        """
+        Writes the corpus to a compressed tar archive (bookkeeping file first, and the
+        pages in the order of the corpus) so it can be streamed sequentially.
+        """
+
+        with tarfile.open(destination, "w:gz") as archive:
+            info = tarfile.TarInfo(BOOKKEEPING)
+            data = json.dumps(self.dict_path).encode("utf-8")
+            info.size = len(data)
+            archive.addfile(info, fileobj = io.BytesIO(data))
+
+            for path in self.paths:
+                try:
+                    data = self.backend.read(path)
+                except IOError:
+                    continue
+                info = tarfile.TarInfo(path)
+                info.size = len(data)
+                archive.addfile(info, fileobj = io.BytesIO(data))
+
+
+if __name__ == "__main__":
+    # Usage: python corpus.py <corpus directory or archive> <destination .tar.gz>
+    Corpus(sys.argv[1]).pack(sys.argv[2])
@@ -0,0 +1,174 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import threading
+import zlib
+from pymongo import MongoClient
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+
+"""
+Data-access layer shared by the Storage, Query and Search modules.
+
+There is a single pooled MongoClient per process (re-created after a fork), and all the
+database and collection names live here. Every setting can be changed with environment
+variables:
+    - GUGOL_MONGO_URI : connection string (mongodb://host:port,host:port/...)
+    - GUGOL_DB_NAME : name of the database
+    - GUGOL_REPLICA_SET : name of the replica set (if any)
+    - GUGOL_POOL_SIZE / GUGOL_MIN_POOL_SIZE : maximum and minimum connections in the pool
+    - GUGOL_CONNECT_TIMEOUT_MS / GUGOL_SOCKET_TIMEOUT_MS / GUGOL_SERVER_TIMEOUT_MS /
+        GUGOL_WAIT_QUEUE_TIMEOUT_MS : timeouts of the client
+    - GUGOL_COMPRESSORS : wire protocol compressors (e.g. "zstd,snappy,zlib")
+    - GUGOL_READ_PREFERENCE : read preference of the query collections (primary,
+        primaryPreferred, secondary, secondaryPreferred, nearest)
+    - GUGOL_MAX_STALENESS : maximum staleness (seconds) of the secondaries used for reads
+    - GUGOL_BATCH_SIZE : number of documents fetched per batch by the cursors
+    - GUGOL_INDEX_LAYOUT : storage layout of the postings of the terms (flat, buckets)
+    - GUGOL_SHARDS : number of document-partitioned shards of the index (1 for no shards)
+"""
+
+# Storage layouts of the postings of the terms
+LAYOUT_FLAT = 'flat'        # One document per term with the whole postings array (test_terms_v6)
+LAYOUT_BUCKETS = 'buckets'  # Term headers (idf, postings count) plus fixed-size buckets of postings
+
+MONGO_URI = os.environ.get('GUGOL_MONGO_URI', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('GUGOL_DB_NAME', 'project3db')
+REPLICA_SET = os.environ.get('GUGOL_REPLICA_SET')
+POOL_SIZE = int(os.environ.get('GUGOL_POOL_SIZE', 20))
+MIN_POOL_SIZE = int(os.environ.get('GUGOL_MIN_POOL_SIZE', 0))
+CONNECT_TIMEOUT_MS = int(os.environ.get('GUGOL_CONNECT_TIMEOUT_MS', 5000))
+SOCKET_TIMEOUT_MS = int(os.environ.get('GUGOL_SOCKET_TIMEOUT_MS', 0)) or None
+SERVER_TIMEOUT_MS = int(os.environ.get('GUGOL_SERVER_TIMEOUT_MS', 10000))
+WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('GUGOL_WAIT_QUEUE_TIMEOUT_MS', 0)) or None
+COMPRESSORS = os.environ.get('GUGOL_COMPRESSORS')
+READ_PREFERENCE = os.environ.get('GUGOL_READ_PREFERENCE', 'primary')
+MAX_STALENESS = int(os.environ.get('GUGOL_MAX_STALENESS', -1))
+BATCH_SIZE = int(os.environ.get('GUGOL_BATCH_SIZE', 1000))
+INDEX_LAYOUT = os.environ.get('GUGOL_INDEX_LAYOUT', LAYOUT_FLAT)
+NUM_SHARDS = int(os.environ.get('GUGOL_SHARDS', 1))
+
+# Names of the collections
+COLLECTIONS = {
+    'terms': 'test_terms_v6',               # Inverted index of the terms (flat layout)
+    'headers': 'test_terms_v6_headers',     # Headers of the terms (bucketed layout)
+    'buckets': 'test_terms_v6_buckets',     # Buckets of postings of the terms (bucketed layout)
+    'bigrams': 'test_bigrams_v6',           # Bi-grams collected by the indexing (see bigrams)
+    'pairs': 'test_pairs_v6',               # Blocks of bi-grams keyed by pairs of term IDs (see bigrams)
+    'docs': 'test_docs_v6',                 # Documents (URL, page rank, title, snippet)
+    'forward': 'test_forward_v6',           # Forward index (compressed text of each document)
+    'impacts': 'test_impacts_v6',           # Quantized impact scores of the terms (see quantize)
+    'meta': 'test_meta_v6',                 # Metadata of the index (version of the index)
+}
+
+# Collections partitioned by document when the index is sharded (each shard has its own
+# copy named <collection>_shard<N>). The metadata of the index is shared by all shards.
+SHARDED_COLLECTIONS = {'terms', 'headers', 'buckets', 'bigrams', 'pairs', 'docs', 'forward', 'impacts'}
+
+READ_PREFERENCES = {
+    'primary': lambda staleness: Primary(),
+    'primaryPreferred': lambda staleness: PrimaryPreferred(max_staleness = staleness),
+    'secondary': lambda staleness: Secondary(max_staleness = staleness),
+    'secondaryPreferred': lambda staleness: SecondaryPreferred(max_staleness = staleness),
+    'nearest': lambda staleness: Nearest(max_staleness = staleness),
+}
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """
+    Returns the pooled MongoClient of the process. The client is created on first use,
+    and again in a child process after a fork (MongoClient is not fork-safe).
+    """
+
+    global _client
+    global _client_pid
+
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                options = {'maxPoolSize': POOL_SIZE,
+                           'minPoolSize': MIN_POOL_SIZE,
+                           'connectTimeoutMS': CONNECT_TIMEOUT_MS,
+                           'socketTimeoutMS': SOCKET_TIMEOUT_MS,
+                           'serverSelectionTimeoutMS': SERVER_TIMEOUT_MS,
+                           'waitQueueTimeoutMS': WAIT_QUEUE_TIMEOUT_MS}
+                if REPLICA_SET:
+                    options['replicaSet'] = REPLICA_SET
+                if COMPRESSORS:
+                    options['compressors'] = COMPRESSORS
+
+                _client = MongoClient(MONGO_URI, **options)
+                _client_pid = os.getpid()
+
+    return _client
+
+
+def set_client(client):
+    """
+    Replaces the client of the process (e.g. with an in-memory stand-in of MongoDB).
+    """
+
+    global _client
+    global _client_pid
+
+    with _lock:
+        _client = client
+        _client_pid = os.getpid()
+
+
+def get_db():
+    """
+    Returns the database of the search engine.
+    """
+
+    return get_client()[DB_NAME]
+
+
+def collection_name(name: str, shard: int = None) -> str:
+    """
+    Returns the name of the collection by its short name (see COLLECTIONS), with the suffix
+    of the shard for the collections partitioned by document.
+    """
+
+    if shard is None or name not in SHARDED_COLLECTIONS:
+        return COLLECTIONS[name]
+    return "{}_shard{}".format(COLLECTIONS[name], shard)
+
+
+def get_collection(name: str, read: bool = False, shard: int = None):
+    """
+    Returns the collection by its short name (see COLLECTIONS), or its partition if the
+    shard is given.
+    Collections used for reads on the query path (read = True) use the configured read
+    preference, so the query load can be routed to the secondaries of a replica set.
+    """
+
+    db = get_db()
+    if read and READ_PREFERENCE != 'primary':
+        staleness = MAX_STALENESS if MAX_STALENESS > 0 else -1
+        return db.get_collection(collection_name(name, shard),
+                                 read_preference = READ_PREFERENCES[READ_PREFERENCE](staleness))
+    return db[collection_name(name, shard)]
+
+
+def shards(num_shards: int = NUM_SHARDS) -> list:
+    """
+    Returns the shards of the index ([None] if the index is not sharded).
+    """
+
+    return [None] if num_shards <= 1 else list(range(num_shards))
+
+
+def shard_of(path: str, num_shards: int = NUM_SHARDS) -> int:
+    """
+    Returns the shard of the document (None if the index is not sharded).
+    Uses a stable hash of the path ID, so every process agrees on the partition.
+    """
+
+    return None if num_shards <= 1 else zlib.crc32(path.encode('utf-8')) % num_shards
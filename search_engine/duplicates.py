@@ -0,0 +1,105 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import random
+import zlib
+from array import array
+
+"""
+Near-duplicate detection of the documents during the indexing (MinHash with LSH banding).
+
+Each document is represented by the set of shingles of its tokens (crc32 of every run of
+SHINGLE_SIZE consecutive tokens). The MinHash signature keeps the minimum of NUM_HASHES
+hash functions over the shingles, and the fraction of equal values of two signatures is an
+estimate of the Jaccard similarity of their shingles.
+
+The signatures are split into BANDS bands: documents that share all the values of at least
+one band are candidates, and only the candidates are compared with their signatures, so the
+cost of each document depends on the number of candidates instead of the number of documents
+indexed before it. A document is a near-duplicate of the first document it matches with an
+estimated similarity of at least THRESHOLD.
+"""
+
+SHINGLE_SIZE = 4            # Number of consecutive tokens of each shingle
+MIN_SHINGLES = 10           # Documents with fewer shingles are not checked (too short to compare)
+NUM_HASHES = 64             # Number of hash functions of the signatures
+BANDS = 16                  # Number of bands of the signatures (NUM_HASHES / BANDS values per band)
+THRESHOLD = 0.9             # Minimum estimated similarity of the near-duplicates
+PRIME = (1 << 31) - 1       # Modulo of the hash functions (signatures fit in 32 bits)
+SEED = 42                   # Seed of the hash functions (the same signatures in every run)
+
+
+def shingles(tokens: list, size: int = SHINGLE_SIZE) -> set:
+    """
+    Returns the set of shingles (crc32 of each run of size consecutive tokens).
+    """
+
+    return { zlib.crc32(' '.join(tokens[idx:idx + size]).encode('utf-8'))
+             for idx in range(len(tokens) - size + 1) }
+
+
+class DuplicateDetector:
+    """
+    This class is responsible for finding the near-duplicates of the documents in the
+    order they are indexed. Only the signatures of the original documents are kept.
+    """
+
+    def __init__(self, num_hashes: int = NUM_HASHES, bands: int = BANDS, threshold: float = THRESHOLD,
+                 seed: int = SEED):
+        generator = random.Random(seed)
+        self.hashes = [(generator.randrange(1, PRIME), generator.randrange(0, PRIME)) for _ in range(num_hashes)]
+        self.rows = num_hashes // bands
+        self.threshold = threshold
+        self.bands = [{} for _ in range(bands)]     # Key: hash of the band, Value: list of paths
+        self.signatures = {}                        # Key: path, Value: signature (array)
+        self.duplicates = 0
+
+
+    def signature(self, tokens: list) -> array:
+        """
+        Calculates the MinHash signature of the tokens (None if the document is too short).
+        """
+
+        values = shingles(tokens)
+        if len(values) < MIN_SHINGLES:
+            return None
+
+        return array('I', [min((a * value + b) % PRIME for value in values) for a, b in self.hashes])
+
+
+    def similarity(self, first: array, second: array) -> float:
+        """
+        Estimated Jaccard similarity of two signatures.
+        """
+
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+    def check(self, path: str, tokens: list) -> str:
+        """
+        Returns the path of the original document if the document is a near-duplicate of
+        a document checked before, otherwise adds the document and returns None.
+        """
+
+        signature = self.signature(tokens)
+        if signature is None:
+            return None
+
+        keys = [hash(tuple(signature[start:start + self.rows])) for start in range(0, len(signature), self.rows)]
+        checked = set()
+        for band, key in zip(self.bands, keys):
+            for candidate in band.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if self.similarity(signature, self.signatures[candidate]) >= self.threshold:
+                    self.duplicates += 1
+                    return candidate
+
+        self.signatures[path] = signature
+        for band, key in zip(self.bands, keys):
+            band.setdefault(key, []).append(path)
+
+        return None
@@ -0,0 +1,161 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import zlib
+from array import array
+
+FORWARD_MAX = 16000         # The maximum number of characters of cleaned text kept per document
+SNIPPET_MAX = 350           # The maximum number of characters for the snippet
+COMPRESSION_LEVEL = 6       # zlib compression level for the stored text and offsets
+
+"""
+Forward index of the cleaned text of each document, used to build query dependent
+snippets at query time.
+
+Each entry stores two zlib compressed blobs:
+    - text : the cleaned text followed by a new line and the space separated
+        lemmatized tokens (the cleaned text never contains new lines)
+    - offsets : array of unsigned ints with the character offset of each token
+        inside the cleaned text
+"""
+
+
+def clean_text(content: str) -> str:
+    """
+    Removes the non-ascii characters and collapses all the whitespace of the content.
+    Truncates the text to FORWARD_MAX characters.
+    """
+
+    if not content:
+        return ""
+    return ' '.join(content.encode("ascii", errors="ignore").decode().split())[:FORWARD_MAX]
+
+
+def compress_document(text: str, tokens: 'List[(lemma, index)]') -> dict:
+    """
+    Compresses the cleaned text and its lemmatized tokens (with the character offset
+    of each token) into an entry of the forward index.
+    """
+
+    terms = ' '.join(token[0] for token in tokens)
+    offsets = array('I', (token[1] for token in tokens))
+
+    return {'text': zlib.compress("{}\n{}".format(text, terms).encode(), COMPRESSION_LEVEL),
+            'offsets': zlib.compress(offsets.tobytes(), COMPRESSION_LEVEL)}
+
+
+def decompress_document(entry: dict) -> '(text, terms, offsets)':
+    """
+    Decompresses an entry of the forward index.
+    Returns the cleaned text, the space separated terms (padded with a space on both
+    sides for searching) and the array of offsets.
+    """
+
+    text, terms = zlib.decompress(entry['text']).decode().split("\n", 1)
+    offsets = array('I')
+    offsets.frombytes(zlib.decompress(entry['offsets']))
+
+    return text, " {} ".format(terms), offsets
+
+
+def find_hits(terms: str, offsets: array, query_terms: set) -> 'List[(offset, term)]':
+    """
+    Finds all the occurrences of the query terms inside the padded string of terms.
+    The string search is done with str.find, and the hits are then walked in order of
+    their position with a running count of the separators before them, so the string of
+    terms is only counted once per document (not once per hit).
+    Returns a list of tuples (character offset in the text, term) sorted by offset.
+    """
+
+    found = []
+    for term in query_terms:
+        needle = " {} ".format(term)
+        idx = terms.find(needle)
+        while idx != -1:
+            found.append((idx, term))
+            idx = terms.find(needle, idx + len(term) + 1)
+    found.sort()
+
+    # The offsets of the tokens grow with their position, so the hits stay sorted by offset
+    hits = []
+    token = 0
+    counted = 1
+    for idx, term in found:
+        token += terms.count(' ', counted, idx + 1)
+        counted = idx + 1
+        hits.append((offsets[token], term))
+
+    return hits
+
+
+def best_window(hits: list, max_len: int) -> '(start, end)':
+    """
+    Sliding window over the hits that finds the span of at most max_len characters
+    containing the largest number of distinct query terms (ties are broken by the
+    total number of hits, and then by the earliest window).
+    Returns the character span (start, end) of the hits inside the best window.
+    """
+
+    best = (0, 0)
+    best_span = (hits[0][0], hits[0][0] + len(hits[0][1]))
+    window = {}
+    left = 0
+
+    for right, (offset, term) in enumerate(hits):
+        window[term] = window.get(term, 0) + 1
+
+        # Shrinks the window until it fits in the maximum length
+        while offset + len(term) - hits[left][0] > max_len:
+            left_term = hits[left][1]
+            window[left_term] -= 1
+            if window[left_term] == 0:
+                del window[left_term]
+            left += 1
+
+        score = (len(window), right - left + 1)
+        if score > best:
+            best = score
+            best_span = (hits[left][0], offset + len(term))
+
+    return best_span
+
+
+def query_snippet(entry: dict, query_terms: 'Iterable[str]', max_len: int = SNIPPET_MAX) -> str:
+    """
+    Builds the snippet of a document for the query terms by choosing the window
+    of the cleaned text that contains the most query terms.
+    The window is centered inside the snippet and snapped to whole words.
+    Returns an empty string if none of the query terms appear in the document.
+    """
+
+    text, terms, offsets = decompress_document(entry)
+    hits = find_hits(terms, offsets, set(query_terms))
+    if not hits:
+        return ""
+
+    span_start, span_end = best_window(hits, max_len)
+
+    # Centers the window of hits inside the snippet
+    start = max(0, span_start - (max_len - (span_end - span_start)) // 2)
+    end = min(len(text), start + max_len)
+    start = max(0, end - max_len)
+
+    # Snaps the beginning and end of the snippet to whole words
+    if start > 0:
+        space = text.find(' ', start, span_start)
+        if space != -1:
+            start = space + 1
+    if end < len(text):
+        space = text.rfind(' ', span_end, end)
+        if space != -1:
+            end = space
+
+    snippet = text[start:end]
+    if start > 0:
+        snippet = "... " + snippet
+    if end < len(text):
+        snippet = snippet + " ..."
+
+    return snippet
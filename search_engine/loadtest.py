@@ -0,0 +1,311 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import json
+import random
+import logging
+import argparse
+import threading
+from time import perf_counter, time
+from collections import Counter
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+logger = logging.getLogger(__name__)
+
+"""
+Load generator of the search API (/api) with a replayed or synthetic query log.
+
+The searches are grouped in sessions that behave like the front-end: a search starts at
+start=0, and the following pages of the same search (start=20, 40, ...) are requested by the
+same client after the first one, so the cache of the last results of the API is exercised
+the same way. A query log has one search per line, optionally followed by a tab and the start
+of the page to replay it exactly. Without a log the searches are drawn from the vocabulary of
+the index: the terms and the searches follow a Zipf distribution, so popular searches repeat.
+
+Each of the concurrent clients sends its next request as soon as it gets a response. The
+throughput, the latency percentiles (p50, p95, p99) of all the requests, of the first pages
+and of the following pages, and the errors by type are written to a JSON report that can be
+compared against a previous report:
+
+    python loadtest.py --sessions 2000 --concurrency 8 --output baseline.json
+    python loadtest.py --sessions 2000 --concurrency 8 --baseline baseline.json
+"""
+
+API_URL = 'http://127.0.0.1:5000/api'   # Search endpoint (the one used by the front-end)
+REPORT_PATH = 'loadtest_report.json'    # File where the report of the load test is written
+PAGE_SIZE = 20              # Results per page of the front-end (start=0, 20, 40, ...)
+NEXT_PAGE = 0.3             # Probability of requesting the following page of a search
+MAX_PAGES = 10              # Maximum number of pages of a search
+VOCABULARY = 5000           # Number of most frequent terms of the index used by the synthetic searches
+DISTINCT_SEARCHES = 10000   # Number of distinct synthetic searches
+MAX_TERMS = 3               # Maximum number of terms of a synthetic search
+SEED = 42                   # Seed of the synthetic searches and of the paging
+TIMEOUT = 30                # Seconds before a request fails
+PERCENTILES = (50, 95, 99)
+
+
+def zipf_weights(size: int) -> list:
+    """
+    Cumulative weights of a Zipf distribution (s = 1) over size ranks.
+    """
+
+    total = 0
+    weights = []
+    for rank in range(1, size + 1):
+        total += 1 / rank
+        weights.append(total)
+    return weights
+
+
+def index_vocabulary(size: int = VOCABULARY) -> list:
+    """
+    Returns the terms of the index (of all the shards) in descending order of the number
+    of documents, up to size terms.
+    """
+
+    # Imported here, only the synthetic searches need the index
+    from query import Query
+    from database import shards
+
+    counts = Counter()
+    for shard in shards():
+        for term, count in Query(shard = shard).iter_postings_count():
+            counts[term] += count
+    return [term for term, _ in counts.most_common(size)]
+
+
+def synthetic_sessions(vocabulary: list, sessions: int, seed: int = SEED) -> list:
+    """
+    Generates the sessions of the synthetic searches: the distinct searches are made of 1 to
+    MAX_TERMS Zipf-distributed terms, and each session is a Zipf-distributed search with the
+    starts of its pages.
+    """
+
+    generator = random.Random(seed)
+    term_weights = zipf_weights(len(vocabulary))
+    searches = list({ ' '.join(generator.choices(vocabulary, cum_weights = term_weights,
+                                                 k = generator.randint(1, MAX_TERMS)))
+                      for _ in range(DISTINCT_SEARCHES) })
+    searches.sort()
+    generator.shuffle(searches)
+    search_weights = zipf_weights(len(searches))
+
+    return [paged_session(generator, search)
+            for search in generator.choices(searches, cum_weights = search_weights, k = sessions)]
+
+
+def paged_session(generator: random.Random, search: str) -> list:
+    """
+    Returns the (search, start) requests of a session: the first page and, with probability
+    NEXT_PAGE each, the following ones.
+    """
+
+    requests = [(search, 0)]
+    while len(requests) < MAX_PAGES and generator.random() < NEXT_PAGE:
+        requests.append((search, len(requests) * PAGE_SIZE))
+    return requests
+
+
+def read_log(path: str, seed: int = SEED) -> list:
+    """
+    Reads the sessions of a query log. Lines with the start of the page are replayed as a
+    single request, the rest get the paging of the front-end.
+    """
+
+    generator = random.Random(seed)
+    sessions = []
+    try:
+        with open(path, 'r', encoding = 'utf-8') as file:
+            for line in file:
+                search, _, start = line.rstrip('\n').partition('\t')
+                if not search.strip():
+                    continue
+                if start.strip().isdigit():
+                    sessions.append([(search, int(start))])
+                else:
+                    sessions.append(paged_session(generator, search))
+    except IOError:
+        print("Query log not found.")
+
+    return sessions
+
+
+def percentile(values: list, rank: float) -> float:
+    """
+    Nearest-rank percentile of the sorted values (milliseconds, None if there are no values).
+    """
+
+    if not values:
+        return None
+    idx = max(0, min(len(values) - 1, int(round(rank / 100 * len(values) + 0.5)) - 1))
+    return round(values[idx] * 1000, 2)
+
+
+def latency_summary(latencies: list) -> dict:
+    values = sorted(latencies)
+    summary = { 'requests': len(values) }
+    summary.update({ 'p{}_ms'.format(rank): percentile(values, rank) for rank in PERCENTILES })
+    summary['mean_ms'] = round(sum(values) / len(values) * 1000, 2) if values else None
+    summary['max_ms'] = round(values[-1] * 1000, 2) if values else None
+    return summary
+
+
+class LoadTest:
+    """
+    This class is responsible for sending the sessions to the API from concurrent clients
+    and recording the latency and the result of every request.
+    """
+
+    def __init__(self, url: str = API_URL, concurrency: int = 8, params: dict = None, timeout: float = TIMEOUT):
+        self.url = url
+        self.concurrency = concurrency
+        self.params = params or {}
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.records = []       # (first page, latency in seconds, error or None, server query speed)
+
+
+    def request(self, search: str, start: int) -> tuple:
+        """
+        Sends a single search. Returns the (latency, error, query speed reported by the API).
+        """
+
+        url = '{}?{}'.format(self.url, urlencode(dict(self.params, query = search, start = start)))
+        begin = perf_counter()
+        try:
+            with urlopen(url, timeout = self.timeout) as response:
+                body = json.loads(response.read().decode('utf-8'))
+            return perf_counter() - begin, None, body.get('query_speed')
+        except HTTPError as e:
+            return perf_counter() - begin, 'http_{}'.format(e.code), None
+        except (OSError, ValueError) as e:
+            return perf_counter() - begin, type(e).__name__, None
+
+
+    def client(self, sessions, deadline: float):
+        for session in sessions:
+            for search, start in session:
+                if deadline and perf_counter() > deadline:
+                    return
+                latency, error, query_speed = self.request(search, start)
+                with self.lock:
+                    self.records.append((start == 0, latency, error, query_speed))
+
+
+    def run(self, sessions: list, duration: float = None) -> dict:
+        """
+        Sends all the sessions (or until the duration in seconds has passed) and returns
+        the report of the run.
+        """
+
+        pending = iter(sessions)
+        lock = threading.Lock()
+
+        def next_sessions():
+            # Each client takes the next session of the shared list
+            while True:
+                with lock:
+                    session = next(pending, None)
+                if session is None:
+                    return
+                yield session
+
+        begin = perf_counter()
+        deadline = begin + duration if duration else None
+        clients = [threading.Thread(target = self.client, args = (next_sessions(), deadline))
+                   for _ in range(self.concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = perf_counter() - begin
+
+        return self.report(elapsed)
+
+
+    def report(self, elapsed: float) -> dict:
+        succeeded = [record for record in self.records if record[2] is None]
+        errors = Counter(record[2] for record in self.records if record[2] is not None)
+        speeds = sorted(record[3] for record in succeeded if isinstance(record[3], (int, float)))
+
+        return {'requests': len(self.records),
+                'seconds': round(elapsed, 3),
+                'throughput': round(len(self.records) / elapsed, 2) if elapsed else 0,
+                'error_rate': round(sum(errors.values()) / len(self.records), 4) if self.records else 0,
+                'errors': dict(errors),
+                'latency': latency_summary([record[1] for record in succeeded]),
+                'first_page': latency_summary([record[1] for record in succeeded if record[0]]),
+                'next_pages': latency_summary([record[1] for record in succeeded if not record[0]]),
+                'query_speed_p50': speeds[len(speeds) // 2] if speeds else None}
+
+
+def compare(report: dict, baseline: dict):
+    """
+    Logs the change of the throughput, the latency percentiles and the error rate against
+    the baseline report.
+    """
+
+    def change(before, after):
+        return " ({:+.1f}%)".format((after / before - 1) * 100) if before and after is not None else ""
+
+    logger.info("throughput ... {} -> {} req/sec{}".format(baseline.get('throughput'), report['throughput'],
+                                                           change(baseline.get('throughput'), report['throughput'])))
+    for rank in PERCENTILES:
+        key = 'p{}_ms'.format(rank)
+        before = baseline.get('latency', {}).get(key)
+        logger.info("{} ... {} -> {} ms{}".format(key, before, report['latency'][key], change(before, report['latency'][key])))
+    logger.info("error rate ... {} -> {}".format(baseline.get('error_rate'), report['error_rate']))
+
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description = "Replays a query log (or Zipf-distributed searches) against the search API.")
+    parser.add_argument('--url', default = API_URL, help = "URL of the search endpoint")
+    parser.add_argument('--log', help = "Query log (one search per line, optionally followed by a tab and the start)")
+    parser.add_argument('--sessions', type = int, default = 1000, help = "Number of synthetic search sessions")
+    parser.add_argument('--vocabulary', type = int, default = VOCABULARY,
+                        help = "Number of most frequent terms of the index used by the synthetic searches")
+    parser.add_argument('--concurrency', type = int, default = 8, help = "Number of concurrent clients")
+    parser.add_argument('--duration', type = float, help = "Stops after the number of seconds")
+    parser.add_argument('--mode', help = "Matching mode of the searches (or, and, auto)")
+    parser.add_argument('--scorer', help = "Ranking model of the searches (cosine, bm25, bm25f)")
+    parser.add_argument('--seed', type = int, default = SEED, help = "Seed of the synthetic searches and the paging")
+    parser.add_argument('--timeout', type = float, default = TIMEOUT, help = "Seconds before a request fails")
+    parser.add_argument('--output', default = REPORT_PATH, help = "File where the report is written")
+    parser.add_argument('--baseline', help = "Report of a previous run to compare with")
+    args = parser.parse_args()
+
+    if args.log:
+        sessions = read_log(args.log, args.seed)
+    else:
+        sessions = synthetic_sessions(index_vocabulary(args.vocabulary), args.sessions, args.seed)
+    logger.info("{} sessions, {} requests".format(len(sessions), sum(len(session) for session in sessions)))
+
+    params = { key: value for key, value in (('mode', args.mode), ('scorer', args.scorer)) if value }
+    started = time()
+    report = LoadTest(args.url, args.concurrency, params, args.timeout).run(sessions, args.duration)
+    report.update({'started': started, 'url': args.url, 'log': args.log, 'concurrency': args.concurrency,
+                   'params': params, 'seed': args.seed, 'sessions': len(sessions)})
+    logger.info("{} requests in {}s ... {} req/sec ... p50 {} ms, p95 {} ms, p99 {} ms ... errors {}".format(
+        report['requests'], report['seconds'], report['throughput'], report['latency']['p50_ms'],
+        report['latency']['p95_ms'], report['latency']['p99_ms'], report['errors']))
+
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r', encoding = 'utf-8') as file:
+                compare(report, json.load(file))
+        except IOError:
+            print("Baseline report not found.")
+
+    try:
+        with open(args.output, 'w', encoding = 'utf-8') as file:
+            json.dump(report, file, indent = 2)
+        logger.info("Load test report written to {}".format(args.output))
+    except IOError:
+        print("Error writing the load test report.")
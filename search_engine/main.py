@@ -4,73 +4,103 @@
 # -----------------------------------------------------------
 
 import sys
+import argparse
 import string
 import json
 import logging
 import time
 import math
 from time import perf_counter
-from pymongo import MongoClient
 from pprint import pprint
+from collections import defaultdict
 from preprocessing import Preprocessing
 from query import Query
-from storage import Storage
+from storage import Storage, BUCKET_SIZE, ORDER_DOC, ORDER_SCORE
+from migrate_buckets import migrate
+from database import LAYOUT_FLAT, LAYOUT_BUCKETS, INDEX_LAYOUT, NUM_SHARDS, shards, shard_of
+import forward_index
+from telemetry import IndexTelemetry
+from corpus import Corpus
+import snapshot
+import bigrams
+from weighting import WEIGHT_TITLE, field_frequencies, weighted_frequency
+from scoring import LENGTH_FIELDS, field_lengths
+from duplicates import DuplicateDetector
+from profiling import Profiler
 logger = logging.getLogger(__name__)
 
 SNIPPET_MAX = 350 # The maximum number of characters for the snippet
 TITLE_MAX = 60 # The maximum number of characters for the title
-WEIGHT_TITLE = 6 # Weight for title token frequency
-WEIGHT_H1H2 = 3 # Weight for h1h2 token frequency
-WEIGHT_H3H6 = 2 # Weight for h3h6 token frequency
-WEIGHT_STRONG = 1 # Weight for strong token frequency
-WEIGHT_ANCHOR = 1 # Weight for anchor token frequency
 
+corpus = None
 paths_list = []
 dict_path = {}
 
 
 def read_json() -> 'List: file paths':
     """
-    Gets the file paths to each document from the json file.
+    Gets the file paths to each document from the json file through the corpus reader.
     Starting point to iterate through the entire corpus.
     """
 
+    global corpus
     global paths_list
     global dict_path
 
-    try:
-        with open("WEBPAGES_RAW/bookkeeping.json", "r", encoding="utf-8") as file:
-            dict_path = json.load(file)
-            
-        for item in dict_path:
-            paths_list.append(item)
-
-    except IOError:
-        print("Json file not found in the directory.")
-    
-    # Sorts the listing as the json data is not correctly ordered
-    paths_list = sorted(paths_list, key=lambda d: tuple(map(int, d.split('/'))))
+    # The corpus reader sorts the listing as the json data is not correctly ordered
+    corpus = Corpus()
+    dict_path = corpus.dict_path
+    paths_list = corpus.paths
     
 
 
-def preprocess_all(p: Preprocessing(), s: Storage()):
+def storage_of(storages: list, path: str) -> Storage:
+    """
+    Returns the storage of the shard of the document (the only storage if the index
+    is not sharded).
+    """
+
+    if len(storages) == 1:
+        return storages[0]
+    return storages[shard_of(path, len(storages))]
+
+
+def phase_name(name: str, q: Query) -> str:
+    """
+    Returns the name of the phase of the telemetry for the shard of the query.
+    """
+
+    return name if q.shard is None else "{}_shard{}".format(name, q.shard)
+
+
+def preprocess_all(p: Preprocessing(), storages: list, t: IndexTelemetry, detector: DuplicateDetector = None,
+                   profiler: Profiler = None):
     """
     This method retrieves all the content, proprocess them, and insert the
-    relevant data to the database.
+    relevant data to the database (to the shard of each document if the index is sharded).
+    If the duplicate detector is given, the near-duplicates of the documents processed
+    before are only recorded in the collection of documents (not indexed).
+    If the profiler is given, 1 in every profiler.every documents is profiled.
+    The time of each sub-step is recorded in the indexing telemetry.
     """
 
-    corpus_count = 0
+    t.start_phase('preprocess', len(paths_list), 'docs')
 
-    # Loops through the entire list of paths (corpus)
-    while corpus_count < len(paths_list):
-        path = paths_list[corpus_count]
+    # Loops through the entire list of paths (corpus), the content of the following
+    # documents is read ahead by the corpus reader
+    for idx, (path, raw) in enumerate(corpus.stream(paths_list)):
+        doc_start = perf_counter()
+        if profiler is not None and idx % profiler.every == 0:
+            profiler.start(path)
+        s = storage_of(storages, path)
 
         # Fetches the content doing HTML validation, fixing broken tags, and organizing the
         # text into different categories as seen in the Preprocessing module.
-        content = p.fetch_content(path)
+        content = p.fetch_content(path, raw)
         title = content.get('title')
         body = content.get('body')
         paragraph = content.get('paragraph')
+        stage = perf_counter()
 
         # Insert title and snippet to document collection in MongoDB
         if title is None and body is not None and paragraph is not None:
@@ -88,13 +118,29 @@ def preprocess_all(p: Preprocessing(), s: Storage()):
         elif title is not None and paragraph is None and body is None:
             s.insert_title_snippet(path,
                             ' '.join(title.encode("ascii", errors="ignore").decode().split())[:TITLE_MAX],'')                    
+        stage = t.step('mongo_write', stage)
 
 
         # Tokenization and Lemmatization with word frequency
         title_tokens = p.tokenize_span(title)
-        title_freq = p.word_frequency(title_tokens)
         body_tokens = p.tokenize_span(body)
+        stage = t.step('tokenize', stage)
+
+        # Near-duplicates are not indexed, they are recorded as aliases of the original document
+        if detector is not None:
+            original = detector.check(path, [token for token, _ in title_tokens + body_tokens])
+            stage = t.step('duplicates', stage)
+            if original is not None:
+                s.insert_duplicate(path, original)
+                storage_of(storages, original).insert_alias(original, path)
+                t.step('mongo_write', stage)
+                if profiler is not None:
+                    profiler.stop()
+                t.item_done(path, doc_start)
+                continue
+        title_freq = p.word_frequency(title_tokens)
         body_freq = p.word_frequency(body_tokens)
+        stage = t.step('lemmatize', stage)
       
         # Fix the title positional index offset
         if title_tokens:
@@ -105,52 +151,32 @@ def preprocess_all(p: Preprocessing(), s: Storage()):
                     pos += title_offset
 
         # Weighted frequency
-        h1h2_freq = p.word_frequency(p.tokenize(content.get('h1h2')))
-        h3h6_freq = p.word_frequency(p.tokenize(content.get('h3h6')))
-        strong_freq = p.word_frequency(p.tokenize(content.get('strong')))
-        anchor_freq = p.word_frequency(p.tokenize(content.get('anchor')))
+        h1h2_tokens = p.tokenize(content.get('h1h2'))
+        h3h6_tokens = p.tokenize(content.get('h3h6'))
+        strong_tokens = p.tokenize(content.get('strong'))
+        anchor_tokens = p.tokenize(content.get('anchor'))
+        stage = t.step('tokenize', stage)
+        h1h2_freq = p.word_frequency(h1h2_tokens)
+        h3h6_freq = p.word_frequency(h3h6_tokens)
+        strong_freq = p.word_frequency(strong_tokens)
+        anchor_freq = p.word_frequency(anchor_tokens)
+        stage = t.step('lemmatize', stage)
 
-        # Weighting the diffrent types of text
-        weighted_freq = {}
-
-        for key, value in title_freq.items():
-            if key not in weighted_freq:
-                weighted_freq[key] = value[0]
-            else:
-                weighted_freq[key] += value[0] * WEIGHT_TITLE
-
-        for key, value in body_freq.items():
-            if key not in weighted_freq:
-                weighted_freq[key] = value[0]
-            else:
-                weighted_freq[key] += value[0]
-
-        for key, value in h1h2_freq.items():
-            if key not in weighted_freq:
-                weighted_freq[key] = value * WEIGHT_H1H2
-            else:
-                weighted_freq[key] += value * WEIGHT_H1H2
-
-        for key, value in h3h6_freq.items():
-            if key not in weighted_freq:
-                weighted_freq[key] = value * WEIGHT_H3H6
-            else:
-                weighted_freq[key] += value * WEIGHT_H3H6
+        natural_freq = p.word_frequency(title_tokens + body_tokens)
 
-        for key, value in strong_freq.items():
-            if key not in weighted_freq:
-                weighted_freq[key] = value * WEIGHT_STRONG
-            else:
-                weighted_freq[key] += value * WEIGHT_STRONG
+        # Weighting the diffrent types of text (the frequency of each field is stored
+        # in the postings, so the weights can be changed later, see weighting.py)
+        fields = field_frequencies(natural_freq, {'title': title_freq, 'h1h2': h1h2_freq, 'h3h6': h3h6_freq,
+                                                  'strong': strong_freq, 'anchor': anchor_freq})
+        weighted_freq = { key: weighted_frequency(value[0], fields.get(key)) for key, value in natural_freq.items() }
+        stage = t.step('weight', stage)
 
-        for key, value in anchor_freq.items():
-            if key not in weighted_freq:
-                weighted_freq[key] = value * WEIGHT_ANCHOR
-            else:
-                weighted_freq[key] += value * WEIGHT_ANCHOR
+        # Lengths of the document and its fields in terms (BM25 scorers)
+        s.insert_lengths(path, content.get('len_doc'), field_lengths({'title': title_tokens, 'body': body_tokens,
+                                                                      'h1h2': h1h2_tokens, 'h3h6': h3h6_tokens,
+                                                                      'strong': strong_tokens, 'anchor': anchor_tokens}))
+        stage = t.step('mongo_write', stage)
 
-        natural_freq = p.word_frequency(title_tokens + body_tokens)
-        
         # Bi-grams / Bi-words
         title_bigram = p.bigram_freq(content.get('title'))
         body_bigram = p.bigram_freq(content.get('body'))
@@ -161,36 +187,99 @@ def preprocess_all(p: Preprocessing(), s: Storage()):
                 body_bigram[key] += WEIGHT_TITLE
             else:
                 body_bigram[key] = WEIGHT_TITLE
+        stage = t.step('bigram', stage)
 
         # Inserting inverted index data to MongoDB
         if natural_freq and weighted_freq:
-            s.insert_posting(path, natural_freq, weighted_freq)
+            s.insert_posting(path, natural_freq, weighted_freq, fields)
 
-        # Inserting bigram to separate index collection
+        # Inserting bigram to separate index collection (compacted later into pairs of term IDs)
         if body_bigram:
-            s.insert_posting_bigram(path, body_bigram)
+            s.insert_posting_bigram(path, { bigrams.bigram_key(pair): value for pair, value in body_bigram.items() })
+        stage = t.step('mongo_write', stage)
+
+        # Forward index of the cleaned body for query dependent snippets
+        clean_body = forward_index.clean_text(body)
+        if clean_body:
+            forward_tokens = p.lemmatize_span(p.tokenize_span(clean_body))
+            stage = t.step('forward_index', stage)
+            s.insert_forward(path, forward_index.compress_document(clean_body, forward_tokens))
+            t.step('mongo_write', stage)
 
-        corpus_count = corpus_count + 1
-        logger.info("Processed Path {} ... Fetched: {} ... Percentage: {}%".format(
-            path, corpus_count, round((corpus_count/len(paths_list)) * 100 , 2)))
+        if profiler is not None:
+            profiler.stop()
+        t.item_done(path, doc_start)
 
 
 
-def calculate_scores(s: Storage(), q: Query()):
+def global_statistics(queries: list) -> '(number of documents, Dict{term: postings count})':
+    """
+    This method adds up the number of documents and the postings count of each term
+    of all the shards, so the IDF is the same in every shard (and the same as an index
+    without shards).
+    """
+
+    count_unique_paths = 0
+    dict_postings_count = defaultdict(int)
+    for q in queries:
+        count_unique_paths += q.doc_count()
+        for term, count in q.iter_postings_count():
+            dict_postings_count[term] += count
+
+    return count_unique_paths, dict_postings_count
+
+
+def global_statistics_bigrams(queries: list) -> '(number of documents, Dict{bigram: postings count})':
+    """
+    This method adds up the number of documents and the postings count of each bi-gram
+    of all the shards.
+    """
+
+    count_unique_paths = 0
+    dict_postings_count = defaultdict(int)
+    for q in queries:
+        count_unique_paths += q.bigram_doc_count()
+        for term, count in q.iter_postings_bigrams_count():
+            dict_postings_count[term] += count
+
+    return count_unique_paths, dict_postings_count
+
+
+def length_statistics(s: Storage(), queries: list, documents: int):
+    """
+    This method calculates the average length of the documents and of their fields of all
+    the shards and inserts them with the number of documents of the index (BM25 scorers).
+    """
+
+    totals = [total for total in (q.get_length_totals(LENGTH_FIELDS) for q in queries) if total]
+    count = sum(total['documents'] for total in totals)
+    if not count:
+        return
+
+    avg_length = sum(total['length'] for total in totals) / count
+    avg_field_lengths = [sum(values) / count for values in zip(*[total['field_lengths'] for total in totals])]
+    s.insert_length_statistics(documents, avg_length, avg_field_lengths)
+
+
+def calculate_scores(s: Storage(), q: Query(), t: IndexTelemetry, statistics: tuple = None):
     """
     This method calculates all the terms scoring for the TF, IDF, and TF-IDF.
     Additionally, it will insert all the scores to the MongoDB collection of terms.
+    If the index is sharded, the statistics (number of documents and postings count of
+    the terms) are the global ones of all the shards.
+    The postings are streamed one term at a time (see Query.iter_weighted_freq), so the
+    memory doesn't depend on the size of the collection.
     """
 
-    list_terms = q.get_all_terms()
-    dict_postings_count = q.postings_count()
-    count_unique_paths = q.doc_count()
-    counter = 0
+    count_unique_paths, dict_postings_count = statistics or global_statistics([q])
+    # Number of terms of all the shards (upper bound of the terms of the shard)
+    t.start_phase(phase_name('scores', q), len(dict_postings_count), 'terms')
 
     # Calculate Term Frequency and IDF for all terms and insert to the DB
-    for term in list_terms:
-        # Retrieve the weighted frequencies from the database
-        list_weighted_freq = q.get_weighted_freq(term)
+    term_start = perf_counter()
+    # Retrieve the weighted frequencies from the database
+    for term, list_weighted_freq in q.iter_weighted_freq():
+        stage = t.step('mongo_read', term_start)
         # Calculate Inverted Document Frequency for all terms and insert IDF to database
         idf = math.log10( count_unique_paths / dict_postings_count.get(term))
 
@@ -201,67 +290,98 @@ def calculate_scores(s: Storage(), q: Query()):
             if path_dict.get("weighted_freq") != 0:
                 tf = 1 + math.log10( path_dict.get("weighted_freq") )
             scores[path_dict.get("path_id")] = { "tf" : tf, "tf_idf" : (tf * idf) }
+        stage = t.step('score', stage)
         
-        s.insert_scores(term, idf, dict_postings_count.get(term), scores)
-        counter = counter + 1
-        logger.info("Processed Term {} ... Fetched: {} ... Percentage: {}%".format(
-        term, counter, round((counter/len(list_terms)) * 100 , 2)))
+        # The postings count of the header is the one of the shard (the IDF is global)
+        s.insert_scores(term, idf, len(list_weighted_freq), scores)
+        t.step('mongo_write', stage)
+        t.item_done(term, term_start)
+        term_start = perf_counter()
 
 
 
-def calculate_scores_bigrams(s: Storage(), q: Query()):
+def create_database_docs(storages: list):
+    """
+    This method will insert all the documents/pages (With Path ID and respective URLs)
+    to the MongoDB collection of documents (of the shard of each document).
     """
-    This method calculates all the bi-grams scoring for the TF, IDF, and TF-IDF.
-    Additionally, it will insert all the scores to the MongoDB collection of bi-grams.
-    """    
-
-    # Calculate Term Frequency and IDF for all bigrams and insert to the DB
-    list_bigrams = q.get_all_bigrams()
-    dict_postings_bigrams_count = q.postings_bigrams_count()
-    count_unique_paths_bigrams = q.bigram_doc_count()
-    counter = 0
-
-    for term in list_bigrams:
-        # Retrieve the weighted frequencies from the database
-        list_bigram_freq = q.get_bigram_freq(term)
-        # Calculate Inverted Document Frequency for all bigrams and insert IDF to database
-        idf = math.log10(count_unique_paths_bigrams / dict_postings_bigrams_count.get(term))
-        
-        scores = {}
-        for path_dict in list_bigram_freq:
-            # Checks if weighted frequency is 0, because log(0) = 1
-            tf = 0
-            if path_dict.get("bigram_wt_freq") != 0:
-                tf = 1 + math.log10( path_dict.get("bigram_wt_freq"))
-            scores[path_dict.get("path_id")] = { "tf" : tf, "tf_idf" : (tf * idf) }
 
-        s.insert_scores_bigrams(term, idf, dict_postings_bigrams_count.get(term), scores)
-        counter = counter + 1       
-        logger.info("Processed Bi-gram {} ... Fetched: {} ... Percentage: {}%".format(
-        term, counter, round((counter/len(list_bigrams)) * 100 , 2)))
+    partitions = defaultdict(dict)
+    for path_id, url in dict_path.items():
+        partitions[storage_of(storages, path_id)][path_id] = url
+    for s, partition in partitions.items():
+        s.insert_documents(partition)
 
 
-def create_database_docs(s: Storage(), q: Query()):
+def create_snapshot(storages: list, queries: list):
     """
-    This method will insert all the documents/pages (With Path ID and respective URLs)
-    to the MongoDB collection of documents.
+    This method writes a new version of the index and the snapshot of the search caches
+    (term dictionary and documents) of each shard, so the API can start without scanning MongoDB.
     """
 
-    s.insert_documents(dict_path)
+    index_version = storages[0].bump_index_version()
+    for q in queries:
+        cached_dict = defaultdict(dict)
+        for term in q.iter_dict_without_postings():
+            cached_dict[term['term']] = {'idf': term.get('idf'), 'postings_count': term.get('postings_count')}
+            if term.get('order'):
+                cached_dict[term['term']]['order'] = term['order']
+        snapshot.save(index_version, cached_dict, q.get_docs(), snapshot.shard_path(snapshot.SNAPSHOT_PATH, q.shard),
+                      q.layout)
     
 
 if __name__ == "__main__":
     logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
                         level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description = "Creates the inverted indexes and calculates all the scores.")
+    parser.add_argument('--layout', choices = [LAYOUT_FLAT, LAYOUT_BUCKETS], default = INDEX_LAYOUT,
+                        help = "Storage layout of the postings of the terms")
+    parser.add_argument('--shards', type = int, default = NUM_SHARDS,
+                        help = "Number of document-partitioned shards of the index")
+    parser.add_argument('--order', choices = [ORDER_DOC, ORDER_SCORE], default = ORDER_DOC,
+                        help = "Order of the postings of the terms (score: impact-ordered buckets, "
+                               "used by the early termination of the queries with the buckets layout)")
+    parser.add_argument('--keep-duplicates', action = 'store_true',
+                        help = "Indexes the near-duplicate documents instead of recording them as aliases")
+    parser.add_argument('--bigram-min-df', type = int, default = bigrams.MIN_DF,
+                        help = "Minimum number of documents of the stored bi-grams")
+    parser.add_argument('--keep-bigrams', action = 'store_true',
+                        help = "Keeps the collection of the bi-grams collected by the indexing after the compaction")
+    parser.add_argument('--profile', type = int, metavar = 'N',
+                        help = "Profiles 1 in N documents of the preprocessing (cProfile and tracemalloc, see profiling.py)")
+    args = parser.parse_args()
+
     read_json()
 
-    p = Preprocessing()
-    s = Storage()
-    q = Query()
+    t = IndexTelemetry()
+    p = Preprocessing(t)
+    storages = [Storage(args.layout, shard) for shard in shards(args.shards)]
+    queries = [Query(args.layout, shard = shard) for shard in shards(args.shards)]
 
     # Correct order to create inverted index and calculate all scores
-    create_database_docs(s, q)
-    preprocess_all(p, s)
-    calculate_scores(s, q)
-    calculate_scores_bigrams(s, q)
+    create_database_docs(storages)
+    detector = None if args.keep_duplicates else DuplicateDetector()
+    profiler = Profiler('preprocess', args.profile) if args.profile else None
+    preprocess_all(p, storages, t, detector, profiler)
+    if profiler is not None:
+        profiler.dump()
+    if detector is not None:
+        logger.info("Near-duplicates found: {}".format(detector.duplicates))
+    statistics = global_statistics(queries)
+    for s, q in zip(storages, queries):
+        calculate_scores(s, q, t, statistics)
+    length_statistics(storages[0], queries, statistics[0])
+    # Compacts the bi-grams into blocks of pairs of term IDs (only the bi-grams in --bigram-min-df documents)
+    statistics = global_statistics_bigrams(queries)
+    for s, q in zip(storages, queries):
+        bigrams.build(q, s, statistics, args.bigram_min_df)
+        if not args.keep_bigrams:
+            s.drop_bigrams()
+    # Re-organizes the buckets of postings by descending TF-IDF (impact order)
+    if args.layout == LAYOUT_BUCKETS and args.order == ORDER_SCORE:
+        for s, q in zip(storages, queries):
+            migrate(q, s, ORDER_SCORE, BUCKET_SIZE)
+    create_snapshot(storages, queries)
+    t.write_report()
     # Finally calculate the page rank by running the pagerank.py module
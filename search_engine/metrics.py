@@ -0,0 +1,145 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# Upper bounds (in seconds) of the buckets for the latency histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the buckets for the histograms of postings and candidate counts
+COUNT_BUCKETS = (10, 100, 1000, 10000, 50000, 100000, 500000, 1000000)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket upper bounds (Prometheus style).
+    The last slot of the counts is the +Inf bucket.
+    """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    This class is responsible for aggregating the telemetry of the search path.
+    Keeps latency histograms for each stage of a query, histograms of postings counts,
+    and plain counters. Everything can be rendered in the Prometheus text format
+    for the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}    # Key: (metric name, label value), Value: Histogram
+        self.counters = {}      # Key: metric name, Value: number (counters and gauges)
+        self.descriptions = {}  # Key: metric name, Value: (type, help text, label name)
+
+        self.describe('gugol_query_stage_seconds', 'histogram',
+                      'Latency of each stage of a search query in seconds.', 'stage')
+        self.describe('gugol_query_postings', 'histogram',
+                      'Number of postings of the query terms (sum of postings counts).')
+        self.describe('gugol_query_candidates', 'histogram',
+                      'Number of candidate documents scored for a query.')
+        self.describe('gugol_queries_total', 'counter', 'Number of search queries processed.')
+        self.describe('gugol_postings_cache_hits_total', 'counter', 'Lookups of postings found in the cache.')
+        self.describe('gugol_postings_cache_misses_total', 'counter', 'Lookups of postings not found in the cache.')
+        self.describe('gugol_postings_cache_evictions_total', 'counter', 'Terms evicted from the postings cache.')
+        self.describe('gugol_postings_cache_postings', 'gauge', 'Number of postings kept in the postings cache.')
+        self.describe('gugol_postings_cache_hit_ratio', 'gauge', 'Ratio of the lookups found in the postings cache.')
+
+
+    def describe(self, name: str, metric_type: str, text: str, label: str = None):
+        """
+        Registers the type, help text and label name (if any) of a metric.
+        """
+
+        self.descriptions[name] = (metric_type, text, label)
+
+
+    def observe(self, name: str, value: float, label: str = None, buckets: tuple = LATENCY_BUCKETS):
+        """
+        Adds a value to the histogram of the metric (and label value).
+        """
+
+        key = (name, label)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+
+    def increment(self, name: str, value: float = 1):
+        """
+        Increments the counter of the metric.
+        """
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def gauge(self, name: str, value: float):
+        """
+        Sets the current value of the metric.
+        """
+
+        with self.lock:
+            self.counters[name] = value
+
+
+    def stage(self, name: str, start: float) -> float:
+        """
+        Adds the time elapsed since start (perf_counter) to the latency histogram of
+        the stage. Returns the current perf_counter so consecutive stages can be chained.
+        """
+
+        now = perf_counter()
+        self.observe('gugol_query_stage_seconds', now - start, name)
+        return now
+
+
+    def render(self) -> str:
+        """
+        Renders all the metrics in the Prometheus text exposition format.
+        """
+
+        lines = []
+        with self.lock:
+            names = sorted(set(key[0] for key in self.histograms) | set(self.counters))
+            for name in names:
+                metric_type, text, label = self.descriptions.get(name, ('untyped', '', None))
+                lines.append("# HELP {} {}".format(name, text))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+
+                if name in self.counters:
+                    lines.append("{} {}".format(name, self.counters[name]))
+                    continue
+
+                for key in sorted((k for k in self.histograms if k[0] == name), key=lambda k: k[1] or ''):
+                    histogram = self.histograms[key]
+                    labels = '{}="{}",'.format(label, key[1]) if label and key[1] is not None else ''
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{{}le="{}"}} {}'.format(name, labels, bound, cumulative))
+                    labels = '{' + labels.rstrip(',') + '}' if labels else ''
+                    lines.append("{}_sum{} {}".format(name, labels, histogram.sum))
+                    lines.append("{}_count{} {}".format(name, labels, histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the process, shared by the search and the api modules
+metrics = Metrics()
@@ -0,0 +1,101 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import argparse
+import logging
+from query import Query
+from database import NUM_SHARDS, LAYOUT_FLAT, LAYOUT_BUCKETS, shards
+from storage import Storage, path_key, BUCKET_SIZE, ORDER_DOC, ORDER_SCORE
+logger = logging.getLogger(__name__)
+
+"""
+Migration tool of the postings of the terms to the bucketed layout.
+
+Reads every term (with its IDF and postings) from the source layout and writes a header
+document (IDF, postings count, order, number of buckets) and fixed-size buckets of postings
+sorted by document or by TF-IDF (descending). The source can also be the bucketed layout
+itself to change the order or the size of the buckets.
+"""
+
+
+def build_buckets(term: str, postings: list, order: str, bucket_size: int) -> list:
+    """
+    Sorts the postings of a term and splits them into buckets of bucket_size postings.
+    Each bucket keeps the range of documents (min_key, max_key) and the maximum TF-IDF
+    of its postings, so the query can skip the buckets it doesn't need.
+    As with the buckets written by the indexing (Storage.insert_posting_buckets), the
+    bucket is identified by the smallest key of its documents, and the rank keeps the
+    order of the buckets (by document or by descending TF-IDF).
+    """
+
+    if order == ORDER_SCORE:
+        postings = sorted(postings, key = lambda x: x.get('tf_idf') or 0, reverse = True)
+    else:
+        postings = sorted(postings, key = lambda x: path_key(x['path_id']))
+
+    buckets = []
+    for rank, start in enumerate(range(0, len(postings), bucket_size)):
+        chunk = postings[start:start + bucket_size]
+        keys = [path_key(posting['path_id']) for posting in chunk]
+        buckets.append({'term': term,
+                        'bucket': min(keys),
+                        'rank': rank,
+                        'order': order,
+                        'count': len(chunk),
+                        'min_key': min(keys),
+                        'max_key': max(keys),
+                        'max_tf_idf': max(posting.get('tf_idf') or 0 for posting in chunk),
+                        'postings': chunk})
+
+    return buckets
+
+
+def migrate(q: Query, s: Storage, order: str, bucket_size: int):
+    """
+    Migrates all the terms of the source layout (q) to the bucketed layout (s). Writes a
+    new version of the index at the end, so the snapshots of the search caches, the postings
+    cache and the quantized scores of the previous postings are not used anymore.
+    """
+
+    list_terms = q.get_dict_without_postings()
+    counter = 0
+
+    for header in list_terms:
+        term = header['term']
+        postings = []
+        for document in q.collection_postings.find({ 'term': term }, { '_id': 0, 'postings': 1 }):
+            postings.extend(document.get('postings', []))
+
+        buckets = build_buckets(term, postings, order, bucket_size)
+        s.insert_buckets(term, {'idf': header.get('idf'),
+                                'postings_count': len(postings),
+                                'order': order,
+                                'buckets': len(buckets)}, buckets)
+
+        counter = counter + 1
+        if counter % 1000 == 0 or counter == len(list_terms):
+            logger.info("Migrated Terms ... Fetched: {} ... Percentage: {}%".format(
+                counter, round((counter/len(list_terms)) * 100 , 2)))
+
+    s.bump_index_version()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description = "Migrates the postings of the terms to the bucketed layout.")
+    parser.add_argument('--source', choices = [LAYOUT_FLAT, LAYOUT_BUCKETS], default = LAYOUT_FLAT,
+                        help = "Layout of the postings that are read")
+    parser.add_argument('--order', choices = [ORDER_DOC, ORDER_SCORE], default = ORDER_DOC,
+                        help = "Order of the postings inside the buckets")
+    parser.add_argument('--bucket-size', type = int, default = BUCKET_SIZE,
+                        help = "Maximum number of postings in each bucket")
+    parser.add_argument('--shards', type = int, default = NUM_SHARDS,
+                        help = "Number of document-partitioned shards of the index")
+    args = parser.parse_args()
+
+    for shard in shards(args.shards):
+        migrate(Query(args.source, shard = shard), Storage(LAYOUT_BUCKETS, shard), args.order, args.bucket_size)
@@ -5,6 +5,8 @@
 
 import networkx as nx
 from storage import Storage
+from database import shards, shard_of
+from corpus import Corpus, path_sort_key
 from urllib.request import urljoin
 from bs4 import BeautifulSoup
 import json
@@ -21,32 +23,27 @@ def read_json() -> 'Dict: {path : url}':
     Starting point to iterate through the entire corpus.
     """
 
-    try:
-        with open("WEBPAGES_RAW/bookkeeping.json", "r", encoding="utf-8") as file:
-            data = json.load(file)
-            return data
-
-    except IOError:
-        print("Json file not found in the directory.")
+    return Corpus().dict_path
 
 
-def outgoing_links(dict_corpus: dict) -> dict:
+def outgoing_links(dict_corpus: dict, corpus: Corpus = None) -> dict:
     """
     This method will create a dictionary of URLs as key, and a list of URLs it points towards
     as value.
     It will not add URLs that are external to the current corpus of URLs or Path IDs.
+    The pages are streamed (and read ahead) by the corpus reader.
     """
 
     dict_outgoing = {}
     raw = ""
     count = 0
+    if corpus is None:
+        corpus = Corpus()
 
     try:
         # Loops through each document or page
-        for path, url in dict_corpus.items():
-        
-            with open("WEBPAGES_RAW/{}".format(path), "r", encoding="utf-8") as html_file:
-                raw = html_file.read()
+        for path, raw in corpus.stream(sorted(dict_corpus, key = path_sort_key)):
+            url = dict_corpus[path]
 
             soup_lxml = BeautifulSoup(raw, 'lxml')
             
@@ -81,12 +78,22 @@ def outgoing_links(dict_corpus: dict) -> dict:
 
 
 if __name__ == "__main__":
-    s = Storage()
-    dict_path = read_json()
-    outgoing = outgoing_links(dict_path)
+    corpus = Corpus()
+    dict_path = corpus.dict_path
+    outgoing = outgoing_links(dict_path, corpus)
     G = nx.DiGraph(outgoing)
     page_rank = nx.pagerank(G, alpha = 0.9)
-    s.insert_pagerank(page_rank)
+
+    # Each shard of the index (GUGOL_SHARDS) gets the page rank of its documents
+    url_paths = {url: path for path, url in dict_path.items()}
+    for shard in shards():
+        s = Storage(shard = shard)
+        partition = {url: rank for url, rank in page_rank.items() if shard_of(url_paths[url]) == shard}
+        if partition:
+            s.insert_pagerank(partition)
+    # The page rank is part of the cached documents, so the snapshot of the search caches
+    # must be invalidated
+    s.bump_index_version()
 
     # print("Page Rank: {}".format())
 
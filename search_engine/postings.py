@@ -0,0 +1,189 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from metrics import metrics
+
+CACHE_MAX_POSTINGS = int(os.environ.get('GUGOL_POSTINGS_CACHE', 2000000))   # Maximum number of postings
+                                                                            # in the cache (0 disables it)
+
+
+class PostingsList:
+    """
+    Sorted list of the dense document IDs of a term (see Search.doc_ids), with a cursor
+    that moves forward with galloping (exponential) search, so skipping over long runs
+    of documents only costs a logarithmic number of comparisons.
+    """
+
+    def __init__(self, doc_ids):
+        self.doc_ids = array('l', sorted(doc_ids))
+        self.position = 0
+
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+    def reset(self):
+        self.position = 0
+
+
+    def seek(self, target: int) -> int:
+        """
+        Moves the cursor to the first document ID greater than or equal to the target and
+        returns it (None if the list is exhausted). The cursor never moves backwards.
+        """
+
+        doc_ids = self.doc_ids
+        size = len(doc_ids)
+        low = self.position
+        if low >= size:
+            return None
+        if doc_ids[low] >= target:
+            return doc_ids[low]
+
+        # Gallops until the target is inside [low, high] and then searches that range
+        bound = 1
+        while low + bound < size and doc_ids[low + bound] < target:
+            low += bound
+            bound *= 2
+        self.position = bisect_left(doc_ids, target, low + 1, min(low + bound + 1, size))
+
+        return doc_ids[self.position] if self.position < size else None
+
+
+def intersect(postings: 'List[PostingsList]') -> list:
+    """
+    Intersects the postings lists (AND of the terms). The rarest list drives the
+    intersection and the other lists only seek to its documents, so the work depends on
+    the size of the shortest list instead of the size of the union.
+    Returns the sorted list of the document IDs found in every list.
+    """
+
+    if not postings:
+        return []
+
+    postings = sorted(postings, key = len)
+    for postings_list in postings:
+        postings_list.reset()
+    rarest, others = postings[0], postings[1:]
+
+    result = []
+    doc = rarest.seek(0)
+    while doc is not None:
+        for postings_list in others:
+            found = postings_list.seek(doc)
+            if found is None:
+                return result
+            if found != doc:
+                # Skips the documents of the rarest list that can't be in the intersection
+                doc = rarest.seek(found)
+                break
+        else:
+            result.append(doc)
+            doc = rarest.seek(doc + 1)
+
+    return result
+
+
+def merge(postings: 'List[List[(doc_id, value)]]') -> 'List[(doc_id, list index, value)]':
+    """
+    Multi-way merge of postings lists sorted by document ID (document-at-a-time).
+    Returns the postings of all the lists as (doc_id, list index, value) in order of the
+    document IDs, and the values of each document in the order of the lists, so the score
+    of each document can be accumulated in a single step.
+    The lists are concatenated and sorted: the sort finds the sorted run of each list and
+    merges the runs (in C), which is faster than a heap of Python cursors.
+    """
+
+    merged = []
+    for idx, postings_list in enumerate(postings):
+        merged.extend([(doc, idx, value) for doc, value in postings_list])
+    merged.sort()
+
+    return merged
+
+
+class PostingsCache:
+    """
+    LRU cache of the decoded postings of the terms used by the queries.
+    The size of the cache is the number of postings it holds, so a few very common terms
+    can't take the space of many rare ones without being accounted for, and the least
+    recently used terms are evicted first.
+    All the entries belong to one version of the index and are dropped when the version
+    changes (see validate). The hits, misses and evictions are exposed in the metrics.
+    """
+
+    def __init__(self, max_postings: int = CACHE_MAX_POSTINGS):
+        self.max_postings = max_postings
+        self.entries = OrderedDict()    # Key: (collection, term), Value: list of postings
+        self.size = 0                   # Number of postings in the cache
+        self.version = None             # Version of the index of the entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def validate(self, version: str):
+        """
+        Drops all the entries if they belong to another version of the index.
+        """
+
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.size = 0
+                self.version = version
+                metrics.gauge('gugol_postings_cache_postings', 0)
+
+
+    def get(self, key: tuple) -> list:
+        """
+        Returns the cached postings (None if they are not in the cache). The list is shared
+        by all the lookups and must not be modified.
+        """
+
+        with self.lock:
+            postings = self.entries.get(key)
+            if postings is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            hit_ratio = self.hits / (self.hits + self.misses)
+
+        metrics.increment('gugol_postings_cache_misses_total' if postings is None else 'gugol_postings_cache_hits_total')
+        metrics.gauge('gugol_postings_cache_hit_ratio', round(hit_ratio, 4))
+        return postings
+
+
+    def put(self, key: tuple, postings: list):
+        """
+        Adds the postings to the cache, evicting the least recently used terms until they fit.
+        Postings lists larger than the whole cache are not added.
+        """
+
+        if len(postings) > self.max_postings:
+            return
+
+        evicted = 0
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = postings
+            self.size += len(postings)
+            while self.size > self.max_postings:
+                _, old = self.entries.popitem(last = False)
+                self.size -= len(old)
+                evicted += 1
+            size = self.size
+
+        if evicted:
+            metrics.increment('gugol_postings_cache_evictions_total', evicted)
+        metrics.gauge('gugol_postings_cache_postings', size)
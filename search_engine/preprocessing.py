@@ -5,9 +5,7 @@
 
 import json
 import lxml
-import nltk
 
-import os #testing file size small 1722 bytes(4kb) med 13041 bytes (16kb) # 115KB~111K BYTES
 from tidylib import tidy_document # pip install pytidylib / Requires tidy.dll
 from pprint import pprint
 import re
@@ -15,6 +13,9 @@ from bs4 import BeautifulSoup
 from collections import defaultdict
 from lxml import html
 from nltk.util import ngrams
+from time import perf_counter
+from telemetry import NULL_TELEMETRY
+from analyzer import Analyzer
 # nltk.download('wordnet') # Download wordnet dependency if it's the first time running
 
 FILE_SIZE_CAP = 500000 # File size cap for the filtering: 5 MegaBytes
@@ -28,6 +29,23 @@ regex_numbers = re.compile(r"-?\b\d*\.?\d+(e(\+|-)\d*)?\b")
 # Finds all the links that contain common extensions or files
 regex_links = re.compile(r"(?:(?:http|https):\/\/)?([-a-zA-Z0-9.]{2,256}\.[a-z]{2,4})\b(?:\/[-a-zA-Z0-9@:%_\+.~#?&//=]*)?")
 
+# Finds the ASCII letters and digits (the tokens without filters)
+regex_alnum = re.compile(r"[A-Za-z0-9]+")
+
+# Translate tables of the numeric ratio: digits become '0', letters become 'a' and the
+# rest of the ASCII characters are deleted, so one pass over the bytes classifies the text
+ALNUM_TABLE = bytes.maketrans(b"0123456789" + bytes(range(65, 91)) + bytes(range(97, 123)),
+                              b"0" * 10 + b"a" * 52)
+NON_ALNUM = bytes(c for c in range(128) if not chr(c).isalnum())
+
+
+def padding(match) -> str:
+    """
+    Whitespace with the length of the match (keeps the positions of the rest of the text).
+    """
+
+    return " " * (match.end() - match.start())
+
 
 class Preprocessing:
     """
@@ -37,27 +55,32 @@ class Preprocessing:
     and word frequency.
     """
 
-    def __init__(self):
-        self.stop_words = set()
+    def __init__(self, telemetry = NULL_TELEMETRY, preload: bool = True):
+        # Tokenization, stop words and lemmatization are shared with the query path
+        self.analyzer = Analyzer()
+        self.stop_words = self.analyzer.stop_words
+        # Records the time of the sub-steps of fetch_content (read, tidy, parse, clean)
+        self.telemetry = telemetry
         # By using the lemmatizer for the first time it will load WordNet into memory.
         # This is to speedup the search query by 1s (Which is the time it takes to load
-        # WordNet into memory)
-        nltk.WordNetLemmatizer().lemmatize("preloading")
+        # WordNet into memory). It can be skipped and done later with preload_wordnet.
+        if preload:
+            self.preload_wordnet()
 
-        # Load all the stop words from the text file to the set
-        try:
-            with open("stopwords.txt", "r", encoding="utf-8") as file:
-                for word in file:
-                    self.stop_words.add(word.strip())
-        except IOError:
-            print("Stop words file not found in the directory.")
 
+    def preload_wordnet(self):
+        """
+        Loads WordNet into memory by using the lemmatizer for the first time.
+        """
+
+        self.analyzer.preload()
 
-    
-    def fetch_content(self, path: str) -> 'Dict{id, len_doc, broken_body, number_alpha_ratio,' \
+
+    def fetch_content(self, path: str, raw: str = None) -> 'Dict{id, len_doc, broken_body, number_alpha_ratio,' \
                                             + 'removed_numbers, title, body, h1h2, h3h6, strong, anchor, paragraph}':
         """
         This method will fetch the content that is located in the file path.
+        If the raw content is given (e.g. streamed by the Corpus reader) the file is not read.
         Separates the content into the following 6 categories for scoring and
         weighting:
             1. Title: TITLE
@@ -86,49 +109,52 @@ class Preprocessing:
         
         
         doc_dict = {'id': path}
-        raw = ""
-        try:
-            with open("WEBPAGES_RAW/{}".format(path), "r", encoding="utf-8") as html_file:
-            # with open("/Users/lindale/Desktop/M2/WEBPAGES_TEST/{}".format(path), "r", encoding="utf-8") as html_file:
-                raw = html_file.read()
-
-        except IOError:
-            print("HTML file not found in the directory.")
+        stage = perf_counter()
+        if raw is None:
+            raw = ""
+            try:
+                with open("WEBPAGES_RAW/{}".format(path), "r", encoding="utf-8") as html_file:
+                # with open("/Users/lindale/Desktop/M2/WEBPAGES_TEST/{}".format(path), "r", encoding="utf-8") as html_file:
+                    raw = html_file.read()
+
+            except IOError:
+                print("HTML file not found in the directory.")
+        original = raw
+        stage = self.telemetry.step('read', stage)
 
         raw = self.html_validator(raw)
+        stage = self.telemetry.step('tidy', stage)
 
         # html parser doesn't automatically add tags at the beginning of the document,
         # which is useful to find out if the file has a broken body.
         soup_html = BeautifulSoup(raw, 'html.parser')      
+        stage = self.telemetry.step('parse', stage)
 
         # Checks if the content is HTML or not by checking if there's a Body tag (Using html.parser)
         if not soup_html.find('body'):
             doc_dict["broken_body"] = True
             # For the offline content, it checks the file size or how much content there is in each "page"
             # For online content, urllib would help checking the content size and even length without downloading
-            if os.path.getsize("WEBPAGES_RAW/{}".format(path)) > FILE_SIZE_CAP:
+            if len(original.encode("utf-8")) > FILE_SIZE_CAP:
                 # Will truncate the file if the content is NOT html and is greater than 500 lines
                 raw_split = str.splitlines(raw)
                 if len(raw_split) > 500:
                     raw_split = raw_split[:500]
                     raw = '\n'.join(raw_split)
 
-            # Removes the links if it has a broken body, otherwise it will be handled by BS4
-            raw = self.remove_link_content(raw)
-
         else:
             doc_dict["broken_body"] = False
 
-        # Checks if the ratio between numbers and alphabets is more than 20%
-        # Removes all the numeric content replacing it with whitespaces if true.
-        if raw is not None:
-            number_alpha_ratio = self.check_percentage_numeric(raw)
-            doc_dict["number_alpha_ratio"] = number_alpha_ratio
-            if number_alpha_ratio > NUMBER_ALPHA:
-                raw = self.remove_numbers_content(raw)
-                doc_dict["removed_numbers"] = True
+        # Removes the links if it has a broken body (otherwise it will be handled by BS4), and
+        # all the numeric content if the ratio between numbers and alphabets is more than 20%
+        raw, number_alpha_ratio, removed_numbers = self.clean_content(raw, doc_dict["broken_body"])
+        doc_dict["number_alpha_ratio"] = number_alpha_ratio
+        if removed_numbers:
+            doc_dict["removed_numbers"] = True
+        stage = self.telemetry.step('clean', stage)
+
         # Before proceding checks if the content is empty after removal of unnecessary text
-        else:
+        if not raw.strip():
             return doc_dict
 
         # Note: BS4 automatic broken tag handling
@@ -197,6 +223,7 @@ class Preprocessing:
             temp_list = [anchor.get_text() for anchor in soup_lxml.find_all('a')]
             doc_dict["anchor"] = ' '.join([str(elem) for elem in temp_list])
 
+        self.telemetry.step('parse', stage)
         return doc_dict
 
 
@@ -205,19 +232,8 @@ class Preprocessing:
         Tokenizer without any kind of stop word filters nor minimum char limits
         """
 
-        tokenList = []
-        mainString = ""
-
-        for c in content: 
-            if c.isalnum() and c.isascii():
-                mainString+=c
-            else:
-                mainString+=" "
-
-        mainString = mainString.lower()
-        tokenList.extend(mainString.split())
-
-        return tokenList
+        # Any character that is not an ASCII letter or digit is a delimiter
+        return [token.lower() for token in regex_alnum.findall(content)]
 
 
     def tokenize(self, content: str) -> 'List[tokens]':
@@ -228,17 +244,7 @@ class Preprocessing:
         Returns a list of strings (tokens)
         """
 
-        words = []
-        if content:
-            tokens = nltk.tokenize.WordPunctTokenizer().tokenize(content.lower())
-            #tokens = nltk.tokenize.WhitespaceTokenizer().tokenize(content.lower())
-
-            words = [word for word in tokens if word.isalnum() and
-                word not in self.stop_words and
-                word.isascii() and
-                len(word) > 3 and len(word) < 70]
-        
-        return words
+        return self.analyzer.tokenize(content)
 
 
     def tokenize_span(self, content: str) -> 'List[tuples]':
@@ -253,24 +259,7 @@ class Preprocessing:
         Returns a list of tuples (token, index)
         """
 
-        words = []
-
-        if content:
-            tokens = nltk.tokenize.WordPunctTokenizer().tokenize(content.lower())
-            spans = nltk.tokenize.WordPunctTokenizer().span_tokenize(content.lower())
-
-            #tokens = nltk.tokenize.WhitespaceTokenizer().tokenize(content.lower())
-            #spans = nltk.tokenize.WhitespaceTokenizer().span_tokenize(content.lower())
-
-            # Using zip to group into tuples
-            merged = list(zip(tokens, [s[0] for s in spans]))
-            words = [word for word in merged if word[0].isalnum() and
-                word[0] not in self.stop_words and
-                word[0].isascii() and
-                len(word[0]) > 3 and len(word[0]) < 70]
-                #and not word[0].isdigit()]
-
-        return words
+        return self.analyzer.tokenize_span(content)
 
 
     def word_frequency(self, tokens: 'List[token] or List[(token, span)]') -> 'Dict':
@@ -286,54 +275,20 @@ class Preprocessing:
         the token as key, and a nested list [frequency, [indexes it appears]]
         """
 
-        freq_dict = defaultdict(list)
-
-        # Checks if the incoming container is a List of tokens
-        # or a List of Tuples (token, span)
-        if any(isinstance(i, tuple) for i in tokens):
-            
-            # Lemmatization using WordNetLemmatizer
-            lemmatized = [(nltk.WordNetLemmatizer().lemmatize(word[0]), word[1]) for word in tokens]
-
-            # Porter Stemmer
-            # porter = [(nltk.PorterStemmer().stem(word[0]), word[1]) for word in lemmatized]
+        return self.analyzer.word_frequency(tokens)
 
-            for tup in lemmatized:
-                if freq_dict.get(tup[0]):
-                    freq_dict[tup[0]][0] = freq_dict[tup[0]][0] + 1
-                    freq_dict[tup[0]][1].append(tup[1])
-                else:
-                    freq_dict[tup[0]].insert(0, 1)
-                    freq_dict[tup[0]].insert(1, [tup[1]])
-                
-        elif isinstance(tokens, list):
-            # Lemmatization using WordNetLemmatizer
-            lemmatized = [nltk.WordNetLemmatizer().lemmatize(word) for word in tokens]
 
-            # Porter Stemmer
-            # porter = [nltk.PorterStemmer().stem(word) for word in lemmatized]
-
-            fdist = nltk.FreqDist(lemmatized)
-            freq_dict = dict((word, f) for word, f in fdist.items())
+    def lemmatize_span(self, tokens: 'List[(token, span)]') -> 'List[(lemma, span)]':
+        """
+        This method will lemmatize the list of tuples (token, index) keeping the
+        positional index of each token. Used to build the forward index of the document.
+        """
 
-        return freq_dict
+        return self.analyzer.lemmatize_span(tokens)
 
     
     def tokenize_bigram(self, content: str) -> list:
-        words = []
-        dict_bigrams = {}
-
-        if content:
-            tokens = nltk.tokenize.WordPunctTokenizer().tokenize(content.lower())
-
-            words = [word for word in tokens if word.isalnum() and
-                word not in self.stop_words and
-                word.isascii() and
-                len(word) > 3 and len(word) < 70]
-
-            bigrams = list(ngrams(words, 2))
-
-        return bigrams
+        return list(ngrams(self.tokenize(content), 2))
 
 
     def bigram_freq(self, content: str) -> 'Dict':
@@ -341,27 +296,7 @@ class Preprocessing:
         This method will calculate the word frequency using bi-grams or bi-words
         """
 
-        words = []
-        dict_bigrams = {}
-        if content:
-            tokens = nltk.tokenize.WordPunctTokenizer().tokenize(content.lower())
-
-            words = [word for word in tokens if word.isalnum() and
-                word not in self.stop_words and
-                word.isascii() and
-                len(word) > 3 and len(word) < 70]
-
-            lemmatized = [nltk.WordNetLemmatizer().lemmatize(word) for word in words]
-            bigrams = list(ngrams(lemmatized, 2))
-
-            for word in bigrams:
-                joint = ''.join(word)
-                if joint in dict_bigrams:
-                    dict_bigrams[joint] += 1
-                else:
-                    dict_bigrams[joint] = 1
-
-        return dict_bigrams
+        return self.analyzer.bigram_freq(content)
 
 
     # Appends the tag to the end of the line
@@ -380,33 +315,54 @@ class Preprocessing:
         return fixed_line
 
 
+    def clean_content(self, content: str, remove_links: bool = False) -> '(content, number_alpha_ratio, removed_numbers)':
+        """
+        This method cleans the raw content before parsing it. Removes the links (if
+        remove_links), calculates the ratio between numbers and alphabets of the rest of the
+        text and removes all the numbers if the ratio is more than NUMBER_ALPHA.
+        The removed text is replaced with whitespace of the same length for positional
+        index purposes.
+        These are still up to three passes over the text (links, ratio and numbers): the
+        numbers can only be removed once the ratio of the whole text without links is known.
+        """
+
+        if remove_links:
+            content = self.remove_link_content(content)
+
+        number_alpha_ratio = self.check_percentage_numeric(content)
+        removed_numbers = number_alpha_ratio > NUMBER_ALPHA
+        if removed_numbers:
+            content = self.remove_numbers_content(content)
+
+        return content, number_alpha_ratio, removed_numbers
+
+
     # Check how much of the content is numbers vs alpha
     def check_percentage_numeric(self, content):
-        special = len([c for c in content if not c.isalnum()])
-        if len(content) == special:
+        if content.isascii():
+            # Letters and digits classified by one translate of the bytes
+            classes = content.encode("ascii").translate(ALNUM_TABLE, NON_ALNUM)
+            alnum = len(classes)
+            digits = classes.count(b"0")
+        else:
+            alnum = sum(map(str.isalnum, content))
+            digits = sum(map(str.isdigit, content))
+
+        if alnum == 0:
             return 1
         else:
-            result = len([c for c in content if c.isdigit()]) / (len(content) - special)
-            return round(result, 2)
+            return round(digits / alnum, 2)
 
 
     # Removes all words that are only numbers from the text
     def remove_numbers_content(self, content):
-        # Calculates the length of the removed numbers and replaces it with whitespace
-        # for positional index purposes
-        match = re.search(regex_numbers, content)
-        if match is not None:
-            span = match.span()
-            length = span[1] - span[0]
-            return re.sub(regex_numbers, " " * length, content)
+        # Replaces each number with whitespace of its length for positional index purposes
+        return regex_numbers.sub(padding, content)
+
 
     # removes urls
     def remove_link_content(self, content):
-        match = re.search(regex_links, content)
-        if match is not None:
-            span = match.span()
-            length = span[1] - span[0]
-            return re.sub(regex_links, " " * length, content)
+        return regex_links.sub(padding, content)
 
 
     def html_validator(self, raw):
@@ -0,0 +1,158 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import io
+import itertools
+import os
+import json
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from time import perf_counter, strftime
+logger = logging.getLogger(__name__)
+
+"""
+On-demand profiling of the search and indexing paths (cProfile and tracemalloc).
+
+    - API: a search with the X-Gugol-Profile header or the profile parameter (equal to
+        GUGOL_PROFILE_TOKEN) profiles its call of retrieve_results. The hook is off when
+        the token is not configured.
+    - Indexing: python main.py --profile N profiles 1 in N documents of preprocess_all.
+
+Each profile is written to PROFILE_DIR (GUGOL_PROFILE_DIR) as a .prof file of the calls
+(pstats, snakeviz, ...) and a .json report with the slowest functions, the peak of the
+traced memory and the lines with the most memory still allocated at the end of the sample
+with the highest peak. Nothing is profiled or traced unless it is requested.
+"""
+
+PROFILE_DIR = os.environ.get('GUGOL_PROFILE_DIR', 'profiles')  # Directory where the profiles are written
+PROFILE_TOKEN = os.environ.get('GUGOL_PROFILE_TOKEN')   # Value that enables the profiling of a search (None: off)
+PROFILE_HEADER = 'X-Gugol-Profile'  # Header of the searches to profile
+PROFILE_PARAM = 'profile'           # Parameter of the searches to profile
+TRACE_FRAMES = 10           # Frames kept by tracemalloc for each allocation
+TOP_FUNCTIONS = 30          # Number of functions in the report (by cumulative time)
+TOP_ALLOCATIONS = 20        # Number of lines in the report (by allocated memory)
+
+# cProfile and tracemalloc can't profile two calls at once
+_lock = threading.Lock()
+# Sequence of the profiles of the process (unique file names)
+_sequence = itertools.count()
+
+
+def requested(headers: dict, args: dict) -> bool:
+    """
+    Checks if a search asks to be profiled (header or parameter equal to the token).
+    """
+
+    if not PROFILE_TOKEN:
+        return False
+    return PROFILE_TOKEN in (headers.get(PROFILE_HEADER), args.get(PROFILE_PARAM))
+
+
+class Profiler:
+    """
+    This class is responsible for profiling samples of a path of the search engine (a
+    search, or 1 in every documents of the indexing). The calls of all the samples are
+    added up in a single profile.
+    """
+
+    def __init__(self, name: str, every: int = 1, directory: str = PROFILE_DIR):
+        self.name = name
+        self.every = max(1, every)
+        self.directory = directory
+        self.profile = cProfile.Profile()
+        self.samples = 0
+        self.seconds = 0
+        self.largest = None     # (peak traced memory, item, allocation statistics) of the largest sample
+        self.current = None     # (item, perf_counter, traced memory, tracemalloc started) of the sample running
+
+
+    def start(self, item: str):
+        """
+        Starts profiling a sample (item is the search or the document).
+        """
+
+        _lock.acquire()
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(TRACE_FRAMES)
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.current = (item, perf_counter(), tracemalloc.get_traced_memory()[0], started)
+        self.profile.enable()
+
+
+    def stop(self):
+        """
+        Stops profiling the current sample (if any).
+        """
+
+        if self.current is None:
+            return
+
+        self.profile.disable()
+        item, start, memory, started = self.current
+        self.current = None
+        self.samples += 1
+        self.seconds += perf_counter() - start
+
+        peak = tracemalloc.get_traced_memory()[1] - memory
+        if self.largest is None or peak > self.largest[0]:
+            # Memory still allocated at the end of the sample (without the one of the profiler)
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__),
+                                                                   tracemalloc.Filter(False, tracemalloc.__file__)])
+            statistics = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            self.largest = (peak, item, statistics)
+        if started:
+            tracemalloc.stop()
+        _lock.release()
+
+
+    def report(self) -> dict:
+        """
+        Returns the report of the profile: the slowest functions (cumulative time) and the
+        allocations (still alive at its end) of the sample with the highest peak of traced memory.
+        """
+
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream = stream).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        peak, item, statistics = self.largest or (0, None, [])
+
+        return {'name': self.name,
+                'samples': self.samples,
+                'seconds': round(self.seconds, 4),
+                'functions': stream.getvalue().splitlines(),
+                'peak_memory_kb': round(peak / 1024, 1),
+                'peak_memory_item': item,
+                'allocations': [{'line': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1),
+                                 'count': stat.count} for stat in statistics]}
+
+
+    def dump(self) -> dict:
+        """
+        Writes the profile (.prof) and its report (.json) to the directory. Returns the paths
+        of the files and the summary of the profile.
+        """
+
+        self.stop()
+        prefix = os.path.join(self.directory, '{}_{}_{}_{}'.format(self.name, strftime('%Y%m%d-%H%M%S'),
+                                                                os.getpid(), next(_sequence)))
+        report = self.report()
+        try:
+            os.makedirs(self.directory, exist_ok = True)
+            self.profile.dump_stats(prefix + '.prof')
+            with open(prefix + '.json', 'w', encoding = 'utf-8') as file:
+                json.dump(report, file, indent = 2)
+            logger.info("Profile of {} written to {}.prof".format(self.name, prefix))
+        except IOError:
+            print("Error writing the profile.")
+
+        return {'profile': prefix + '.prof',
+                'report': prefix + '.json',
+                'samples': report['samples'],
+                'seconds': report['seconds'],
+                'peak_memory_kb': report['peak_memory_kb']}
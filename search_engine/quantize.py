@@ -0,0 +1,298 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import sys
+import json
+import math
+import argparse
+import logging
+from array import array
+from query import Query
+from storage import Storage, path_key, key_path
+from database import INDEX_LAYOUT, LAYOUT_FLAT, LAYOUT_BUCKETS, NUM_SHARDS, shards
+logger = logging.getLogger(__name__)
+
+"""
+Quantized impact scores of the terms.
+
+The query path only needs one score per posting (TF-IDF), so each term is stored as two
+packed arrays sorted by document: the keys of the documents (see storage.path_key, 4 bytes)
+and the TF-IDF quantized to 8 or 16 bits (1 or 2 bytes), with the scale to turn them back
+into scores. The scale is either per term (the highest TF-IDF of the term maps to the
+highest level) or global (the highest TF-IDF of the index).
+
+The build also reports the ranking drift of the quantized scores against the float scores
+on a set of queries (overlap of the top results), so the number of bits and the scaling can
+be chosen before serving them (Search with GUGOL_QUANTIZED=1).
+"""
+
+QUANTIZED = os.environ.get('GUGOL_QUANTIZED', '').lower() in ('1', 'true', 'yes')  # Serve the quantized scores
+SCALING_TERM = 'term'       # Scale of each term (highest TF-IDF of the term)
+SCALING_GLOBAL = 'global'   # Same scale for all the terms (highest TF-IDF of the index)
+TYPECODES = {8: 'B', 16: 'H'}   # Array type of each number of bits
+REPORT_PATH = 'quantize_report.json'
+DRIFT_K = (10, 20)          # Number of top results compared in the drift report
+DEFAULT_QUERIES = 50        # Number of queries generated from the dictionary if there is no query set
+
+
+def pack(values: array) -> bytes:
+    """
+    Packs the array in little-endian byte order.
+    """
+
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack(typecode: str, data: bytes) -> array:
+    """
+    Unpacks an array packed in little-endian byte order.
+    """
+
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def quantize_term(postings: 'List[(path, tf_idf)]', bits: int, scale: float) -> '(keys, levels)':
+    """
+    Quantizes the postings of a term. Returns the keys of the documents (sorted) and the
+    quantized scores. Scores above 0 are never quantized to 0, so the document length of
+    the queries can't become 0.
+    """
+
+    highest = (1 << bits) - 1
+    keys = array('I')
+    levels = array(TYPECODES[bits])
+
+    for key, tf_idf in sorted((path_key(path), tf_idf or 0) for path, tf_idf in postings):
+        keys.append(key)
+        level = 0
+        if tf_idf > 0 and scale > 0:
+            level = max(1, min(highest, round(tf_idf / scale)))
+        levels.append(level)
+
+    return keys, levels
+
+
+def build(q: Query, s: Storage, bits: int = 8, scaling: str = SCALING_TERM) -> dict:
+    """
+    Quantizes the impact scores of all the terms of the index (q) and writes them (s).
+    Returns the statistics of the build (terms, postings, bytes).
+    """
+
+    highest = (1 << bits) - 1
+    index_version = q.index_version()
+    global_scale = q.max_tf_idf() / highest if scaling == SCALING_GLOBAL else None
+
+    list_terms = q.get_dict_without_postings()
+    statistics = {'terms': 0, 'postings': 0, 'bytes': 0}
+
+    for header in list_terms:
+        term = header['term']
+        postings = q.get_term_impacts(term)
+        scale = global_scale
+        if scale is None:
+            scale = max((tf_idf or 0 for _, tf_idf in postings), default = 0) / highest
+
+        keys, levels = quantize_term(postings, bits, scale)
+        s.insert_impacts(term, {'bits': bits,
+                                'scale': scale,
+                                'count': len(keys),
+                                'keys': pack(keys),
+                                'levels': pack(levels),
+                                'index_version': index_version})
+
+        statistics['terms'] += 1
+        statistics['postings'] += len(keys)
+        statistics['bytes'] += len(keys) * (keys.itemsize + levels.itemsize)
+        if statistics['terms'] % 1000 == 0 or statistics['terms'] == len(list_terms):
+            logger.info("Quantized Terms ... Fetched: {} ... Percentage: {}%".format(
+                statistics['terms'], round((statistics['terms']/len(list_terms)) * 100 , 2)))
+
+    return statistics
+
+
+class QuantizedIndex:
+    """
+    In-memory index of the quantized impact scores, with the same methods used by Search
+    to read the postings from MongoDB (get_doc_length_tf_idf, get_term_impacts, get_term_paths),
+    so the scores can be served directly from the packed arrays.
+    """
+
+    def __init__(self):
+        self.terms = {}     # Key: term, Value: (keys, levels, scale)
+        self.paths = {}     # Key: key of the document, Value: path ID (shared strings)
+
+
+    @classmethod
+    def load(cls, q: Query) -> 'QuantizedIndex':
+        """
+        Loads the quantized scores of the current version of the index.
+        Returns None if there are no quantized scores for that version.
+        """
+
+        index = cls()
+        index_version = q.index_version()
+        for entry in q.get_quantized_impacts():
+            if entry.get('index_version') != index_version:
+                continue
+            keys = unpack('I', entry['keys'])
+            index.terms[entry['term']] = (keys, unpack(TYPECODES[entry['bits']], entry['levels']), entry['scale'])
+            for key in keys:
+                if key not in index.paths:
+                    index.paths[key] = key_path(key)
+
+        return index if index.terms else None
+
+
+    def get_term_impacts(self, term: str, paths: list = None) -> list:
+        """
+        Returns the (path ID, score) pairs of the term (only of the given paths if any).
+        """
+
+        entry = self.terms.get(term)
+        if entry is None:
+            return []
+
+        keys, levels, scale = entry
+        postings = [(self.paths[key], level * scale) for key, level in zip(keys, levels)]
+        if paths is not None:
+            paths = set(paths)
+            postings = [posting for posting in postings if posting[0] in paths]
+
+        return postings
+
+
+    def get_term_paths(self, term: str, paths: list = None) -> list:
+        """
+        Returns the path IDs of all the documents of the term (the paths are ignored, the
+        postings are already in memory).
+        """
+
+        entry = self.terms.get(term)
+        return [self.paths[key] for key in entry[0]] if entry else []
+
+
+    def get_doc_length_tf_idf(self, terms: list, paths: list = None) -> list:
+        """
+        Same result as Query.get_doc_length_tf_idf: for each document with at least one of
+        the terms, the number of terms it has, the sum of their scores and the document length
+        (square root of the sum of the squared scores), sorted by number of terms and then by
+        score in descending order.
+        """
+
+        statistics = {}     # Key: path, Value: [documents, tf_idf, len_pow2]
+        for term in terms:
+            for path, score in self.get_term_impacts(term, paths):
+                current = statistics.get(path)
+                if current is None:
+                    statistics[path] = [1, score, score * score]
+                else:
+                    current[0] += 1
+                    current[1] += score
+                    current[2] += score * score
+
+        doc_length = [{'_id': path, 'documents': values[0], 'tf_idf': values[1], 'len': math.sqrt(values[2])}
+                      for path, values in statistics.items()]
+        doc_length.sort(key = lambda x: (-x['documents'], -x['tf_idf']))
+
+        return doc_length
+
+
+def default_queries(cached_dict: dict, number: int = DEFAULT_QUERIES) -> list:
+    """
+    Generates a query set from the dictionary: the most common terms as single-term
+    queries and pairs of consecutive common terms as two-term queries.
+    """
+
+    common = sorted(cached_dict, key = lambda term: cached_dict[term].get('postings_count') or 0, reverse = True)
+    common = common[:number]
+    return common + ["{} {}".format(first, second) for first, second in zip(common, common[1:])]
+
+
+def drift(search, impacts: QuantizedIndex, queries: list) -> dict:
+    """
+    Compares the top results of each query with the float scores (MongoDB) and with the
+    quantized scores. Returns the overlap of the top k results and the ratio of queries
+    with exactly the same top k ranking.
+    """
+
+    report = {'queries': len(queries)}
+    overlaps = {k: [] for k in DRIFT_K}
+    identical = {k: 0 for k in DRIFT_K}
+
+    for query in queries:
+        search.impacts = None
+        exact = [result[0] for result in search.retrieve_results(query)[0]]
+        search.impacts = impacts
+        quantized = [result[0] for result in search.retrieve_results(query)[0]]
+
+        for k in DRIFT_K:
+            if not exact[:k]:
+                continue
+            overlaps[k].append(len(set(exact[:k]) & set(quantized[:k])) / len(exact[:k]))
+            identical[k] += exact[:k] == quantized[:k]
+
+    for k in DRIFT_K:
+        report['mean_overlap@{}'.format(k)] = round(sum(overlaps[k]) / len(overlaps[k]), 4) if overlaps[k] else None
+        report['min_overlap@{}'.format(k)] = round(min(overlaps[k]), 4) if overlaps[k] else None
+        report['identical@{}'.format(k)] = round(identical[k] / len(overlaps[k]), 4) if overlaps[k] else None
+
+    return report
+
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description = "Quantizes the impact scores of the terms and reports the ranking drift.")
+    parser.add_argument('--bits', type = int, choices = sorted(TYPECODES), default = 8,
+                        help = "Number of bits of the quantized scores")
+    parser.add_argument('--scaling', choices = [SCALING_TERM, SCALING_GLOBAL], default = SCALING_TERM,
+                        help = "Scale of the quantized scores (per term or global)")
+    parser.add_argument('--layout', choices = [LAYOUT_FLAT, LAYOUT_BUCKETS], default = INDEX_LAYOUT,
+                        help = "Storage layout of the postings of the terms")
+    parser.add_argument('--shards', type = int, default = NUM_SHARDS,
+                        help = "Number of document-partitioned shards of the index")
+    parser.add_argument('--queries', help = "Text file with the query set of the drift report (one query per line)")
+    parser.add_argument('--report', default = REPORT_PATH, help = "Path of the JSON report")
+    args = parser.parse_args()
+
+    # Imported here, the build doesn't need the query path
+    from search import Search
+
+    queries = None
+    if args.queries:
+        try:
+            with open(args.queries, "r", encoding="utf-8") as file:
+                queries = [line.strip() for line in file if line.strip()]
+        except IOError:
+            print("Query set file not found in the directory.")
+
+    report = {'bits': args.bits, 'scaling': args.scaling, 'shards': []}
+    for shard in shards(args.shards):
+        q = Query(args.layout, shard = shard)
+        statistics = build(q, Storage(args.layout, shard), args.bits, args.scaling)
+        # Size of the same postings with float64 TF-IDF and a 4 bytes key
+        statistics['float_bytes'] = statistics['postings'] * 12
+
+        search = Search(args.layout, shard = shard, quantized = False)
+        statistics['drift'] = drift(search, QuantizedIndex.load(q), queries or default_queries(search.cached_dict))
+        statistics['shard'] = shard
+        report['shards'].append(statistics)
+        logger.info("Quantized shard {}: {}".format(shard, statistics))
+
+    try:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent = 2)
+    except IOError:
+        print("Error writing the quantization report.")
@@ -3,37 +3,82 @@
 # Search Engine Project
 # -----------------------------------------------------------
 
-from pymongo import MongoClient
 from pprint import pprint
 import json
+from time import monotonic
+from itertools import groupby
+from bisect import bisect_left
 from collections import defaultdict
+import database
+from corpus import Corpus
+from database import LAYOUT_BUCKETS, INDEX_LAYOUT, BATCH_SIZE
+from storage import path_key
+
+VERSION_CHECK_INTERVAL = 5  # Seconds between the checks of the version of the index (postings cache)
+
+
+def stream(cursor):
+    """
+    Generator of the documents of a cursor. The cursor is closed when the generator is
+    exhausted or closed, so a consumer that stops early doesn't keep it open on the server.
+    """
+
+    try:
+        for document in cursor:
+            yield document
+    finally:
+        cursor.close()
 
-DB_NAME = 'project3db'
 
 """
 This class is responsible for handling all query needs from the user and the preprocessing.
 """
 class Query:
-    def __init__(self):
-        self.client = MongoClient("localhost", 27017)
-        self.db = self.client[DB_NAME]
-        self.dict_paths = []
-        
-        try:
-            with open("WEBPAGES_RAW/bookkeeping.json", "r", encoding="utf-8") as file:
-                self.dict_paths = json.load(file)
-                
-        except IOError:
-            print("Json file not found in the directory.")
+    def __init__(self, layout: str = INDEX_LAYOUT, routed: bool = False, shard: int = None, cache = None):
+        # Shared pooled client of the data-access layer.
+        # If routed is True the reads use the configured read preference (query path of
+        # the API), otherwise they go to the primary (index build needs its own writes).
+        # If the shard is given, the collections of the index are the partitions of that shard
+        self.db = database.get_db()
+        self.layout = layout
+        self.shard = shard
+
+        # Cache of the decoded postings of the queried terms (PostingsCache, None to disable it)
+        self.cache = cache
+        self.version_checked = None
+        # Mapping of the paths to the URLs, only loaded by the corpus reader when needed
+        self.dict_paths = None
 
         # Collection for the terms
-        self.collection_terms = self.db['test_terms_v6']
+        self.collection_terms = database.get_collection('terms', routed, shard)
 
-        # Collection for the bi-grams
-        self.collection_bigrams = self.db['test_bigrams_v6']
+        # The flat layout keeps the IDF and the postings in the same document of the term.
+        # The bucketed layout keeps the IDF in a header and the postings in fixed-size buckets
+        # (all the pipelines that match a term and unwind its postings work on both).
+        if layout == LAYOUT_BUCKETS:
+            self.collection_headers = database.get_collection('headers', routed, shard)
+            self.collection_postings = database.get_collection('buckets', routed, shard)
+        else:
+            self.collection_headers = self.collection_terms
+            self.collection_postings = self.collection_terms
+
+        # Collection for the bi-grams (collected by the indexing)
+        self.collection_bigrams = database.get_collection('bigrams', routed, shard)
+
+        # Collection for the blocks of bi-grams keyed by pairs of term IDs (see bigrams)
+        self.collection_pairs = database.get_collection('pairs', routed, shard)
 
         # Collection for documents
-        self.collection_docs = self.db['test_docs_v6']
+        self.collection_docs = database.get_collection('docs', routed, shard)
+
+        # Collection for the forward index
+        self.collection_forward = database.get_collection('forward', routed, shard)
+
+        # Collection for the quantized impact scores
+        self.collection_impacts = database.get_collection('impacts', routed, shard)
+
+        # Collection for the metadata of the index
+        self.collection_meta = database.get_collection('meta', routed)
 
 
     def postings_count(self):
@@ -42,6 +87,19 @@ class Query:
         related to the term (Size of postings array)
         """
 
+        result = defaultdict()
+        for term, count in self.iter_postings_count():
+            result[term] = count
+
+        return result
+
+
+    def iter_postings_count(self, batch_size: int = BATCH_SIZE):
+        """
+        This method is a generator of the (term, number of documents) of all the terms,
+        fetched batch_size terms at a time.
+        """
+
         pipeline = [
             {
                 '$project': {
@@ -53,11 +111,27 @@ class Query:
                 }
             }
         ]
-        result = defaultdict()
-        for d in list(self.collection_terms.aggregate(pipeline)):
-            result[d.get('term')] = d.get('count')
+        # Each bucket keeps the number of postings it holds
+        if self.layout == LAYOUT_BUCKETS:
+            pipeline = [
+                {
+                    '$group': {
+                        '_id': '$term', 
+                        'count': {
+                            '$sum': '$count'
+                        }
+                    }
+                }, {
+                    '$project': {
+                        '_id': 0, 
+                        'term': '$_id', 
+                        'count': '$count'
+                    }
+                }
+            ]
 
-        return result
+        for d in stream(self.collection_postings.aggregate(pipeline, allowDiskUse = True, batchSize = batch_size)):
+            yield d.get('term'), d.get('count')
 
 
     def postings_bigrams_count(self):
@@ -65,7 +139,20 @@ class Query:
         This method uses an aggregation pipeline to get the number of documents
         related to the bi-grams (Size of postings array for bi-grams)
         """
-        
+
+        result = defaultdict()
+        for term, count in self.iter_postings_bigrams_count():
+            result[term] = count
+
+        return result
+
+
+    def iter_postings_bigrams_count(self, batch_size: int = BATCH_SIZE):
+        """
+        This method is a generator of the (bi-gram, number of documents) of all the bi-grams,
+        fetched batch_size bi-grams at a time.
+        """
+
         pipeline = [
             {
                 '$project': {
@@ -77,11 +164,8 @@ class Query:
                 }
             }
         ]
-        result = defaultdict()
-        for d in list(self.collection_bigrams.aggregate(pipeline)):
-            result[d.get('term')] = d.get('count')
-
-        return result
+        for d in stream(self.collection_bigrams.aggregate(pipeline, batchSize = batch_size)):
+            yield d.get('term'), d.get('count')
 
 
     def get_dict_without_postings(self):
@@ -90,6 +174,15 @@ class Query:
         the content of each posting. Used if none of the posting information is needed.
         """
 
+        return list(self.iter_dict_without_postings())
+
+
+    def iter_dict_without_postings(self, batch_size: int = BATCH_SIZE):
+        """
+        This method is a generator of the terms without the content of each posting,
+        fetched batch_size terms at a time.
+        """
+
         pipeline = [
             {
                 '$project': {
@@ -98,7 +191,7 @@ class Query:
                 }
             }
         ]
-        return list(self.collection_terms.aggregate(pipeline))
+        return stream(self.collection_headers.aggregate(pipeline, batchSize = batch_size))
 
 
     def get_all_terms(self):
@@ -107,25 +200,13 @@ class Query:
         collection and returns them sorted alphabetically in ascending order in a list
         """
 
-        pipeline = [
-            {
-                '$project': {
-                    '_id': 0, 
-                    'postings': 0
-                }
-            }, {
-                '$sort': {
-                    'term': 1
-                }
-            }
-        ]
-        return [d['term'] for d in list(self.collection_terms.aggregate(pipeline))]
+        return list(self.iter_all_terms())
 
 
-    def get_all_bigrams(self):
+    def iter_all_terms(self, batch_size: int = BATCH_SIZE):
         """
-        This method uses an aggregation pipeline to get all the bi-grams in the entire
-        collection and returns them sorted alphabetically in ascending order in a list
+        This method is a generator of all the terms sorted alphabetically in ascending
+        order, fetched batch_size terms at a time.
         """
 
         pipeline = [
@@ -140,7 +221,40 @@ class Query:
                 }
             }
         ]
-        return [d['term'] for d in list(self.collection_bigrams.aggregate(pipeline, allowDiskUse = True))]
+
+        # The headers are only written when the scores are calculated, so the terms
+        # are grouped from the buckets
+        if self.layout == LAYOUT_BUCKETS:
+            pipeline = [
+                {
+                    '$group': {
+                        '_id': '$term'
+                    }
+                }, {
+                    '$project': {
+                        '_id': 0, 
+                        'term': '$_id'
+                    }
+                }, {
+                    '$sort': {
+                        'term': 1
+                    }
+                }
+            ]
+        for d in stream(self.collection_postings.aggregate(pipeline, allowDiskUse = True, batchSize = batch_size)):
+            yield d['term']
+
+
+    def iter_bigram_freq(self, batch_size: int = BATCH_SIZE):
+        """
+        This method is a generator of the bi-grams of the collection with the path IDs and
+        weighted frequencies of their postings (one document of the collection at a time, in
+        the order they are stored, so it doesn't need to sort the whole collection).
+        """
+
+        cursor = self.collection_bigrams.find({}, { '_id': 0, 'term': 1, 'postings.path_id': 1,
+                                                    'postings.bigram_wt_freq': 1 })
+        return stream(cursor.batch_size(batch_size))
 
 
     def term_count(self):
@@ -148,7 +262,7 @@ class Query:
         This method gets the total number of terms in the collection of terms.
         """
 
-        return self.collection_terms.count()
+        return self.collection_headers.count()
 
 
     def doc_count(self):
@@ -156,7 +270,7 @@ class Query:
         This metod gets the number of unique paths (URLs) in the collection of terms.
         """
 
-        return len(self.collection_terms.distinct('postings.path_id'))
+        return len(self.collection_postings.distinct('postings.path_id'))
 
 
     def bigram_doc_count(self):
@@ -201,7 +315,7 @@ class Query:
             }
         ]
 
-        return list(self.collection_terms.aggregate(pipeline))
+        return list(self.collection_postings.aggregate(pipeline))
 
 
     def get_term(self, term: str):
@@ -231,7 +345,7 @@ class Query:
                 }
             }
         ]
-        return list(self.collection_terms.aggregate(pipeline))
+        return list(self.collection_postings.aggregate(pipeline))
         
 
     def get_weighted_freq(self, term: str):
@@ -257,36 +371,62 @@ class Query:
                 }
             }
         ]
-        return list(self.collection_terms.aggregate(pipeline))
+        return list(self.collection_postings.aggregate(pipeline))
 
 
-    def get_bigram_freq(self, term):
+    def iter_weighted_freq(self, batch_size: int = BATCH_SIZE):
         """
-        This method uses an aggregation pipeline to get all the postings
-        (and it's weighted frequency) of a bigram.
+        This method is a generator of all the terms with the path ID and weighted frequency
+        of their postings (term, List[{path_id, weighted_freq}]), sorted alphabetically. The
+        collection is read once with a single cursor (instead of one query per term), and only
+        the postings of one term are in memory at a time.
         """
 
-        pipeline = [
-            {
-                '$match': {
-                    'term': term
-                }
-            }, {
-                '$unwind': {
-                    'path': '$postings'
-                }
-            }, {
-                '$project': {
-                    '_id': 0, 
-                    'path_id': '$postings.path_id', 
-                    'bigram_wt_freq': '$postings.bigram_wt_freq', 
-                }
-            }
-        ]
-        return list(self.collection_bigrams.aggregate(pipeline))
+        projection = { '_id': 0, 'term': 1, 'postings.path_id': 1, 'postings.weighted_freq': 1 }
+        sort = [('term', 1), ('bucket', 1)] if self.layout == LAYOUT_BUCKETS else [('term', 1)]
+        # The scores of each term are written while the cursor is open (no timeout)
+        cursor = self.collection_postings.find({}, projection, no_cursor_timeout = True).sort(sort)
+
+        # The buckets of a term are consecutive
+        for term, documents in groupby(stream(cursor.batch_size(batch_size)), key = lambda d: d['term']):
+            postings = []
+            for document in documents:
+                postings.extend(document.get('postings', []))
+            yield term, postings
 
 
-    def get_doc_length_tf_idf(self, terms):
+    def term_match(self, term: str, paths: list = None) -> dict:
+        """
+        This method returns the match of the documents of the postings of the term.
+        With the bucketed layout, if the paths are given only the buckets whose range of
+        documents (min_key, max_key) contains one of the paths are matched. The ranges are
+        read with a covered query of the index of the buckets (no postings are read), so
+        the conjunctive queries and the re-scoring of candidates only unwind the buckets
+        they need. Buckets sorted by score cover most of the documents, so they are
+        rarely skipped.
+        """
+
+        match = { 'term': term }
+        if self.layout != LAYOUT_BUCKETS or paths is None:
+            return match
+
+        keys = sorted(path_key(path) for path in paths)
+        buckets = []
+        ranges = self.collection_postings.find({ 'term': term },
+                                               { '_id': 0, 'bucket': 1, 'min_key': 1, 'max_key': 1 })
+        for bucket in ranges:
+            if 'min_key' not in bucket or 'max_key' not in bucket:
+                buckets.append(bucket['bucket'])
+                continue
+            idx = bisect_left(keys, bucket['min_key'])
+            if idx < len(keys) and keys[idx] <= bucket['max_key']:
+                buckets.append(bucket['bucket'])
+
+        match['bucket'] = { '$in': buckets }
+        return match
+
+
+    def get_doc_length_tf_idf(self, terms, paths: list = None):
         """
         This method uses an aggregation pipeline to calculate the document length
         for a multiword query:
@@ -304,11 +444,22 @@ class Query:
                 sorts by TF-IDF in descending order.
             - Finally it projects again to finalize the calculation of doc length by finding
                 the square root of the summed TF-IDFs
+        If the paths are given (conjunctive queries), only the postings of those documents
+        are grouped.
         """
-        
+
+        return list(self.iter_doc_length_tf_idf(terms, paths))
+
+
+    def iter_doc_length_tf_idf(self, terms, paths: list = None, batch_size: int = BATCH_SIZE):
+        """
+        This method is a generator of the same results as get_doc_length_tf_idf, fetched
+        batch_size documents at a time.
+        """
+
         temp = []
         for t in terms:
-            temp.append({'term': t })
+            temp.append(self.term_match(t, paths))
         
         pipeline = [
             {
@@ -358,7 +509,10 @@ class Query:
                 }
             }
         ]
-        return list(self.collection_terms.aggregate(pipeline))
+        if paths is not None:
+            pipeline.insert(3, { '$match': { 'path_id': { '$in': paths }}})
+
+        return stream(self.collection_postings.aggregate(pipeline, batchSize = batch_size))
 
 
     def get_doc_length_tf(self, terms):
@@ -433,21 +587,20 @@ class Query:
                 }
             }
         ]
-        return list(self.collection_terms.aggregate(pipeline))
+        return list(self.collection_postings.aggregate(pipeline))
 
 
-    def get_term_postings(self, term: str):
+    def get_term_postings(self, term: str, paths: list = None):
         """
         This method uses an aggregation pipeline to get all the postings associated to
         the term and will return them organized in a dictionary to handling of the
         GET requests.
+        If the paths are given, only the postings of those documents are returned.
         """
 
         pipeline = [
             {
-                '$match': {
-                    'term': term
-                }
+                '$match': self.term_match(term, paths)
             }, {
                 '$unwind': {
                     'path': '$postings'
@@ -462,7 +615,10 @@ class Query:
                 }
             }
         ]
-        temp = list(self.collection_terms.aggregate(pipeline))
+        if paths is not None:
+            pipeline.insert(2, { '$match': { 'postings.path_id': { '$in': paths }}})
+
+        temp = list(self.collection_postings.aggregate(pipeline))
         dict_postings = defaultdict(dict)
         
         for path in temp:
@@ -473,18 +629,60 @@ class Query:
         return dict_postings
 
 
-    def get_bigram_postings(self, term):
+    def get_quantized_impacts(self):
         """
-        This method uses an aggregation pipeline to get all the postings associated to
-        the bi-gram and will return them organized in a dictionary to handling of the
-        GET requests.
+        This method gets the quantized impact scores of all the terms (see quantize).
+        """
+
+        return self.collection_impacts.find({}, { '_id': 0 }, batch_size = BATCH_SIZE)
+
+
+    def max_tf_idf(self) -> float:
+        """
+        This method uses an aggregation pipeline to get the highest TF-IDF of all the postings.
         """
 
         pipeline = [
             {
-                '$match': {
-                    'term': term
+                '$unwind': {
+                    'path': '$postings'
                 }
+            }, {
+                '$group': {
+                    '_id': None, 
+                    'max_tf_idf': {
+                        '$max': '$postings.tf_idf'
+                    }
+                }
+            }
+        ]
+        result = list(self.collection_postings.aggregate(pipeline, allowDiskUse = True))
+        return result[0]['max_tf_idf'] if result else 0
+
+
+    def get_term_impacts(self, term: str, paths: list = None) -> list:
+        """
+        This method gets the (path ID, TF-IDF) pairs of the postings of the term in the order
+        they are stored, without the rest of the content of the postings.
+        Used by the document-at-a-time scoring.
+        If the paths are given, only the postings of those documents are returned.
+        With the postings cache, the whole postings of the term are cached (and filtered by
+        the paths in memory), and the returned list must not be modified.
+        """
+
+        key = ('terms', term)
+        if self.cache is not None:
+            self.validate_cache()
+            cached = self.cache.get(key)
+            if cached is not None:
+                if paths is None:
+                    return cached
+                paths = set(paths)
+                return [posting for posting in cached if posting[0] in paths]
+
+        pipeline = [
+            {
+                '$match': self.term_match(term, paths)
             }, {
                 '$unwind': {
                     'path': '$postings'
@@ -493,19 +691,126 @@ class Query:
                 '$project': {
                     '_id': 0, 
                     'path_id': '$postings.path_id', 
-                    'tf': '$postings.tf', 
-                    'tf_idf': '$postings.tf_idf', 
+                    'tf_idf': '$postings.tf_idf'
                 }
             }
         ]
-        temp = list(self.collection_bigrams.aggregate(pipeline))
-        dict_postings = defaultdict(dict)
-        
-        for path in temp:
-            dict_postings[path['path_id']]['tf'] = path['tf']
-            dict_postings[path['path_id']]['tf_idf'] = path['tf_idf']
+        if paths is not None:
+            pipeline.insert(2, { '$match': { 'postings.path_id': { '$in': paths }}})
 
-        return dict_postings
+        postings = [(posting['path_id'], posting['tf_idf'])
+                    for posting in self.collection_postings.aggregate(pipeline, batchSize = BATCH_SIZE)]
+
+        if self.cache is not None and paths is None:
+            self.cache.put(key, postings)
+        return postings
+
+
+    def get_term_frequencies(self, term: str, paths: list = None) -> list:
+        """
+        This method gets the (path ID, natural frequency, frequency of the fields) of the
+        postings of the term, used by the BM25 scorers. The frequency of the fields is None
+        if the term is only in the body of the document.
+        If the paths are given, only the postings of those documents are returned.
+        With the postings cache, the returned list must not be modified.
+        """
+
+        key = ('frequencies', term)
+        if self.cache is not None:
+            self.validate_cache()
+            cached = self.cache.get(key)
+            if cached is not None:
+                if paths is None:
+                    return cached
+                paths = set(paths)
+                return [posting for posting in cached if posting[0] in paths]
+
+        pipeline = [
+            {
+                '$match': self.term_match(term, paths)
+            }, {
+                '$unwind': {
+                    'path': '$postings'
+                }
+            }, {
+                '$project': {
+                    '_id': 0, 
+                    'path_id': '$postings.path_id', 
+                    'natural_freq': '$postings.natural_freq',
+                    'fields': '$postings.fields'
+                }
+            }
+        ]
+        if paths is not None:
+            pipeline.insert(2, { '$match': { 'postings.path_id': { '$in': paths }}})
+
+        postings = [(posting['path_id'], posting['natural_freq'], posting.get('fields'))
+                    for posting in self.collection_postings.aggregate(pipeline, batchSize = BATCH_SIZE)]
+
+        if self.cache is not None and paths is None:
+            self.cache.put(key, postings)
+        return postings
+
+
+    def validate_cache(self):
+        """
+        This method drops the postings cache if the index was rebuilt (the version of the
+        index is checked at most every VERSION_CHECK_INTERVAL seconds).
+        """
+
+        now = monotonic()
+        if self.version_checked is None or now - self.version_checked > VERSION_CHECK_INTERVAL:
+            self.version_checked = now
+            self.cache.validate(self.index_version())
+
+
+    def get_impact_buckets(self, term: str):
+        """
+        This method is a generator of the buckets of the term (bucketed layout) in order
+        (rank of the migrated buckets, then smallest key), with the path ID and TF-IDF of
+        their postings. The buckets are fetched one at a time, so closing the generator
+        stops the reading of the postings.
+        """
+
+        cursor = self.collection_postings.find({ 'term': term },
+                                               { '_id': 0, 'bucket': 1, 'max_tf_idf': 1,
+                                                 'postings.path_id': 1, 'postings.tf_idf': 1 })
+        cursor = cursor.sort([('rank', 1), ('bucket', 1)]).batch_size(1)
+        try:
+            for bucket in cursor:
+                yield bucket
+        finally:
+            cursor.close()
+
+
+    def get_term_paths(self, term: str, paths: list = None):
+        """
+        This method gets the path IDs of the documents where the term appears (only the
+        document IDs of the postings, used by the conjunctive queries).
+        With the postings cache, they are taken from the cached postings of the term.
+        If the paths are given, with the bucketed layout only the buckets whose range of
+        documents contains one of the paths are read (see term_match), so the result can
+        include other documents of those buckets but every given path of the term.
+        """
+
+        if self.cache is not None:
+            return [posting[0] for posting in self.get_term_impacts(term)]
+
+        pipeline = [
+            {
+                '$match': self.term_match(term, paths)
+            }, {
+                '$unwind': {
+                    'path': '$postings'
+                }
+            }, {
+                '$project': {
+                    '_id': 0, 
+                    'path_id': '$postings.path_id'
+                }
+            }
+        ]
+        return [posting['path_id'] for posting in self.collection_postings.aggregate(pipeline, batchSize = BATCH_SIZE)]
 
 
     def get_docs(self):
@@ -519,19 +824,106 @@ class Query:
             - Snippet
         """
 
+        dict_docs = defaultdict(dict)
+        for path_id, doc in self.iter_docs():
+            dict_docs[path_id] = doc
+
+        return dict_docs
+
+
+    def iter_docs(self, batch_size: int = BATCH_SIZE):
+        """
+        This method is a generator of the (path ID, document) of all the documents with the
+        same items as get_docs, fetched batch_size documents at a time.
+        """
+
+        projection = { '_id': 0, 'path_id': 1, 'url': 1, 'page_rank': 1, 'title': 1, 'snippet': 1,
+                       'length': 1, 'field_lengths': 1 }
+        for path in stream(self.collection_docs.find({}, projection).batch_size(batch_size)):
+            doc = {'url':path.get('url'), 'page_rank': path.get('page_rank'), 'title': path.get('title'), 'snippet': path.get('snippet')}
+            # Lengths of the document and its fields (BM25 scorers)
+            if path.get('length') is not None:
+                doc['length'] = path.get('length')
+                doc['field_lengths'] = path.get('field_lengths')
+            yield path.get('path_id'), doc
+
+
+    def get_forward(self, paths: list):
+        """
+        This method gets the entries of the forward index (compressed text and token
+        offsets) for the given paths in a single query.
+        Returns a dictionary with the path ID as key and the entry as value.
+        """
+
+        cursor = self.collection_forward.find({ 'path_id': { '$in': paths }},
+                                              { '_id': 0, 'path_id': 1, 'text': 1, 'offsets': 1 })
+        return { entry['path_id']: entry for entry in cursor }
+
+    def index_version(self):
+        """
+        This method gets the current version of the index (None if the index was built
+        before the versions were recorded).
+        """
+
+        meta = self.collection_meta.find_one({ '_id': 'index' })
+        return meta.get('version') if meta else None
+
+
+    def get_length_totals(self, fields: list) -> dict:
+        """
+        This method adds up the lengths of the documents and of each of their fields (names
+        of the fields in the order of the stored lengths, see scoring.LENGTH_FIELDS), only of
+        the documents with lengths. Returns None if no document has them.
+        """
+
         pipeline = [
             {
-                '$project': {
-                    '_id': 0
+                '$match': {
+                    'length': { '$exists': True }
                 }
+            }, {
+                '$group': dict({
+                    '_id': None, 
+                    'documents': { '$sum': 1 }, 
+                    'length': { '$sum': '$length' }
+                }, **{ field: { '$sum': { '$arrayElemAt': ['$field_lengths', idx] }}
+                       for idx, field in enumerate(fields) })
             }
         ]
-        temp = list(self.collection_docs.aggregate(pipeline))
-        dict_docs = defaultdict(dict)
-        for path in temp:
-            dict_docs[path.get('path_id')] = {'url':path.get('url'), 'page_rank': path.get('page_rank'), 'title': path.get('title'), 'snippet': path.get('snippet')}
+        result = list(self.collection_docs.aggregate(pipeline))
+        if not result:
+            return None
+
+        totals = result[0]
+        totals['field_lengths'] = [totals.pop(field) for field in fields]
+        return totals
 
-        return dict_docs
+
+    def get_length_statistics(self):
+        """
+        This method gets the number of documents and the average lengths of the documents
+        and of their fields (None if they were not calculated).
+        """
+
+        return self.collection_meta.find_one({ '_id': 'lengths' })
+
+
+    def get_pairs_meta(self):
+        """
+        This method gets the table of the terms of the bi-gram pairs (position = term ID) and
+        the version of their blocks (None if the pairs were not built).
+        """
+
+        return self.collection_meta.find_one({ '_id': self.collection_pairs.name })
+
+
+    def get_pair_blocks(self, version: str):
+        """
+        This method is a generator of the blocks of bi-gram pairs of the given version in order.
+        """
+
+        cursor = self.collection_pairs.find({ 'version': version }, { '_id': 0, 'version': 0 }).sort('block', 1)
+        return stream(cursor.batch_size(1))
 
     def print_urls(self, term, limit):
         """
@@ -540,6 +932,9 @@ class Query:
         This was used for Milestone 1
         """
         
+        if self.dict_paths is None:
+            self.dict_paths = Corpus().dict_path
+
         # Saves the valid URL list to a text file
         try:
             with open('search_results.txt', 'a', encoding="utf-8") as file_results:
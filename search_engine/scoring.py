@@ -0,0 +1,112 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import math
+from weighting import FIELDS, WEIGHTS
+
+"""
+Probabilistic ranking models that can be chosen per search instead of the ltc.ltc cosine.
+
+    - BM25: saturation of the frequency of the term in the document (title + body),
+        normalized by the length of the document in terms over the average length.
+    - BM25F: the frequencies of the fields (title, body, headers, strong and anchor text)
+        are normalized by the length of each field and weighted (see weighting.WEIGHTS)
+        before the saturation.
+
+The lengths of the documents and of their fields are stored in the collection of documents
+at index time, and their averages (and the number of documents) in the collection of
+metadata, so the score of each posting is a closed-form calculation from its frequencies.
+"""
+
+SCORER_COSINE = 'cosine'    # ltc.ltc cosine similarity (see Search.retrieve_results)
+SCORER_BM25 = 'bm25'        # BM25 over the title and the body
+SCORER_BM25F = 'bm25f'      # BM25F over all the weighted fields
+SCORERS = (SCORER_COSINE, SCORER_BM25, SCORER_BM25F)
+DEFAULT_SCORER = os.environ.get('GUGOL_SCORER', SCORER_COSINE)  # Scorer of the searches that don't choose one
+
+K1 = 1.2                    # Saturation of the frequency of the terms
+B = 0.75                    # Normalization by the length of the document (0 for none, 1 for full)
+
+LENGTH_FIELDS = ('title', 'body') + FIELDS[1:]  # Order of the lengths of the fields of the documents
+
+
+def field_lengths(tokens: 'Dict{field: List}') -> list:
+    """
+    Returns the length (number of tokens) of each of the LENGTH_FIELDS of a document.
+    """
+
+    return [len(tokens.get(field) or []) for field in LENGTH_FIELDS]
+
+
+def term_frequencies(natural_freq: int, fields: list = None) -> list:
+    """
+    Returns the frequency of a term in each of the LENGTH_FIELDS of a document from its
+    natural frequency (title + body) and its frequency in the weighted fields.
+    """
+
+    fields = fields or [0] * len(FIELDS)
+    return [fields[0], natural_freq - fields[0]] + list(fields[1:])
+
+
+class BM25:
+    """
+    BM25 scorer. The statistics of the lengths are the number of documents of the index,
+    the average length of the documents and the average length of each field.
+    """
+
+    def __init__(self, statistics: dict, k1: float = K1, b: float = B):
+        self.documents = statistics['documents']
+        self.avg_length = statistics['avg_length'] or 1
+        self.avg_field_lengths = [value or 1 for value in statistics['avg_field_lengths']]
+        self.k1 = k1
+        self.b = b
+
+
+    def idf(self, idf: float) -> float:
+        """
+        Converts the IDF of the index (log10 of the number of documents over the postings
+        count, see main.calculate_scores) to the IDF of BM25. The postings count is taken
+        from the IDF because the one of the dictionary belongs to the shard.
+        """
+
+        df = self.documents / math.pow(10, idf)
+        return math.log(1 + (self.documents - df + 0.5) / (df + 0.5))
+
+
+    def score(self, natural_freq: int, fields: list, doc: dict) -> float:
+        """
+        Score of a posting of the term in the document (without the IDF).
+        """
+
+        length = doc.get('length') or self.avg_length
+        norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+        return natural_freq * (self.k1 + 1) / (natural_freq + norm)
+
+
+class BM25F(BM25):
+    """
+    BM25F scorer: the normalized frequencies of the fields are weighted and added up
+    before the saturation.
+    """
+
+    def __init__(self, statistics: dict, k1: float = K1, b: float = B, weights: dict = WEIGHTS):
+        super().__init__(statistics, k1, b)
+        self.weights = [weights[field] for field in LENGTH_FIELDS]
+
+
+    def score(self, natural_freq: int, fields: list, doc: dict) -> float:
+        """
+        Score of a posting of the term in the document (without the IDF).
+        """
+
+        lengths = doc.get('field_lengths') or self.avg_field_lengths
+        frequency = 0
+        for tf, weight, length, avg_length in zip(term_frequencies(natural_freq, fields), self.weights,
+                                                  lengths, self.avg_field_lengths):
+            if tf:
+                frequency += weight * tf / (1 - self.b + self.b * length / avg_length)
+
+        return frequency * (self.k1 + 1) / (frequency + self.k1)
@@ -5,14 +5,26 @@
 
 import json
 import math
-from pymongo import MongoClient
+import heapq
 from pprint import pprint
 from time import perf_counter
-from preprocessing import Preprocessing
+from analyzer import Analyzer
 from query import Query
+from database import INDEX_LAYOUT, LAYOUT_BUCKETS
+from storage import ORDER_SCORE
 from collections import defaultdict
+import forward_index
+from metrics import metrics, COUNT_BUCKETS
+from suggest import Suggester
+from spelling import SpellChecker
+from postings import PostingsList, PostingsCache, CACHE_MAX_POSTINGS, intersect, merge
+from corpus import path_sort_key
+from quantize import QuantizedIndex, QUANTIZED
+from bigrams import BigramIndex
+from scoring import BM25, BM25F, SCORER_BM25, SCORER_BM25F, DEFAULT_SCORER
+import snapshot
+import threading
 
-DB_NAME = 'project3db'
 PR_MULTIPLIER = 20          # Page rank multiplier that will add the value to the final score
                             # (0 for no effect, 10 for low, 25 for medium and > 100 for high)
 
@@ -21,32 +33,117 @@ BIGRAM_MULTIPLIER = 0.5     # Bi-gram multiplier alpha that will determine how m
 
 RESULTS_DISPLAYED = 20      # Number of results that are returned
 
+TOP_K = 10 * RESULTS_DISPLAYED  # Minimum number of ranked results if the evaluation stops early
+                                # (single-term queries over impact-ordered postings)
+
+SNIPPET_MAX = 350           # The maximum number of characters for the query dependent snippet
+
+# Matching modes of the query terms
+MODE_OR = 'or'              # Documents that contain at least 1 of the terms (ranked by terms matched)
+MODE_AND = 'and'            # Only the documents that contain every term
+MODE_AUTO = 'auto'          # AND if the union of the postings is large (OR if no document has every term)
+MODES = (MODE_OR, MODE_AND, MODE_AUTO)
+
+AUTO_AND_POSTINGS = 20000   # Total postings of the query terms from which the auto mode uses AND
+
 class Search:
     """
     This class is responsible for handling all user based searches and
     retrieving the top ranked results from the Mongo DB database
     """
 
-    def __init__(self):
-        # MongoDB initialization
-        self.client = MongoClient("localhost", 27017)
-        self.db = self.client[DB_NAME]
-
+    def __init__(self, layout: str = INDEX_LAYOUT, snapshot_path: str = snapshot.SNAPSHOT_PATH, shard: int = None,
+                 quantized: bool = QUANTIZED):
         # Initialization of other modules
-        self.p = Preprocessing()
-        self.q = Query()
+        # (MongoDB is accessed through the shared client of the data-access layer)
+        # The analyzer only has the query-time analysis (no indexing toolchain)
+        # WordNet is loaded in the background by warm_up
+        # If the shard is given, it only searches the documents of that shard (see sharding)
+        self.p = Analyzer()
+        # The postings of the queried terms are kept in an LRU cache (GUGOL_POSTINGS_CACHE)
+        self.q = Query(layout, routed = True, shard = shard,
+                       cache = PostingsCache() if CACHE_MAX_POSTINGS else None)
+        self.shard = shard
+        snapshot_path = snapshot.shard_path(snapshot_path, shard)
 
         # Cached data
         self.cached_dict = defaultdict(dict)    # Dictionary containing all the possible terms
+        self.cached_docs = {}                   # Dictionary containing all paths, mappings to URLs,
+                                                # pagerank, title, and snippet for each document
+
+        # The caches are restored from the snapshot if it was taken from the current version
+        # of the index and the same layout, otherwise they are loaded from MongoDB and a new
+        # snapshot is written
+        index_version = self.q.index_version()
+        cached = snapshot.load(index_version, snapshot_path, layout) if index_version else None
+        if cached:
+            self.cached_dict, self.cached_docs = cached
+        else:
+            self.cached_docs = self.q.get_docs()
+            self.load_dict()
+            if index_version:
+                snapshot.save(index_version, self.cached_dict, self.cached_docs, snapshot_path, layout)
 
-        self.cached_docs = self.q.get_docs()    # Dictionary containing all paths, mappings to URLs,
-        self.load_dict()                        # pagerank, title, and snippet for each document
-        
-    def retrieve_results(self, search: str) -> list:
+        # Dense document IDs (in path order) used by the intersection of the postings
+        self.doc_paths = sorted(self.cached_docs, key = path_sort_key)
+        self.doc_ids = { path: idx for idx, path in enumerate(self.doc_paths) }
+
+        # Quantized impact scores of the terms, served from memory instead of MongoDB
+        # (None if they are disabled or were not built for the current version of the index)
+        self.impacts = QuantizedIndex.load(self.q) if quantized else None
+
+        # Postings of the bi-grams keyed by pairs of term IDs (None if they were not built)
+        self.bigrams = BigramIndex.load(self.q)
+
+        # BM25 scorers, from the lengths of the documents (none if the lengths were not stored)
+        lengths = self.q.get_length_statistics()
+        self.scorers = {SCORER_BM25: BM25(lengths), SCORER_BM25F: BM25F(lengths)} if lengths else {}
+
+        # Highest page rank, used to bound the scores of the postings not read yet
+        self.max_page_rank = max((doc.get('page_rank') or 0 for doc in self.cached_docs.values()), default = 0)
+
+        # Prefix structure for the autocomplete and deletion index for the spelling
+        # corrections. Built in the background (None until they are ready)
+        self.suggester = None
+        self.spelling = None
+        threading.Thread(target = self.warm_up, daemon = True).start()
+
+
+    def warm_up(self):
+        """
+        This method loads WordNet and builds the structures derived from the dictionary
+        of terms, so the API can start serving before they are ready.
+        """
+
+        self.p.preload()
+        self.suggester = Suggester(self.cached_dict)
+        self.spelling = SpellChecker(self.cached_dict)
+
+
+    def analyze(self, search: str) -> '(List[(token, index)], Dict{term: [frequency, [indexes]]}, Dict{pair: frequency})':
+        """
+        This method analyzes the search the same way the documents are analyzed by the
+        indexing (see Preprocessing): tokens with their positional index, word frequency
+        of the lemmatized terms and frequency of the bi-grams.
+        """
+
+        list_tokens = self.p.tokenize_span(search)
+        return list_tokens, self.p.word_frequency(list_tokens), self.p.bigram_freq(search)
+
+
+    def retrieve_results(self, search: str, mode: str = MODE_OR, k: int = TOP_K, scorer: str = DEFAULT_SCORER) -> list:
         """
         This method is responsible for getting all the results for the search terms
         by using MongoDB's aggregation pipelines where it will query the results using
         an OR statement.
+        With the AND mode (or the auto mode for large unions of postings) the postings of
+        the terms are intersected first and only the documents with every term are scored.
+        If the postings of a single-term query are impact-ordered (buckets sorted by TF-IDF),
+        the reading stops once the rest of the postings can't enter the top k, and only the
+        results whose rank is exact are returned (at least k of them).
+        With the BM25 or BM25F scorer, the documents are ranked with the probabilistic model
+        instead of the cosine (see score_probabilistic), and falls back to the cosine if the
+        lengths of the documents were not stored.
 
         MongoDB Aggregation/Pipeline (From Query: get_doc_length_tf_idf):
         -   Finds documents that match with at least 1 of the terms and will sum the number
@@ -65,13 +162,19 @@ class Search:
         # Start the stopwatch to measure the time it takes to retrieve the result
         # It is used in the front-end to show the user how fast it was. 
         total_start = perf_counter()
+        stage = total_start
 
-        list_tokens = self.p.tokenize_span(search)
-        word_freq = self.p.word_frequency(list_tokens)
-        bigram_freq = self.p.bigram_freq(search)
+        # Postings of the terms: quantized scores in memory, or float scores from MongoDB
+        source = self.impacts if self.impacts is not None else self.q
+
+        list_tokens, word_freq, bigram_freq = self.analyze(search)
+        stage = metrics.stage('analysis', stage)
 
         search_lemmatized = search.split(" ")      # The search words in lemmatized form
 
+        did_you_mean = self.correct_spelling(search, list_tokens) if self.spelling else None
+        stage = metrics.stage('spelling', stage)
+
         # Nested dictionary
         dict_query = defaultdict(dict)
         
@@ -99,10 +202,34 @@ class Search:
         for term in dict_query.values():
             if term.get('tf_idf'):
                 term['cosine_sim'] = term['tf_idf'] / query_length
+        stage = metrics.stage('query_weights', stage)
+
+        # Documents that contain every term (None if the query is an OR)
+        paths = None
+        if len(word_freq) > 1 and mode != MODE_OR:
+            total_postings = sum(self.cached_dict[term].get('postings_count', 0)
+                                 for term in word_freq if term in self.cached_dict)
+            if mode == MODE_AND or total_postings > AUTO_AND_POSTINGS:
+                paths = self.conjunctive_paths(list(word_freq), source)
+                stage = metrics.stage('intersection', stage)
+                # The auto mode falls back to OR if no document has every term
+                if not paths and mode == MODE_AUTO:
+                    paths = None
+
+        # BM25 scorer (None for the cosine)
+        model = self.scorers.get(scorer)
+
+        # Single-term queries over impact-ordered postings don't need the doc length
+        early_termination = model is None and len(list_tokens) == 1 and self.impact_ordered(word_freq)
+        bound = None    # Upper bound of the scores of the documents that were not read
 
         # Fetch the data from MongoDB by using the aggregation pipeline
         # Sorted by TF-IDF in descending order, includes doc length
-        doc_length = self.q.get_doc_length_tf_idf(list(word_freq.keys()))
+        doc_length = []
+        if model is None and not early_termination and (paths is None or paths):
+            doc_length = source.get_doc_length_tf_idf(list(word_freq.keys()), paths)
+            # Only recorded when the aggregation runs (not with early termination or BM25)
+            stage = metrics.stage('mongo_doc_length', stage)
         # doc_length = self.q.get_doc_length_tf(list(word_freq.keys()))
 
         final_result = []
@@ -110,48 +237,35 @@ class Search:
         # If the search query is just 1 word, it means that the cosine similarity for the document is not calculated,
         # because the result would always be 1. It is multiplied by the query's IDF (It says cosine similarity,
         # but the rest of the values like query_length and TF would always be 1 since it is only 1 word)
-        if len(list_tokens) == 1:
+        if early_termination:
+            final_result, bound = self.top_single_term(next(iter(word_freq)), k)
+            stage = metrics.stage('mongo_impact_buckets', stage)
+
+        elif model is not None:
+            final_result = self.score_probabilistic(word_freq, paths, model)
+            stage = metrics.stage('mongo_term_frequencies', stage)
+
+        elif len(list_tokens) == 1:
             # Score calcualtion with TF-IDF of the document and IDF of the query
             for path in doc_length:
                 final_result.append([path['_id'], (path['tf_idf']) ])
 
         # If the search is more than 1 word
         else:
-            # Nested dictionary for storing the scores of each term
-            # (key = term, value = {nested dict containing tf_idf, etc})
-            term_doc_dict = defaultdict(dict)
-            # Fetch scores from MongoDB inverted index postings for each term
-            for term in word_freq:
-                term_doc_dict[term] = self.q.get_term_postings(term)
-
-            # Nested dictionary for the bi-gram version
-            bigram_doc_dict = defaultdict(dict)
-            for bigram in bigram_freq:
-                bigram_doc_dict[bigram] = self.q.get_bigram_postings(bigram)
+            # Fetch the (path ID, TF-IDF) pairs from MongoDB inverted index postings for each term
+            term_postings = [source.get_term_impacts(term, paths) for term in word_freq]
+            stage = metrics.stage('mongo_term_postings', stage)
+
+            # Postings of the bi-gram version (from memory)
+            bigram_postings = []
+            if self.bigrams is not None:
+                bigram_postings = [self.bigrams.get_term_impacts(pair, paths) for pair in bigram_freq]
+            stage = metrics.stage('bigram_postings', stage)
 
             # Score calculation for each of the documents it found the query terms
-            for path in doc_length:
-                score = 0
-                proximity_score = 0
-                merged_idx = []
-                # Will loop through each of the search terms and calculate the product between
-                # the cosine similarity of the query and the cosine similarity of the document
-                for term, values in term_doc_dict.items():
-                    if path.get('_id') in values:
-                        cosine_query = dict_query.get(term).get('cosine_sim')
-                        cosine_doc = values.get(path.get('_id')).get('tf_idf') / path.get('len')
-                        score += cosine_query * cosine_doc
-
-                        # Positional index proximity
-                        # merged_idx.append(values.get(path.get('_id')).get('positional_idx'))
-
-                # Score calculation for the bi-gram version (Only uses TF-IDF)
-                for bigram, values in bigram_doc_dict.items():
-                    if path.get('_id') in values:
-                        # Add weighted bigram to final score
-                        score = (score * (1 - BIGRAM_MULTIPLIER)) + (values.get(path.get('_id')).get('tf_idf') * BIGRAM_MULTIPLIER)
-                    
-                final_result.append([path['_id'], score])
+            final_result = self.score_documents(doc_length, [dict_query[term].get('cosine_sim') for term in word_freq],
+                                                term_postings, bigram_postings)
+        stage = metrics.stage('score_combination', stage)
 
         # Page rank adjustment/tiebreaker by using the PR Multiplier
         # Loops through all the pages in the results to add in the page rank score
@@ -159,33 +273,231 @@ class Search:
             if 'page_rank' in self.cached_docs.get(final_result[i][0]):
                 page_rank = self.cached_docs.get(final_result[i][0]).get('page_rank') * PR_MULTIPLIER
                 final_result[i][1] += page_rank
+        stage = metrics.stage('page_rank', stage)
 
         # Sort all the adjusted results again as page rank could have potentially changed the ranks
         sorted_results = sorted(final_result, key = lambda x: x[1], reverse = True)
+        number_results = len(sorted_results)
+
+        # With early termination, only the documents that score above the bound have their
+        # final rank (the number of results is the number of documents with the term)
+        if early_termination:
+            number_results = self.cached_dict[next(iter(word_freq))].get('postings_count', number_results)
+            if bound is not None:
+                sorted_results = [result for result in sorted_results if result[1] > bound]
+        total_stop = metrics.stage('sort', stage)
+
+        metrics.observe('gugol_query_stage_seconds', total_stop - total_start, 'total')
+        metrics.observe('gugol_query_postings', sum(self.cached_dict[term].get('postings_count', 0)
+                        for term in word_freq if term in self.cached_dict), buckets = COUNT_BUCKETS)
+        metrics.observe('gugol_query_candidates', len(final_result), buckets = COUNT_BUCKETS)
+        metrics.increment('gugol_queries_total')
 
         # Stops the stopwatch/timer for calculating the query speed. Rounds to 2 decimals. 
-        total_stop = perf_counter()
         query_speed = round(total_stop-total_start, 2)
         print("Query timer in seconds: {}".format(query_speed)) 
 
-        return (sorted_results, len(sorted_results), query_speed, search_lemmatized)
+        return (sorted_results, number_results, query_speed, search_lemmatized, did_you_mean)
+
 
-    def construct_results(self, results: list, start: int) -> 'List of dictionaries': 
+    def impact_ordered(self, word_freq: dict) -> bool:
+        """
+        This method checks if the postings of the (only) query term are stored in buckets
+        sorted by TF-IDF in descending order (see migrate_buckets --order score).
+        """
+
+        if self.q.layout != LAYOUT_BUCKETS or len(word_freq) != 1 or self.impacts is not None:
+            return False
+        return self.cached_dict.get(next(iter(word_freq)), {}).get('order') == ORDER_SCORE
+
+
+    def top_single_term(self, term: str, k: int) -> '(List[[path, tf_idf]], bound)':
+        """
+        This method reads the impact-ordered buckets of the term until the remaining postings
+        can't change the top k (threshold algorithm): the postings of the following buckets
+        have a TF-IDF lower or equal to the last one read, so no document that was not read can
+        score more than that TF-IDF plus the highest page rank adjustment.
+        Returns the [path, tf_idf] of the documents read and the bound of the score of the
+        documents that were not read (None if all the postings were read).
+        """
+
+        max_page_rank = self.max_page_rank * PR_MULTIPLIER
+        final_result = []
+        top_scores = []     # Min-heap of the k highest scores (with the page rank)
+
+        buckets = self.q.get_impact_buckets(term)
+        for bucket in buckets:
+            if not bucket.get('postings'):
+                continue
+            for posting in bucket['postings']:
+                final_result.append([posting['path_id'], posting['tf_idf']])
+                page_rank = (self.cached_docs.get(posting['path_id']) or {}).get('page_rank') or 0
+                score = posting['tf_idf'] + page_rank * PR_MULTIPLIER
+                if len(top_scores) < k:
+                    heapq.heappush(top_scores, score)
+                elif score > top_scores[0]:
+                    heapq.heapreplace(top_scores, score)
+
+            bound = posting['tf_idf'] + max_page_rank
+            if len(top_scores) >= k and top_scores[0] > bound:
+                buckets.close()
+                return final_result, bound
+
+        return final_result, None
+
+
+    def score_documents(self, doc_length: list, weights: list, term_postings: list, bigram_postings: list) -> list:
+        """
+        This method calculates the score of the candidate documents (doc_length) of a multi-word
+        query document-at-a-time: the postings of all the terms and bi-grams are merged in order
+        of the document IDs and the score of each document is accumulated in one step.
+            - Terms: the product between the cosine similarity of the query (weights) and the
+                cosine similarity of the document (TF-IDF / doc length).
+            - Bi-grams: weighted with the regular score by using the BIGRAM_MULTIPLIER (Only uses TF-IDF).
+        The contributions are added in the same order as the terms and bi-grams of the query, so
+        the scores are the same as adding them term by term.
+        Returns a list of [path, score] in the order of the candidates.
+        """
+
+        lengths = { self.doc_ids[path['_id']]: path['len'] for path in doc_length if path['_id'] in self.doc_ids }
+        num_terms = len(term_postings)
+
+        # Postings by the dense document IDs (stored postings are already in path order)
+        postings = []
+        for pairs in term_postings + bigram_postings:
+            postings.append([(self.doc_ids[path], tf_idf) for path, tf_idf in dict(pairs).items()
+                             if path in self.doc_ids])
+
+        scores = {}
+        current = None
+        for doc, idx, tf_idf in merge(postings):
+            if doc != current:
+                if current is not None:
+                    scores[current] = score
+                current = doc
+                length = lengths.get(doc)
+                score = 0
+            if length is None:
+                continue
+            if idx < num_terms:
+                score += weights[idx] * (tf_idf / length)
+            else:
+                # Add weighted bigram to final score
+                score = (score * (1 - BIGRAM_MULTIPLIER)) + (tf_idf * BIGRAM_MULTIPLIER)
+        if current is not None:
+            scores[current] = score
+
+        return [[path['_id'], scores.get(self.doc_ids.get(path['_id']), 0)] for path in doc_length]
+
+
+    def score_probabilistic(self, word_freq: dict, paths: list, model: BM25) -> list:
+        """
+        This method calculates the BM25 (or BM25F) score of the documents with at least one
+        of the query terms (or of the given paths): for each posting of each term, the IDF of
+        the term times the saturated frequency normalized by the stored lengths of the document,
+        multiplied by the frequency of the term in the query.
+        Returns a list of [path, score] in the order the documents were found.
+        """
+
+        if paths is not None and not paths:
+            return []
+
+        scores = {}
+        for term, freq in word_freq.items():
+            if term not in self.cached_dict:
+                continue
+            weight = freq[0] * model.idf(self.cached_dict[term].get('idf') or 0)
+            for path, natural_freq, fields in self.q.get_term_frequencies(term, paths):
+                doc = self.cached_docs.get(path)
+                if doc is None:
+                    continue
+                scores[path] = scores.get(path, 0) + weight * model.score(natural_freq, fields, doc)
+
+        return [[path, score] for path, score in scores.items()]
+
+
+    def conjunctive_paths(self, terms: list, source) -> list:
+        """
+        This method intersects the postings of the terms, starting with the rarest ones,
+        and returns the paths of the documents that contain every term. The candidates
+        drive a galloping intersection with the sorted document IDs of each term (see
+        postings.intersect), and it stops as soon as the intersection is empty, so the
+        postings of the remaining terms are not fetched. With the bucketed layout, only
+        the buckets whose range of documents holds a candidate are read for the terms after
+        the rarest one. The postings are read from the source (Query or QuantizedIndex).
+        """
+
+        if any(term not in self.cached_dict for term in terms):
+            return []
+
+        terms = sorted(terms, key = lambda term: self.cached_dict[term].get('postings_count', 0))
+        candidates = None
+        for term in terms:
+            paths = None if candidates is None else [self.doc_paths[idx] for idx in candidates.doc_ids]
+            postings = PostingsList(self.doc_ids[path] for path in source.get_term_paths(term, paths)
+                                    if path in self.doc_ids)
+            candidates = postings if candidates is None else PostingsList(intersect([candidates, postings]))
+            if not len(candidates):
+                return []
+
+        return [self.doc_paths[idx] for idx in candidates.doc_ids]
+
+
+    def correct_spelling(self, search: str, list_tokens: list) -> str:
+        """
+        This method builds the "did you mean" suggestion of the search by replacing the
+        words whose lemma is not part of the dictionary with their spelling correction.
+        Returns None if none of the words could be corrected.
+        """
+
+        corrected = search.lower()
+        changed = False
+
+        # Replaces from the end so the positional index of the previous tokens stays valid
+        for (token, idx), (lemma, _) in reversed(list(zip(list_tokens, self.p.lemmatize_span(list_tokens)))):
+            if lemma in self.cached_dict:
+                continue
+            correction = self.spelling.correct(token)
+            if correction and correction != token:
+                corrected = corrected[:idx] + correction + corrected[idx + len(token):]
+                changed = True
+
+        return corrected if changed else None
+
+    def construct_results(self, results: list, start: int, terms: list = None) -> 'List of dictionaries': 
         """
         This method will construct the results in a way that can be read in JSON for the api.
         It will paginate the results by only returning 20 results at a time using the 'start'
         argument as the starting point of the next 20 results.
+        If the query terms are given, the snippet is generated from the forward index by
+        choosing the window of the text with the most query terms (falls back to the stored
+        snippet if none of the terms are found).
         Returns a list of dictionaries containing the url, title, and the snippet of the document/page.
         """
 
+        stage = perf_counter()
         paginated_results = results[start:start+RESULTS_DISPLAYED]
         complete_result = []
 
+        # Fetches the forward index entries of the displayed results in a single query
+        forward = {}
+        if terms:
+            terms = set(term.lower() for term in terms)
+            forward = self.q.get_forward([page[0] for page in paginated_results])
+            stage = metrics.stage('mongo_forward', stage)
+
         for page in paginated_results:
+            snippet = ''
+            if page[0] in forward:
+                snippet = forward_index.query_snippet(forward[page[0]], terms, SNIPPET_MAX)
+            if not snippet:
+                snippet = self.cached_docs.get(page[0]).get('snippet')
+
             complete_result.append({'url':self.cached_docs.get(page[0]).get('url'),
                                     'title':self.cached_docs.get(page[0]).get('title'),
-                                    'snippet':self.cached_docs.get(page[0]).get('snippet')})
-        
+                                    'snippet':snippet})
+
+        metrics.stage('construct_results', stage)
         return complete_result
 
 
@@ -196,10 +508,13 @@ class Search:
         query and the document.
         """
         
-        list_terms = self.q.get_dict_without_postings()
-        for term in list_terms:
+        # Streamed from MongoDB, only the dictionary is kept in memory
+        for term in self.q.iter_dict_without_postings():
             self.cached_dict[term['term']]['idf'] = term['idf']
             self.cached_dict[term['term']]['postings_count'] = term['postings_count']
+            # Order of the postings (bucketed layout)
+            if term.get('order'):
+                self.cached_dict[term['term']]['order'] = term['order']
 
 
 
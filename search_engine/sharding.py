@@ -0,0 +1,303 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import argparse
+import ipaddress
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from multiprocessing import Process
+from multiprocessing.connection import Listener, Client
+from time import perf_counter
+from database import INDEX_LAYOUT, LAYOUT_FLAT, LAYOUT_BUCKETS, NUM_SHARDS, shard_of
+from search import Search, RESULTS_DISPLAYED, MODE_OR
+from scoring import DEFAULT_SCORER
+from metrics import metrics
+
+"""
+Scatter-gather search over a document-partitioned index (see main.py --shards).
+
+Every shard has its own collections of terms, bi-grams, documents and forward index, with
+the IDF calculated from the global statistics of all the shards, so the score of a document
+is the same in its shard as in an index without shards.
+    - Shard worker: a process (local or on another host) with the Search of one shard, that
+        answers the requests of the coordinator through a multiprocessing connection.
+    - Coordinator: sends the query to every shard at the same time and merges the top-k
+        results of each shard (already sorted by score) into the global ranking. It has the
+        same interface as Search, so the API can use either of them.
+
+To try it on one machine:
+    python sharding.py local --shards 4
+    GUGOL_SHARD_ADDRESSES=localhost:6100,localhost:6101,localhost:6102,localhost:6103 python api.py
+
+The messages of the connections are pickled, and unpickling a message can run any code, so
+only peers that know the shared key (GUGOL_SHARD_AUTHKEY) can connect. There is no default key:
+the workers and the coordinator refuse to start without GUGOL_SHARD_AUTHKEY unless every
+address is a loopback address (localhost, 127.0.0.0/8, ::1), where a local key is used.
+"""
+
+SHARD_ADDRESSES = os.environ.get('GUGOL_SHARD_ADDRESSES')   # host:port of each shard (in order of the shards)
+AUTHKEY = os.environ.get('GUGOL_SHARD_AUTHKEY')    # Shared key of the connections (required off loopback)
+LOOPBACK_AUTHKEY = b'gugol-loopback'    # Key of the connections on loopback addresses without GUGOL_SHARD_AUTHKEY
+BASE_PORT = 6100            # Port of the first shard worker started by the local launcher
+TOP_K = 1000                # Number of results returned by each shard (results that can be paginated)
+
+
+def parse_addresses(addresses: str) -> 'List[(host, port)]':
+    """
+    Parses the list of addresses of the shard workers (host:port separated by commas).
+    """
+
+    parsed = []
+    for address in addresses.split(','):
+        host, port = address.strip().rsplit(':', 1)
+        parsed.append((host, int(port)))
+
+    return parsed
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Checks if the host is a loopback address (only reachable from this machine).
+    """
+
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def shard_authkey(address: tuple) -> bytes:
+    """
+    Returns the key of the connections to or from the address. Raises ValueError if
+    GUGOL_SHARD_AUTHKEY is not set and the address is not a loopback address.
+    """
+
+    if AUTHKEY:
+        return AUTHKEY.encode('utf-8')
+    if is_loopback(address[0]):
+        return LOOPBACK_AUTHKEY
+    raise ValueError("GUGOL_SHARD_AUTHKEY must be set to use the shard address {}:{} "
+                     "(only loopback addresses work without it)".format(*address))
+
+
+def serve(shard: int, address: tuple, layout: str = INDEX_LAYOUT):
+    """
+    Runs the worker of the shard: loads the Search of the shard and answers the requests
+    of the coordinators (one thread per connection). Refuses to start without
+    GUGOL_SHARD_AUTHKEY unless the address is a loopback address.
+    """
+
+    authkey = shard_authkey(address)
+    search = Search(layout, shard = shard)
+    listener = Listener(address, authkey = authkey)
+    print("Shard {} listening on {}:{}".format(shard, *address))
+
+    while True:
+        connection = listener.accept()
+        threading.Thread(target = handle, args = (search, connection), daemon = True).start()
+
+
+def handle(search: Search, connection):
+    """
+    Answers the requests of a coordinator until it closes the connection. Requests are
+    tuples with the operation and its arguments:
+        - ('retrieve', query, mode, k, scorer) : top k results, number of results, lemmatized
+            search and spelling correction of the shard
+        - ('construct', paths, terms) : url, title and snippet of the documents of the shard
+        - ('suggest', prefix, limit) : autocomplete of the prefix
+    """
+
+    with connection:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                return
+
+            operation = request[0]
+            try:
+                if operation == 'retrieve':
+                    _, query, mode, k, scorer = request
+                    results, count, _, search_lemmatized, did_you_mean = search.retrieve_results(query, mode, k, scorer)
+                    response = (results[:k], count, search_lemmatized, did_you_mean)
+                elif operation == 'construct':
+                    _, paths, terms = request
+                    response = search.construct_results([[path, 0] for path in paths], 0, terms)
+                elif operation == 'suggest':
+                    _, prefix, limit = request
+                    response = search.suggester.suggest_query(prefix, limit) if search.suggester else []
+                else:
+                    raise ValueError("Unknown operation: {}".format(operation))
+                connection.send(('ok', response))
+            except Exception as e:
+                connection.send(('error', repr(e)))
+
+
+def start_local(num_shards: int, base_port: int = BASE_PORT, layout: str = INDEX_LAYOUT) -> 'List[Process]':
+    """
+    Starts a worker process for each shard on this machine (ports base_port, base_port + 1, ...).
+    """
+
+    processes = []
+    for shard in range(num_shards):
+        process = Process(target = serve, args = (shard, ('localhost', base_port + shard), layout), daemon = True)
+        process.start()
+        processes.append(process)
+
+    return processes
+
+
+class ShardClient:
+    """
+    Connection of the coordinator to a shard worker. Requests through the same connection
+    are serialized, and the connection is opened again if it was closed.
+    """
+
+    def __init__(self, address: tuple):
+        self.address = address
+        self.authkey = shard_authkey(address)
+        self.connection = None
+        self.lock = threading.Lock()
+
+
+    def request(self, *message):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.connection is None:
+                        self.connection = Client(self.address, authkey = self.authkey)
+                    self.connection.send(message)
+                    status, response = self.connection.recv()
+                    break
+                except (EOFError, OSError):
+                    self.connection = None
+                    if attempt:
+                        raise
+
+        if status == 'error':
+            raise RuntimeError("Shard {}:{} failed: {}".format(*self.address, response))
+        return response
+
+
+class Coordinator:
+    """
+    This class is responsible for the scatter-gather of the searches over the shard workers.
+    Has the same interface as Search (retrieve_results, construct_results, suggester).
+    Refuses to start without GUGOL_SHARD_AUTHKEY unless every shard is on a loopback address.
+    """
+
+    def __init__(self, addresses: 'List[(host, port)] or str' = SHARD_ADDRESSES, top_k: int = TOP_K):
+        if isinstance(addresses, str):
+            addresses = parse_addresses(addresses)
+        self.shards = [ShardClient(address) for address in addresses]
+        self.top_k = top_k
+        self.executor = ThreadPoolExecutor(len(self.shards))
+        # The autocomplete is also answered by the shards (see suggest_query)
+        self.suggester = self
+
+
+    def scatter(self, shards: list, *message) -> list:
+        """
+        Sends the request to the shards at the same time and returns their responses.
+        """
+
+        return list(self.executor.map(lambda shard: shard.request(*message), shards))
+
+
+    def retrieve_results(self, search: str, mode: str = MODE_OR, k: int = None, scorer: str = DEFAULT_SCORER) -> tuple:
+        """
+        This method sends the search to every shard and merges the top-k results of the
+        shards (sorted by score in descending order) into the global ranking.
+        Returns the same tuple as Search.retrieve_results.
+        """
+
+        total_start = perf_counter()
+        k = max(k or 0, self.top_k)
+        responses = self.scatter(self.shards, 'retrieve', search, mode, k, scorer)
+        stage = metrics.stage('scatter_gather', total_start)
+
+        merged = heapq.merge(*[response[0] for response in responses], key = lambda x: x[1], reverse = True)
+        results = list(islice(merged, k))
+
+        # If a shard returned only part of its results, the documents it didn't return score
+        # at most as its last result, so the merged ranking is only exact down to that score
+        cutoff = max((response[0][-1][1] for response in responses
+                      if response[0] and len(response[0]) < response[1]), default = None)
+        if cutoff is not None:
+            results = [result for result in results if result[1] >= cutoff]
+        total_stop = metrics.stage('merge', stage)
+
+        count = sum(response[1] for response in responses)
+        search_lemmatized = responses[0][2]
+        did_you_mean = next((response[3] for response in responses if response[3]), None)
+        query_speed = round(total_stop - total_start, 2)
+
+        return (results, count, query_speed, search_lemmatized, did_you_mean)
+
+
+    def construct_results(self, results: list, start: int, terms: list = None) -> 'List of dictionaries':
+        """
+        This method gets the url, title and snippet of the displayed results from the
+        shards that have the documents.
+        """
+
+        paginated_results = results[start:start+RESULTS_DISPLAYED]
+
+        # Paths of the displayed results grouped by shard (shard_of is None with 1 shard)
+        partitions = {}
+        for page in paginated_results:
+            partitions.setdefault(shard_of(page[0], len(self.shards)) or 0, []).append(page[0])
+
+        items = list(partitions.items())
+        responses = self.executor.map(lambda item: self.shards[item[0]].request('construct', item[1], terms), items)
+        constructed = {}
+        for (shard, paths), response in zip(items, responses):
+            constructed.update(zip(paths, response))
+
+        return [constructed[page[0]] for page in paginated_results]
+
+
+    def suggest_query(self, prefix: str, limit: int = None) -> list:
+        """
+        This method merges the completions of the shards (in order of the shards'
+        rankings, without duplicates).
+        """
+
+        suggestions = []
+        for completions in zip(*self.scatter(self.shards, 'suggest', prefix, limit)):
+            for completion in completions:
+                if completion not in suggestions:
+                    suggestions.append(completion)
+
+        return suggestions[:limit] if limit else suggestions
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Runs the shard workers of a sharded index.")
+    parser.add_argument('command', choices = ['worker', 'local'],
+                        help = "worker: runs the worker of one shard, local: runs all the workers on this machine")
+    parser.add_argument('--shard', type = int, default = 0, help = "Shard of the worker")
+    parser.add_argument('--shards', type = int, default = NUM_SHARDS, help = "Number of shards (local)")
+    parser.add_argument('--host', default = 'localhost', help = "Host of the worker")
+    parser.add_argument('--port', type = int, default = BASE_PORT, help = "Port of the worker (first port if local)")
+    parser.add_argument('--layout', choices = [LAYOUT_FLAT, LAYOUT_BUCKETS], default = INDEX_LAYOUT,
+                        help = "Storage layout of the postings of the terms")
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        try:
+            shard_authkey((args.host, args.port))
+        except ValueError as e:
+            parser.error(str(e))
+        serve(args.shard, (args.host, args.port), args.layout)
+    else:
+        for process in start_local(args.shards, args.port, args.layout):
+            process.join()
@@ -0,0 +1,106 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import pickle
+import struct
+
+SNAPSHOT_PATH = os.environ.get('GUGOL_SNAPSHOT', 'search_snapshot.bin')  # File of the snapshot
+MAGIC = b'GUGOLSNP'         # Identifies the file as a snapshot of the Search caches
+FORMAT_VERSION = 1          # Version of the binary format (changes if the layout changes)
+
+"""
+Versioned binary snapshot of the caches of Search (term dictionary and document metadata),
+so the API can start without scanning the collections of MongoDB.
+
+Layout of the file:
+    - MAGIC (8 bytes)
+    - FORMAT_VERSION (unsigned int, 4 bytes)
+    - Length of the key (unsigned int, 4 bytes) followed by the key (utf-8): the index version
+        and the layout of the postings (flat or buckets)
+    - Length of the payload (unsigned long long, 8 bytes) followed by the payload (pickle)
+
+The index version is written to MongoDB every time the index is built or changed, and the
+snapshot is ignored if it was taken from a different version of the index or another layout
+(the terms of each layout have their own headers, e.g. the order of the buckets).
+"""
+
+HEADER = struct.Struct('<8sI')
+LENGTH = struct.Struct('<I')
+PAYLOAD_LENGTH = struct.Struct('<Q')
+
+
+def shard_path(path: str, shard: int = None) -> str:
+    """
+    Returns the path of the snapshot of the shard (the same path if the index is not sharded).
+    """
+
+    return path if shard is None else "{}.shard{}".format(path, shard)
+
+
+def snapshot_key(index_version: str, layout: str = None) -> str:
+    """
+    Returns the key of the snapshots of the index version and layout.
+    """
+
+    key = index_version or ''
+    return "{}:{}".format(key, layout) if layout else key
+
+
+def save(index_version: str, cached_dict: dict, cached_docs: dict, path: str = SNAPSHOT_PATH, layout: str = None):
+    """
+    Writes the snapshot of the caches for the given index version and layout.
+    The file is written to a temporary file first and then renamed, so a running API
+    never reads a partial snapshot.
+    """
+
+    payload = pickle.dumps({'dict': cached_dict, 'docs': cached_docs}, protocol = pickle.HIGHEST_PROTOCOL)
+    version = snapshot_key(index_version, layout).encode('utf-8')
+
+    try:
+        temp_path = "{}.tmp".format(path)
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+            file.write(LENGTH.pack(len(version)))
+            file.write(version)
+            file.write(PAYLOAD_LENGTH.pack(len(payload)))
+            file.write(payload)
+        os.replace(temp_path, path)
+    except IOError:
+        print("Error writing the snapshot of the search caches.")
+
+
+def load(index_version: str, path: str = SNAPSHOT_PATH, layout: str = None) -> '(cached_dict, cached_docs) or None':
+    """
+    Loads the snapshot with a single read of the file.
+    Returns None if there is no snapshot, if the format is different, or if it was taken
+    from another version of the index or another layout.
+    """
+
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except IOError:
+        return None
+
+    try:
+        magic, format_version = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            return None
+
+        offset = HEADER.size
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        if data[offset:offset + length].decode('utf-8') != snapshot_key(index_version, layout):
+            return None
+
+        offset += length
+        (length,) = PAYLOAD_LENGTH.unpack_from(data, offset)
+        offset += PAYLOAD_LENGTH.size
+        payload = pickle.loads(memoryview(data)[offset:offset + length])
+    except (struct.error, pickle.UnpicklingError, UnicodeDecodeError, EOFError):
+        return None
+
+    return payload['dict'], payload['docs']
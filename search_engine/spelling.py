@@ -0,0 +1,152 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+from collections import deque
+
+MAX_EDIT_DISTANCE = 2       # Maximum edit distance of the corrections
+PREFIX_LENGTH = 7           # Only the prefix of the terms is used to generate the deletes
+MIN_POSTINGS = 2            # Terms found in fewer documents are not used as corrections
+
+
+def edit_distance(source: str, target: str, max_distance: int) -> int:
+    """
+    Damerau-Levenshtein distance (optimal string alignment) between two words.
+    Stops as soon as the distance is greater than max_distance and returns
+    max_distance + 1 in that case.
+    """
+
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        row_min = i
+        for j in range(1, len(target) + 1):
+            cost = 0 if source[i - 1] == target[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            # Transposition of two adjacent characters
+            if (i > 1 and j > 1 and source[i - 1] == target[j - 2]
+                    and source[i - 2] == target[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+
+    return min(previous[-1], max_distance + 1)
+
+
+class SpellChecker:
+    """
+    This class is responsible for the "did you mean" corrections of the query terms.
+    Uses a SymSpell style precomputed deletion index over the vocabulary of the index:
+        - Every term generates all the strings that result from deleting up to
+            MAX_EDIT_DISTANCE characters of its prefix, and each of those deletes points
+            back to the term.
+        - At query time only the deletes of the misspelled word are generated and looked
+            up, so there is no scan of the vocabulary. The candidates are verified with the
+            edit distance and ranked by distance and then by document frequency.
+    """
+
+    def __init__(self, cached_dict: dict, max_distance: int = MAX_EDIT_DISTANCE,
+                 prefix_length: int = PREFIX_LENGTH, min_postings: int = MIN_POSTINGS):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+        self.terms = []         # Terms that can be used as corrections
+        self.counts = []        # Postings count of each term
+        self.deletes = {}       # Key: delete, Value: index of the term (or list of indexes)
+
+        for term, values in cached_dict.items():
+            count = values.get('postings_count') or 0
+            if count < min_postings:
+                continue
+            idx = len(self.terms)
+            self.terms.append(term)
+            self.counts.append(count)
+
+            for delete in self.generate_deletes(term[:prefix_length]):
+                current = self.deletes.get(delete)
+                if current is None:
+                    self.deletes[delete] = idx
+                elif isinstance(current, list):
+                    current.append(idx)
+                else:
+                    self.deletes[delete] = [current, idx]
+
+        self.vocabulary = dict(zip(self.terms, self.counts))
+
+
+    def generate_deletes(self, word: str) -> set:
+        """
+        Generates the word and all the strings resulting from deleting up to
+        max_distance characters from it.
+        """
+
+        deletes = {word}
+        level = {word}
+        for _ in range(self.max_distance):
+            level = { item[:i] + item[i + 1:] for item in level if len(item) > 1
+                      for i in range(len(item)) }
+            deletes |= level
+
+        return deletes
+
+
+    def correct(self, word: str) -> str:
+        """
+        Returns the most likely correction of the word (lowest edit distance, and then
+        the highest document frequency), the word itself if it is part of the vocabulary,
+        or None if there is no correction within the maximum edit distance.
+        """
+
+        if word in self.vocabulary:
+            return word
+
+        prefix = word[:self.prefix_length]
+        best = None
+        best_key = (self.max_distance + 1, 0)
+        checked = set()
+        seen = {prefix}
+        queue = deque([prefix])
+
+        while queue:
+            candidate = queue.popleft()
+            deleted = len(prefix) - len(candidate)
+
+            # Candidates with more deletes than the best distance found can't improve it
+            if deleted > best_key[0]:
+                break
+
+            matches = self.deletes.get(candidate)
+            if matches is None:
+                matches = ()
+            elif not isinstance(matches, list):
+                matches = (matches,)
+
+            for idx in matches:
+                if idx in checked:
+                    continue
+                checked.add(idx)
+
+                distance = edit_distance(word, self.terms[idx], min(best_key[0], self.max_distance))
+                key = (distance, -self.counts[idx])
+                if distance <= self.max_distance and key < best_key:
+                    best = self.terms[idx]
+                    best_key = key
+
+            if deleted < self.max_distance and len(candidate) > 1:
+                for i in range(len(candidate)):
+                    delete = candidate[:i] + candidate[i + 1:]
+                    if delete not in seen:
+                        seen.add(delete)
+                        queue.append(delete)
+
+        return best
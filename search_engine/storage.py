@@ -3,11 +3,36 @@
 # Search Engine Project
 # -----------------------------------------------------------
 
-from pymongo import MongoClient, UpdateOne, ASCENDING, DESCENDING
+from pymongo import UpdateOne, ASCENDING, DESCENDING
 from pymongo.errors import BulkWriteError
 from pprint import pprint
+from time import time
+from uuid import uuid4
+import database
+from database import LAYOUT_BUCKETS, INDEX_LAYOUT
+
+BUCKET_SIZE = 1000          # Maximum number of postings in each bucket
+ORDER_DOC = 'doc'           # Buckets sorted by document (path ID)
+ORDER_SCORE = 'score'       # Buckets sorted by TF-IDF in descending order
+
+
+def path_key(path: str) -> int:
+    """
+    Converts a path ID ('directory/file') to an integer that keeps the same order
+    used to iterate through the corpus. Used for the ranges of the buckets.
+    """
+
+    directory, file = path.split('/')
+    return (int(directory) << 20) | int(file)
+
+
+def key_path(key: int) -> str:
+    """
+    Converts the integer of a path ID (see path_key) back to the path ID.
+    """
+
+    return "{}/{}".format(key >> 20, key & 0xFFFFF)
 
-DB_NAME = 'project3db'
 
 class Storage:
     """
@@ -19,18 +44,37 @@ class Storage:
         - pymongo for Python
     """
 
-    def __init__(self):
-        self.client = MongoClient("localhost", 27017)
-        self.db = self.client[DB_NAME]
+    def __init__(self, layout: str = INDEX_LAYOUT, shard: int = None):
+        # Shared pooled client of the data-access layer
+        # If the shard is given, the collections of the index are the partitions of that shard
+        self.db = database.get_db()
+        self.layout = layout
+        self.shard = shard
 
         # Collection for the terms
-        self.collection_terms = self.db['test_terms_v6']
+        self.collection_terms = database.get_collection('terms', shard = shard)
+
+        # Collections for the bucketed layout of the terms (headers and buckets of postings)
+        self.collection_headers = database.get_collection('headers', shard = shard)
+        self.collection_buckets = database.get_collection('buckets', shard = shard)
+
+        # Collection for the bi-grams (collected by the indexing)
+        self.collection_bigrams = database.get_collection('bigrams', shard = shard)
 
-        # Collection for the bi-grams
-        self.collection_bigrams = self.db['test_bigrams_v6']
+        # Collection for the blocks of bi-grams keyed by pairs of term IDs (see bigrams)
+        self.collection_pairs = database.get_collection('pairs', shard = shard)
 
         # Collection for documents
-        self.collection_docs = self.db['test_docs_v6']
+        self.collection_docs = database.get_collection('docs', shard = shard)
+
+        # Collection for the forward index (compressed cleaned text of each document)
+        self.collection_forward = database.get_collection('forward', shard = shard)
+
+        # Collection for the quantized impact scores
+        self.collection_impacts = database.get_collection('impacts', shard = shard)
+
+        # Collection for the metadata of the index
+        self.collection_meta = database.get_collection('meta')
 
 
     def insert_scores(self, term, idf, count, scores):
@@ -42,10 +86,19 @@ class Storage:
         It uses unordered bulk insertion to optimize the speed of data insertion.
         """
         
+        # The bucketed layout keeps the IDF in the header of the term
+        if self.layout == LAYOUT_BUCKETS:
+            collection_header = self.collection_headers
+            collection_postings = self.collection_buckets
+        else:
+            collection_header = self.collection_terms
+            collection_postings = self.collection_terms
+
         try:
-            self.collection_terms.update_one(
+            collection_header.update_one(
                 { "term" : term },
-                { "$set" : { "idf" : idf, "postings_count" : count }}
+                { "$set" : { "idf" : idf, "postings_count" : count }},
+                upsert = self.layout == LAYOUT_BUCKETS
             )
             
             operations = []
@@ -56,70 +109,109 @@ class Storage:
                     "postings.$.tf_idf" : value.get("tf_idf") }}
                 ))
 
-            self.collection_terms.bulk_write(operations, ordered = False)
+            collection_postings.bulk_write(operations, ordered = False)
         except BulkWriteError as bwe:
             pprint(bwe.details)
 
-    def insert_scores_bigrams(self, term: str, idf: float, count: int, scores: dict):
+    def insert_posting(self, id: str, posting: dict, weighted_freq: dict, fields: dict = None):
         """
-        This method inserts all the calculated scores to the MongoDB collection of Bi-grams.
-            - IDF for each term
-            - TF for each posting
-            - TF-IDF for each posting
+        This method will insert all the postings of a page to the collection of Terms.
+            - Adds the ID (path ID)
+            - Adds the natural frequency of the term occurrences
+            - Adds the weighted frequency of the term occurrences.
+            - Adds an array containing the positional index of each of the term occurrences.
+            - Adds the frequency of the term in each of the weighted fields (see weighting),
+            only if it appears in any of them.
         It uses unordered bulk insertion to optimize the speed of data insertion.
         """
-        
+
+        if self.layout == LAYOUT_BUCKETS:
+            return self.insert_posting_buckets(id, posting, weighted_freq, fields)
+
         try:
-            self.collection_bigrams.update_one(
-                { "term" : term },
-                { "$set" : { "idf" : idf, "postings_count" : count }}
-            )
+            # Creation of MongoDB index to speed-up insertion and querying.
+            # If it already exists it will be ignored.
+            self.collection_terms.create_index([ ("term", ASCENDING) ])
 
             operations = []
-            for path_id, value in scores.items():
+            for key, value in posting.items():
+                entry = { "path_id" : str(id),
+                          "natural_freq" : value[0],
+                          "positional_idx" : value[1],
+                          "weighted_freq" : weighted_freq.get(key) }
+                if fields and key in fields:
+                    entry["fields"] = fields[key]
                 operations.append( UpdateOne(
-                    { "term" : term , "postings.path_id" : path_id},
-                    { "$set" : { "postings.$.tf" : value.get("tf"),
-                    "postings.$.tf_idf" : value.get("tf_idf") }}
+                    { "term" : key },
+                    { "$push" : { "postings" : entry }},
+                    upsert = True
                 ))
 
-            self.collection_bigrams.bulk_write(operations, ordered = False)
+            self.collection_terms.bulk_write(operations, ordered = False)
         except BulkWriteError as bwe:
             pprint(bwe.details)
-        
 
-    def insert_posting(self, id: str, posting: dict, weighted_freq: dict):
+    def insert_posting_buckets(self, id: str, posting: dict, weighted_freq: dict, fields: dict = None):
         """
-        This method will insert all the postings of a page to the collection of Terms.
-            - Adds the ID (path ID)
-            - Adds the natural frequency of the term occurrences
-            - Adds the weighted frequency of the term occurrences.
-            - Adds an array containing the positional index of each of the term occurrences.
+        This method will insert all the postings of a page to the buckets of the terms
+        (bucketed layout). Each posting is pushed to the bucket of the term that is not
+        full yet, otherwise a new bucket is created by the upsert. Since the corpus is
+        processed in order, the buckets are sorted by document.
         It uses unordered bulk insertion to optimize the speed of data insertion.
         """
 
         try:
             # Creation of MongoDB index to speed-up insertion and querying.
             # If it already exists it will be ignored.
-            self.collection_terms.create_index([ ("term", ASCENDING) ])
+            self.collection_buckets.create_index([ ("term", ASCENDING), ("count", ASCENDING) ])
+            self.collection_buckets.create_index([ ("term", ASCENDING), ("bucket", ASCENDING) ])
+            # Covers the queries of the ranges of the buckets (see Query.term_match)
+            self.collection_buckets.create_index([ ("term", ASCENDING), ("bucket", ASCENDING),
+                                                   ("min_key", ASCENDING), ("max_key", ASCENDING) ])
 
+            key = path_key(str(id))
             operations = []
-            for key, value in posting.items():
+            for term, value in posting.items():
+                entry = { "path_id" : str(id),
+                          "natural_freq" : value[0],
+                          "positional_idx" : value[1],
+                          "weighted_freq" : weighted_freq.get(term) }
+                if fields and term in fields:
+                    entry["fields"] = fields[term]
                 operations.append( UpdateOne(
-                    { "term" : key },
-                    { "$push" : 
-                        { "postings" :
-                            { "path_id" : str(id),
-                            "natural_freq" : value[0],
-                            "positional_idx" : value[1],
-                            "weighted_freq" : weighted_freq.get(key) }}},
+                    { "term" : term, "count" : { "$lt" : BUCKET_SIZE }},
+                    { "$push" : { "postings" : entry },
+                      "$inc" : { "count" : 1 },
+                      "$min" : { "min_key" : key, "bucket" : key },
+                      "$max" : { "max_key" : key },
+                      "$setOnInsert" : { "order" : ORDER_DOC }},
                     upsert = True
                 ))
 
-            self.collection_terms.bulk_write(operations, ordered = False)
+            self.collection_buckets.bulk_write(operations, ordered = False)
         except BulkWriteError as bwe:
             pprint(bwe.details)
 
+
+    def insert_buckets(self, term: str, header: dict, buckets: list):
+        """
+        This method replaces the header and all the buckets of a term (bucketed layout).
+        Used by the migration tool to re-organize the postings.
+        """
+
+        self.collection_headers.create_index([ ("term", ASCENDING) ], unique = True)
+        self.collection_buckets.create_index([ ("term", ASCENDING), ("bucket", ASCENDING) ])
+        # Order in which the buckets are read (see Query.get_impact_buckets)
+        self.collection_buckets.create_index([ ("term", ASCENDING), ("rank", ASCENDING), ("bucket", ASCENDING) ])
+        self.collection_buckets.create_index([ ("term", ASCENDING), ("bucket", ASCENDING),
+                                               ("min_key", ASCENDING), ("max_key", ASCENDING) ])
+
+        self.collection_headers.replace_one({ "term" : term }, dict(header, term = term), upsert = True)
+        self.collection_buckets.delete_many({ "term" : term })
+        if buckets:
+            self.collection_buckets.insert_many(buckets, ordered = False)
+
+
     def insert_posting_bigram(self, id, posting: dict):
         """
         This method will insert all the postings of a page to the collection of Bi-grams.
@@ -223,7 +315,139 @@ class Storage:
             }
         )
 
-        
+
+    def insert_duplicate(self, path: str, original: str):
+        """
+        This method records that the document is a near-duplicate of the original document
+        (see duplicates) in the collection of documents.
+        """
+
+        self.collection_docs.update_one(
+            { "path_id" : path },
+            { "$set" : { "duplicate_of" : original }}
+        )
+
+
+    def insert_alias(self, path: str, alias: str):
+        """
+        This method adds a near-duplicate to the list of aliases of the original document.
+        """
+
+        self.collection_docs.update_one(
+            { "path_id" : path },
+            { "$addToSet" : { "aliases" : alias }}
+        )
+
+
+    def insert_lengths(self, path: str, len_doc: int, field_lengths: list):
+        """
+        This method inserts the lengths of the document to the collection of documents:
+            - Length of the document by character (len_doc)
+            - Length in terms (title and body), used by BM25
+            - Length of each of the fields in terms (see scoring.LENGTH_FIELDS), used by BM25F
+        """
+
+        self.collection_docs.update_one(
+            { "path_id" : path },
+            { "$set" : 
+                { 
+                    "len_doc" : len_doc,
+                    "length" : field_lengths[0] + field_lengths[1],
+                    "field_lengths" : field_lengths
+                }
+            }
+        )
+
+
+    def insert_length_statistics(self, documents: int, avg_length: float, avg_field_lengths: list):
+        """
+        This method inserts the number of documents of the index and the average lengths of
+        the documents and of their fields to the collection of metadata (BM25 scorers).
+        """
+
+        self.collection_meta.update_one(
+            { "_id" : "lengths" },
+            { "$set" : { "documents" : documents, "avg_length" : avg_length,
+                         "avg_field_lengths" : avg_field_lengths, "updated" : time() }},
+            upsert = True
+        )
+
+
+    def insert_forward(self, path: str, entry: dict):
+        """
+        This method inserts the compressed cleaned text and token offsets of a document
+        to the collection of the forward index. Used for query dependent snippets.
+        """
+
+        # Creation of MongoDB index to speed-up insertion and querying.
+        # If it already exists it will be ignored.
+        self.collection_forward.create_index([ ("path_id", ASCENDING) ])
+
+        self.collection_forward.update_one(
+            { "path_id" : path },
+            { "$set" : entry },
+            upsert = True
+        )
+
+
+
+    def insert_impacts(self, term: str, entry: dict):
+        """
+        This method inserts the quantized impact scores of a term (packed document keys,
+        quantized scores and scale) to the collection of impacts.
+        """
+
+        self.collection_impacts.create_index([ ("term", ASCENDING) ], unique = True)
+
+        self.collection_impacts.replace_one({ "term" : term }, dict(entry, term = term), upsert = True)
+
+
+    def insert_pairs(self, terms: list, min_df: int, blocks: list):
+        """
+        This method replaces the blocks of bi-grams keyed by pairs of term IDs (see bigrams)
+        and writes the table of the terms (position = term ID) to the collection of metadata.
+        The blocks and the table share a new version, so the searches never mix the IDs of
+        two different builds.
+        """
+
+        version = uuid4().hex
+        self.collection_pairs.drop()
+        self.collection_pairs.create_index([ ("version", ASCENDING), ("block", ASCENDING) ])
+        if blocks:
+            self.collection_pairs.insert_many([dict(block, block = idx, version = version)
+                                               for idx, block in enumerate(blocks)], ordered = False)
+
+        self.collection_meta.replace_one(
+            { "_id" : self.collection_pairs.name },
+            { "version" : version, "terms" : terms, "min_df" : min_df, "updated" : time() },
+            upsert = True
+        )
+
+
+    def drop_bigrams(self):
+        """
+        This method drops the collection of the bi-grams collected by the indexing (once
+        they are compacted into the blocks of pairs).
+        """
+
+        self.collection_bigrams.drop()
+
+
+    def bump_index_version(self) -> str:
+        """
+        This method writes a new version of the index to the collection of metadata.
+        Must be called every time the index is built or changed, as it invalidates the
+        snapshots of the search caches.
+        """
+
+        version = uuid4().hex
+        self.collection_meta.update_one(
+            { "_id" : "index" },
+            { "$set" : { "version" : version, "updated" : time() }},
+            upsert = True
+        )
+        return version
+
 
 if __name__ == "__main__":
     s = Storage()
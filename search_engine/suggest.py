@@ -0,0 +1,83 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+SUGGEST_LIMIT = 10          # Default number of completions returned
+PRECOMPUTED_DEPTH = 4       # Prefixes up to this length have their completions precomputed
+
+
+class Suggester:
+    """
+    This class is responsible for the prefix autocomplete of the search bar.
+    It is built once from the in-memory term dictionary (Search.cached_dict):
+        - Sorted array of terms, so the terms that start with a prefix are a contiguous
+            range found with binary search.
+        - Postings count of each term, used to rank the completions (most common first).
+        - Precomputed top completions for the short prefixes, which have the largest
+            ranges of terms and are the most requested (every keystroke).
+    """
+
+    def __init__(self, cached_dict: dict, limit: int = SUGGEST_LIMIT):
+        self.limit = limit
+        self.terms = sorted(cached_dict)
+        self.counts = array('I', (cached_dict[term].get('postings_count') or 0 for term in self.terms))
+
+        # Groups the terms by their short prefixes and keeps the most common ones
+        groups = defaultdict(list)
+        for idx, term in enumerate(self.terms):
+            for depth in range(1, min(len(term), PRECOMPUTED_DEPTH) + 1):
+                groups[term[:depth]].append(idx)
+
+        self.top = {}
+        for prefix, indexes in groups.items():
+            self.top[prefix] = [self.terms[idx] for idx in self.rank(indexes, limit)]
+
+
+    def rank(self, indexes, limit: int) -> list:
+        """
+        Returns the indexes of the terms with the highest postings count (ties are kept
+        in alphabetical order).
+        """
+
+        return heapq.nlargest(limit, indexes, key = lambda idx: (self.counts[idx], -idx))
+
+
+    def suggest(self, prefix: str, limit: int = None) -> list:
+        """
+        Returns the top completions of the prefix ranked by postings count.
+        The limit is capped to the limit of the suggester (no completions if it's below 1).
+        """
+
+        limit = self.limit if limit is None else min(limit, self.limit)
+        prefix = prefix.strip().lower()
+        if not prefix or limit < 1:
+            return []
+
+        if len(prefix) <= PRECOMPUTED_DEPTH and limit <= self.limit:
+            return self.top.get(prefix, [])[:limit]
+
+        # Range of terms that start with the prefix
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+
+        return [self.terms[idx] for idx in self.rank(range(start, end), limit)]
+
+
+    def suggest_query(self, query: str, limit: int = None) -> list:
+        """
+        Completes the last word of the query, keeping the words that come before it.
+        """
+
+        head, _, last = query.lower().rpartition(' ')
+        head = ' '.join(head.split())
+        completions = self.suggest(last, limit)
+
+        if head:
+            return ["{} {}".format(head, term) for term in completions]
+        return completions
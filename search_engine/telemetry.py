@@ -0,0 +1,178 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import heapq
+import json
+import logging
+from collections import deque
+from time import perf_counter, time
+logger = logging.getLogger(__name__)
+
+REPORT_INTERVAL = 30        # Number of seconds between each progress report
+RATE_WINDOW = 10            # Number of progress reports used to calculate the rolling rate (ETA)
+SLOWEST_KEPT = 20           # Number of slowest items kept for each phase
+REPORT_PATH = "index_report.json"   # File where the final run report is written
+
+
+class Phase:
+    """
+    Accumulated telemetry of a single phase of the indexing pipeline.
+    """
+
+    def __init__(self, name: str, total: int, unit: str):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.items = 0
+        self.start = perf_counter()
+        self.seconds = 0
+        self.steps = {}         # Key: sub-step, Value: cumulative seconds
+        self.slowest = []       # Min heap of (seconds, item) with the slowest items
+        self.history = deque(maxlen = RATE_WINDOW)  # (perf_counter, items) of the last reports
+
+    def summary(self) -> dict:
+        elapsed = self.seconds or (perf_counter() - self.start)
+        return {'phase': self.name,
+                'unit': self.unit,
+                'items': self.items,
+                'total': self.total,
+                'seconds': round(elapsed, 3),
+                'rate': round(self.items / elapsed, 2) if elapsed else 0,
+                'steps': { step: round(seconds, 3) for step, seconds in
+                           sorted(self.steps.items(), key = lambda x: x[1], reverse = True) },
+                'slowest': [ {'item': item, 'seconds': round(seconds, 3)} for seconds, item in
+                             sorted(self.slowest, reverse = True) ]}
+
+
+class IndexTelemetry:
+    """
+    This class is responsible for the telemetry of the indexing pipeline.
+    Keeps the cumulative time of each phase and sub-step (read, tidy, parse, tokenize,
+    lemmatize, Mongo write, ...), the throughput, a rolling ETA and the slowest items.
+    Progress is logged periodically instead of once per item, and a JSON report of the
+    whole run is written at the end.
+    """
+
+    def __init__(self, interval: float = REPORT_INTERVAL, report_path: str = REPORT_PATH):
+        self.interval = interval
+        self.report_path = report_path
+        self.started = time()
+        self.phases = []
+        self.phase = None
+        self.last_report = perf_counter()
+
+
+    def start_phase(self, name: str, total: int, unit: str = 'docs'):
+        """
+        Starts a new phase of the pipeline with the total number of items to process.
+        """
+
+        self.end_phase()
+        self.phase = Phase(name, total, unit)
+        self.phase.history.append((self.phase.start, 0))
+        self.phases.append(self.phase)
+        self.last_report = perf_counter()
+
+
+    def step(self, name: str, start: float) -> float:
+        """
+        Adds the time elapsed since start (perf_counter) to the sub-step of the current
+        phase. Returns the current perf_counter so consecutive steps can be chained.
+        """
+
+        now = perf_counter()
+        if self.phase is not None:
+            self.phase.steps[name] = self.phase.steps.get(name, 0) + (now - start)
+        return now
+
+
+    def item_done(self, item: str, start: float):
+        """
+        Marks an item (document, term, bi-gram) of the current phase as processed, given
+        the perf_counter of when it started. Logs the progress if the interval has passed.
+        """
+
+        now = perf_counter()
+        phase = self.phase
+        phase.items += 1
+
+        seconds = now - start
+        if len(phase.slowest) < SLOWEST_KEPT:
+            heapq.heappush(phase.slowest, (seconds, item))
+        elif seconds > phase.slowest[0][0]:
+            heapq.heapreplace(phase.slowest, (seconds, item))
+
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            phase.history.append((now, phase.items))
+            self.log_progress(now)
+
+
+    def log_progress(self, now: float):
+        """
+        Logs the progress, throughput and the ETA of the current phase.
+        The ETA uses the rate of the last RATE_WINDOW reports.
+        """
+
+        phase = self.phase
+        elapsed = now - phase.start
+        window_start, window_items = phase.history[0]
+        rolling_rate = (phase.items - window_items) / (now - window_start) if now > window_start else 0
+        eta = (phase.total - phase.items) / rolling_rate if rolling_rate else 0
+        top_steps = sorted(phase.steps.items(), key = lambda x: x[1], reverse = True)[:4]
+
+        logger.info("{} ... {}/{} {} ({}%) ... {} {}/sec ... ETA {}s ... {}".format(
+            phase.name, phase.items, phase.total, phase.unit,
+            round(phase.items / phase.total * 100, 2) if phase.total else 100,
+            round(phase.items / elapsed, 2) if elapsed else 0, phase.unit, round(eta),
+            ', '.join("{}: {}s".format(step, round(seconds, 1)) for step, seconds in top_steps)))
+
+
+    def end_phase(self):
+        """
+        Closes the current phase (if any) and logs its summary.
+        """
+
+        if self.phase is not None and not self.phase.seconds:
+            self.phase.seconds = perf_counter() - self.phase.start
+            self.log_progress(perf_counter())
+        self.phase = None
+
+
+    def report(self) -> dict:
+        """
+        Returns the report of the run with the summary of every phase.
+        """
+
+        return {'started': self.started,
+                'seconds': round(time() - self.started, 3),
+                'phases': [phase.summary() for phase in self.phases]}
+
+
+    def write_report(self):
+        """
+        Closes the current phase and writes the JSON report of the run to the report path.
+        """
+
+        self.end_phase()
+        try:
+            with open(self.report_path, "w", encoding="utf-8") as file:
+                json.dump(self.report(), file, indent = 2)
+            logger.info("Indexing report written to {}".format(self.report_path))
+        except IOError:
+            print("Error writing the indexing report.")
+
+
+class NullTelemetry:
+    """
+    Telemetry that does not record anything. Default for the modules that can be used
+    outside of the indexing pipeline.
+    """
+
+    def step(self, name: str, start: float) -> float:
+        return perf_counter()
+
+
+NULL_TELEMETRY = NullTelemetry()
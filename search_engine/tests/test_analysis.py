@@ -0,0 +1,238 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzer import Analyzer, regex_tokens
+from bigrams import bigram_key, SEPARATOR
+
+try:
+    from preprocessing import Preprocessing
+except ImportError:     # Indexing toolchain (TidyLib, BeautifulSoup, LXML, NLTK) not installed
+    Preprocessing = None
+
+try:
+    from search import Search
+except ImportError:     # pymongo not installed
+    Search = None
+
+try:
+    from nltk.tokenize import WordPunctTokenizer
+except ImportError:
+    WordPunctTokenizer = None
+
+"""
+Tests that the analysis of the documents (indexing, Preprocessing) and of the searches
+(Search) give the terms, positional indexes and bi-grams of the NLTK pipeline the index was
+built with. Both sides are checked against the same fixtures, produced by the baseline
+Preprocessing (WordPunctTokenizer, WordNetLemmatizer and nltk.util.ngrams), so a change of
+either side that would make the searches miss the terms of the index fails here.
+"""
+
+TEXTS = [
+    "The quick brown fox's jumps over the lazy dog!!",
+    "Machine-learning, information retrieval & search engines: an overview...",
+    "Café naïve résumé crème brûlée computers",
+    "e-mail: john.doe@uci.edu (CS121) -- $3.50/hr, 100%",
+    "tab\tseparated\nnew-line  double  spaces",
+    "C++ & C# aren't 'quoted' «guillemets» 日本語 text",
+    "Geese and mice were running; the children's wolves studies",
+    "a an to be or not of cat dog",
+    "",
+]
+
+# (text, tokens with their start, terms with [frequency, positions], terms of the fields (no
+# positions), bi-grams of the terms with their frequency) given by the baseline NLTK pipeline
+ANALYSIS = [
+    ("The quick brown fox's jumps over the lazy dog!!",
+     [('quick', 4), ('brown', 10), ('jumps', 22), ('lazy', 37)],
+     {'quick': [1, [4]], 'brown': [1, [10]], 'jump': [1, [22]], 'lazy': [1, [37]]},
+     {'quick': 1, 'brown': 1, 'jump': 1, 'lazy': 1},
+     {('quick', 'brown'): 1, ('brown', 'jump'): 1, ('jump', 'lazy'): 1}),
+    ('Machine-learning, information retrieval & search engines: an overview...',
+     [('machine', 0), ('learning', 8), ('information', 18), ('retrieval', 30), ('search', 42), ('engines', 49), ('overview', 61)],
+     {'machine': [1, [0]], 'learning': [1, [8]], 'information': [1, [18]], 'retrieval': [1, [30]], 'search': [1, [42]], 'engine': [1, [49]], 'overview': [1, [61]]},
+     {'machine': 1, 'learning': 1, 'information': 1, 'retrieval': 1, 'search': 1, 'engine': 1, 'overview': 1},
+     {('machine', 'learning'): 1, ('learning', 'information'): 1, ('information', 'retrieval'): 1, ('retrieval', 'search'): 1, ('search', 'engine'): 1, ('engine', 'overview'): 1}),
+    ('Café naïve résumé crème brûlée computers',
+     [('computers', 31)],
+     {'computer': [1, [31]]},
+     {'computer': 1},
+     {}),
+    ('e-mail: john.doe@uci.edu (CS121) -- $3.50/hr, 100%',
+     [('mail', 2), ('john', 8), ('cs121', 26)],
+     {'mail': [1, [2]], 'john': [1, [8]], 'cs121': [1, [26]]},
+     {'mail': 1, 'john': 1, 'cs121': 1},
+     {('mail', 'john'): 1, ('john', 'cs121'): 1}),
+    ('tab\tseparated\nnew-line  double  spaces',
+     [('separated', 4), ('line', 18), ('double', 24), ('spaces', 32)],
+     {'separated': [1, [4]], 'line': [1, [18]], 'double': [1, [24]], 'space': [1, [32]]},
+     {'separated': 1, 'line': 1, 'double': 1, 'space': 1},
+     {('separated', 'line'): 1, ('line', 'double'): 1, ('double', 'space'): 1}),
+    ("C++ & C# aren't 'quoted' «guillemets» 日本語 text",
+     [('aren', 9), ('quoted', 17), ('guillemets', 26), ('text', 42)],
+     {'aren': [1, [9]], 'quoted': [1, [17]], 'guillemets': [1, [26]], 'text': [1, [42]]},
+     {'aren': 1, 'quoted': 1, 'guillemets': 1, 'text': 1},
+     {('aren', 'quoted'): 1, ('quoted', 'guillemets'): 1, ('guillemets', 'text'): 1}),
+    ("Geese and mice were running; the children's wolves studies",
+     [('geese', 0), ('mice', 10), ('running', 20), ('children', 33), ('wolves', 44), ('studies', 51)],
+     {'goose': [1, [0]], 'mouse': [1, [10]], 'running': [1, [20]], 'child': [1, [33]], 'wolf': [1, [44]], 'study': [1, [51]]},
+     {'goose': 1, 'mouse': 1, 'running': 1, 'child': 1, 'wolf': 1, 'study': 1},
+     {('goose', 'mouse'): 1, ('mouse', 'running'): 1, ('running', 'child'): 1, ('child', 'wolf'): 1, ('wolf', 'study'): 1}),
+    ('a an to be or not of cat dog',
+     [],
+     {},
+     {},
+     {}),
+    ('The cat and a dog: Café naïve résumé, geese running!',
+     [('geese', 38), ('running', 44)],
+     {'goose': [1, [38]], 'running': [1, [44]]},
+     {'goose': 1, 'running': 1},
+     {('goose', 'running'): 1}),
+    ('Search engines search the search index; engine engines and indexes.',
+     [('search', 0), ('engines', 7), ('search', 15), ('search', 26), ('index', 33), ('engine', 40), ('engines', 47), ('indexes', 59)],
+     {'search': [3, [0, 15, 26]], 'engine': [3, [7, 40, 47]], 'index': [2, [33, 59]]},
+     {'search': 3, 'engine': 3, 'index': 2},
+     {('search', 'engine'): 1, ('engine', 'search'): 1, ('search', 'search'): 1, ('search', 'index'): 1, ('index', 'engine'): 1, ('engine', 'engine'): 1, ('engine', 'index'): 1}),
+]
+
+
+# Tokens of the lowercased texts given by the WordPunctTokenizer of NLTK (the tokenizer used
+# before the Analyzer), with the start of each token
+WORD_PUNCT_TOKENS = [
+    ("The quick brown fox's jumps over the lazy dog!!",
+     [('the', 0), ('quick', 4), ('brown', 10), ('fox', 16), ("'", 19), ('s', 20), ('jumps', 22),
+      ('over', 28), ('the', 33), ('lazy', 37), ('dog', 42), ('!!', 45)]),
+    ("Machine-learning, information retrieval & search engines: an overview...",
+     [('machine', 0), ('-', 7), ('learning', 8), (',', 16), ('information', 18), ('retrieval', 30),
+      ('&', 40), ('search', 42), ('engines', 49), (':', 56), ('an', 58), ('overview', 61), ('...', 69)]),
+    ("Café naïve résumé crème brûlée computers",
+     [('café', 0), ('naïve', 5), ('résumé', 11), ('crème', 18), ('brûlée', 24), ('computers', 31)]),
+    ("e-mail: john.doe@uci.edu (CS121) -- $3.50/hr, 100%",
+     [('e', 0), ('-', 1), ('mail', 2), (':', 6), ('john', 8), ('.', 12), ('doe', 13), ('@', 16),
+      ('uci', 17), ('.', 20), ('edu', 21), ('(', 25), ('cs121', 26), (')', 31), ('--', 33), ('$', 36),
+      ('3', 37), ('.', 38), ('50', 39), ('/', 41), ('hr', 42), (',', 44), ('100', 46), ('%', 49)]),
+    ("tab\tseparated\nnew-line  double  spaces",
+     [('tab', 0), ('separated', 4), ('new', 14), ('-', 17), ('line', 18), ('double', 24), ('spaces', 32)]),
+    ("C++ & C# aren't 'quoted' «guillemets» 日本語 text",
+     [('c', 0), ('++', 1), ('&', 4), ('c', 6), ('#', 7), ('aren', 9), ("'", 13), ('t', 14), ("'", 16),
+      ('quoted', 17), ("'", 23), ('«', 25), ('guillemets', 26), ('»', 36), ('日本語', 38), ('text', 42)]),
+]
+
+
+class TestTokenizer(unittest.TestCase):
+    """
+    The expression of the Analyzer must give the tokens of the WordPunctTokenizer.
+    """
+
+    def test_fixture(self):
+        for text, expected in WORD_PUNCT_TOKENS:
+            tokens = [(match.group(), match.start()) for match in regex_tokens.finditer(text.lower())]
+            self.assertEqual(tokens, expected, text)
+
+    @unittest.skipIf(WordPunctTokenizer is None, "NLTK is not installed")
+    def test_word_punct_tokenizer(self):
+        tokenizer = WordPunctTokenizer()
+        for text in TEXTS:
+            content = text.lower()
+            self.assertEqual(regex_tokens.findall(content), tokenizer.tokenize(content), text)
+            self.assertEqual([match.span() for match in regex_tokens.finditer(content)],
+                             list(tokenizer.span_tokenize(content)), text)
+
+
+def pinned_bigram_keys(bigrams: dict) -> set:
+    # Keys of the bi-grams in the index (see bigrams.build), each one must give its pair back
+    keys = { bigram_key(pair) for pair in bigrams }
+    for pair in bigrams:
+        assert tuple(bigram_key(pair).split(SEPARATOR)) == pair
+    return keys
+
+
+@unittest.skipIf(Preprocessing is None, "The indexing toolchain is not installed")
+class TestIndexAnalysis(unittest.TestCase):
+    """
+    Analysis of the documents (Preprocessing) against the pinned fixtures.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.index = Preprocessing(preload = False)
+        try:
+            cls.index.preload_wordnet()
+        except LookupError:
+            raise unittest.SkipTest("WordNet is not downloaded")
+
+
+    def test_stop_words(self):
+        self.assertIn('the', self.index.stop_words)
+        self.assertNotIn('search', self.index.stop_words)
+
+
+    def test_tokens_and_positions(self):
+        for text, tokens, _, _, _ in ANALYSIS:
+            self.assertEqual(self.index.tokenize_span(text), tokens, text)
+
+
+    def test_terms(self):
+        for text, tokens, terms, field_terms, _ in ANALYSIS:
+            self.assertEqual(dict(self.index.word_frequency(self.index.tokenize_span(text))), terms, text)
+            self.assertEqual(dict(self.index.word_frequency(self.index.tokenize(text))), field_terms, text)
+
+
+    def test_bigrams(self):
+        for text, _, _, _, bigrams in ANALYSIS:
+            index_bigrams = self.index.bigram_freq(text)
+            self.assertEqual(dict(index_bigrams), bigrams, text)
+            self.assertEqual({ bigram_key(pair) for pair in index_bigrams }, pinned_bigram_keys(bigrams), text)
+
+
+    def test_empty(self):
+        self.assertEqual(self.index.tokenize_span(None), [])
+        self.assertEqual(self.index.tokenize_span(""), [])
+
+
+@unittest.skipIf(Search is None, "pymongo is not installed")
+class TestSearchAnalysis(unittest.TestCase):
+    """
+    Analysis of the searches (Search.analyze) against the same pinned fixtures.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Only the analysis of the search is used (no connection to MongoDB)
+        cls.search = Search.__new__(Search)
+        cls.search.p = Analyzer()
+        try:
+            cls.search.p.preload()
+        except LookupError:
+            raise unittest.SkipTest("WordNet is not downloaded")
+
+
+    def test_analysis(self):
+        for text, tokens, terms, _, bigrams in ANALYSIS:
+            list_tokens, word_freq, bigram_freq = self.search.analyze(text)
+            self.assertEqual(list_tokens, tokens, text)
+            self.assertEqual(dict(word_freq), terms, text)
+            self.assertEqual(dict(bigram_freq), bigrams, text)
+            self.assertEqual({ bigram_key(pair) for pair in bigram_freq }, pinned_bigram_keys(bigrams), text)
+
+
+    def test_positions(self):
+        for text, tokens, _, _, _ in ANALYSIS:
+            for token, idx in tokens:
+                self.assertEqual(text.lower()[idx:idx + len(token)], token)
+
+
+    def test_empty(self):
+        self.assertEqual(self.search.analyze(""), ([], {}, {}))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
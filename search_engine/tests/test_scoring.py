@@ -0,0 +1,124 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import os
+import sys
+import random
+import unittest
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from search import Search, BIGRAM_MULTIPLIER
+except ImportError:     # pymongo not installed
+    Search = None
+
+from corpus import path_sort_key
+
+"""
+Tests that the document-at-a-time scoring of the multi-word searches (Search.score_documents)
+gives exactly the same scores, in the same order, as the previous loop over the dictionaries
+of postings of every term and bi-gram. The scores are compared with ==, not approximately.
+"""
+
+SEED = 121
+TRIALS = 200
+
+
+def previous_scores(doc_length: list, weights: list, term_postings: list, bigram_postings: list) -> list:
+    """
+    Scoring loop of retrieve_results before score_documents (dictionary of the postings of
+    each term and bi-gram, probed for every candidate).
+    """
+
+    term_doc_dict = defaultdict(dict)
+    for idx, pairs in enumerate(term_postings):
+        term_doc_dict[idx] = { path: {'tf_idf': tf_idf} for path, tf_idf in pairs }
+    bigram_doc_dict = defaultdict(dict)
+    for idx, pairs in enumerate(bigram_postings):
+        bigram_doc_dict[idx] = { path: {'tf_idf': tf_idf} for path, tf_idf in pairs }
+
+    final_result = []
+    for path in doc_length:
+        score = 0
+        for term, values in term_doc_dict.items():
+            if path.get('_id') in values:
+                cosine_query = weights[term]
+                cosine_doc = values.get(path.get('_id')).get('tf_idf') / path.get('len')
+                score += cosine_query * cosine_doc
+
+        for bigram, values in bigram_doc_dict.items():
+            if path.get('_id') in values:
+                score = (score * (1 - BIGRAM_MULTIPLIER)) + (values.get(path.get('_id')).get('tf_idf') * BIGRAM_MULTIPLIER)
+
+        final_result.append([path['_id'], score])
+
+    return final_result
+
+
+@unittest.skipIf(Search is None, "pymongo is not installed")
+class TestScoreDocuments(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(SEED)
+
+
+    def search(self, paths: list) -> Search:
+        # Only the document IDs are used (no connection to MongoDB)
+        search = Search.__new__(Search)
+        search.doc_paths = sorted(paths, key = path_sort_key)
+        search.doc_ids = { path: idx for idx, path in enumerate(search.doc_paths) }
+        return search
+
+
+    def postings(self, paths: list) -> list:
+        # Postings of a term or bi-gram in path order, as they are stored
+        chosen = self.random.sample(paths, self.random.randint(0, len(paths)))
+        return [(path, self.random.uniform(0.001, 12)) for path in sorted(chosen, key = path_sort_key)]
+
+
+    def test_random_postings(self):
+        for _ in range(TRIALS):
+            paths = ['{}/{}'.format(self.random.randint(0, 74), self.random.randint(0, 499)) for _ in range(60)]
+            paths = list(dict.fromkeys(paths))
+            search = self.search(paths)
+
+            term_postings = [self.postings(paths) for _ in range(self.random.randint(2, 5))]
+            bigram_postings = [self.postings(paths) for _ in range(self.random.randint(0, 3))]
+            weights = [self.random.uniform(0.01, 1) for _ in term_postings]
+
+            # Candidates in the order of the doc length aggregation (not in path order)
+            candidates = sorted({ path for pairs in term_postings for path, _ in pairs })
+            self.random.shuffle(candidates)
+            doc_length = [{'_id': path, 'len': self.random.uniform(0.5, 40)} for path in candidates]
+
+            expected = previous_scores(doc_length, weights, term_postings, bigram_postings)
+            self.assertEqual(search.score_documents(doc_length, weights, term_postings, bigram_postings), expected)
+
+
+    def test_ranking(self):
+        paths = ['0/{}'.format(idx) for idx in range(30)]
+        search = self.search(paths)
+        term_postings = [[(path, 1.5) for path in paths[::2]], [(path, 1.5) for path in paths[::3]]]
+        bigram_postings = [[(path, 0.75) for path in paths[::6]]]
+        doc_length = [{'_id': path, 'len': 3.0} for path in reversed(paths) if path in dict(term_postings[0] + term_postings[1])]
+
+        expected = previous_scores(doc_length, [0.6, 0.8], term_postings, bigram_postings)
+        scores = search.score_documents(doc_length, [0.6, 0.8], term_postings, bigram_postings)
+        # Same scores, so the same ranking after the stable sort (ties keep the order of the candidates)
+        self.assertEqual(sorted(scores, key = lambda x: x[1], reverse = True),
+                         sorted(expected, key = lambda x: x[1], reverse = True))
+
+
+    def test_no_postings(self):
+        search = self.search(['0/1', '0/2'])
+        doc_length = [{'_id': '0/2', 'len': 1.0}, {'_id': '0/1', 'len': 2.0}]
+        self.assertEqual(search.score_documents(doc_length, [1.0, 1.0], [[], []], []), [['0/2', 0], ['0/1', 0]])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
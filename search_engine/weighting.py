@@ -0,0 +1,169 @@
+# -----------------------------------------------------------
+# Jack Yang Huang
+# Search Engine Project
+# -----------------------------------------------------------
+
+import argparse
+import logging
+from time import perf_counter
+from query import Query
+from storage import Storage, BUCKET_SIZE, ORDER_SCORE
+from database import INDEX_LAYOUT, LAYOUT_FLAT, LAYOUT_BUCKETS, NUM_SHARDS, shards
+logger = logging.getLogger(__name__)
+
+"""
+Weights of the fields of the documents (title, body, headers, strong and anchor text).
+
+Every posting keeps the frequency of the term in each field, so the weighted frequency,
+TF and TF-IDF of the postings can be calculated again for new weights without indexing the
+corpus again (python weighting.py --title 4 --h1h2 2). The re-scoring runs inside MongoDB:
+one update of the whole collection of terms (flat layout) or one aggregation that writes
+the buckets back (bucketed layout), so no posting goes through Python.
+
+Postings only store the natural frequency (title + body) and, if the term is in any other
+field, the list 'fields' with its frequency in each of the FIELDS (the body is the natural
+frequency minus the title).
+"""
+
+WEIGHT_TITLE = 6 # Weight for title token frequency
+WEIGHT_BODY = 1 # Weight for body token frequency
+WEIGHT_H1H2 = 3 # Weight for h1h2 token frequency
+WEIGHT_H3H6 = 2 # Weight for h3h6 token frequency
+WEIGHT_STRONG = 1 # Weight for strong token frequency
+WEIGHT_ANCHOR = 1 # Weight for anchor token frequency
+
+FIELDS = ('title', 'h1h2', 'h3h6', 'strong', 'anchor')     # Frequencies stored in the postings (in order)
+WEIGHTS = {'title': WEIGHT_TITLE, 'body': WEIGHT_BODY, 'h1h2': WEIGHT_H1H2,
+           'h3h6': WEIGHT_H3H6, 'strong': WEIGHT_STRONG, 'anchor': WEIGHT_ANCHOR}
+
+
+def field_frequencies(natural_freq: dict, freqs: 'Dict{field: Dict}') -> 'Dict{term: List}':
+    """
+    Gets the frequency of each term of the document (natural_freq) in each of the FIELDS
+    (freqs has the word frequency of each field). Terms that are only in the body are not
+    included. The frequencies of the title are [frequency, [indexes]] lists (see word_frequency).
+    """
+
+    fields = {}
+    for term in natural_freq:
+        values = []
+        for field in FIELDS:
+            value = freqs[field].get(term, 0)
+            values.append(value[0] if isinstance(value, list) else value)
+        if any(values):
+            fields[term] = values
+
+    return fields
+
+
+def weighted_frequency(natural_freq: int, fields: list = None, weights: dict = WEIGHTS):
+    """
+    Calculates the weighted frequency of a term in a document from its natural frequency
+    (title + body) and its frequency in each of the FIELDS (None if it is only in the body).
+    """
+
+    if not fields:
+        return natural_freq * weights['body']
+
+    weighted = (natural_freq - fields[0]) * weights['body']
+    for field, value in zip(FIELDS, fields):
+        weighted += value * weights[field]
+
+    return weighted
+
+
+def weighted_frequency_expression(weights: dict, posting: str) -> dict:
+    """
+    MongoDB expression of weighted_frequency for the posting (variable of the expression).
+    """
+
+    values = [{ '$ifNull': [{ '$arrayElemAt': ['{}.fields'.format(posting), idx] }, 0] }
+              for idx in range(len(FIELDS))]
+    body = { '$subtract': ['{}.natural_freq'.format(posting), values[0]] }
+
+    return { '$add': [{ '$multiply': [body, weights['body']] }] +
+                     [{ '$multiply': [value, weights[field]] } for field, value in zip(FIELDS, values)] }
+
+
+def rescored_postings(weights: dict, idf: str) -> dict:
+    """
+    MongoDB expression of the postings array with the weighted frequency, TF and TF-IDF
+    calculated again for the weights (idf is the expression of the IDF of the term).
+    """
+
+    return {
+        '$map': {
+            'input': '$postings',
+            'as': 'posting',
+            'in': {
+                '$let': {
+                    'vars': { 'weighted': weighted_frequency_expression(weights, '$$posting') },
+                    'in': {
+                        '$let': {
+                            # Checks if weighted frequency is 0, because log(0) = 1
+                            'vars': { 'tf': { '$cond': [{ '$gt': ['$$weighted', 0] },
+                                                        { '$add': [1, { '$log10': '$$weighted' }] }, 0] }},
+                            'in': { '$mergeObjects': ['$$posting', { 'weighted_freq': '$$weighted',
+                                                                     'tf': '$$tf',
+                                                                     'tf_idf': { '$multiply': ['$$tf', idf] }}] }
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+
+def reweight(q: Query, weights: dict = WEIGHTS):
+    """
+    Calculates the weighted frequency, TF and TF-IDF of all the postings of the index (q)
+    again for the weights. The IDF of the terms doesn't depend on the weights.
+    """
+
+    if q.layout == LAYOUT_BUCKETS:
+        # The IDF is in the header of the term, and the buckets are written back by _id
+        q.collection_postings.aggregate([
+            { '$lookup': { 'from': q.collection_headers.name, 'localField': 'term',
+                           'foreignField': 'term', 'as': 'header' }},
+            { '$set': { 'postings': rescored_postings(weights, { '$arrayElemAt': ['$header.idf', 0] }) }},
+            { '$set': { 'max_tf_idf': { '$max': '$postings.tf_idf' }}},
+            { '$unset': 'header' },
+            { '$merge': { 'into': q.collection_postings.name, 'on': '_id',
+                          'whenMatched': 'replace', 'whenNotMatched': 'discard' }}
+        ], allowDiskUse = True)
+    else:
+        q.collection_postings.update_many({}, [{ '$set': { 'postings': rescored_postings(weights, '$idf') }}])
+
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description = "Calculates the scores of the postings again for new weights of the fields.")
+    parser.add_argument('--body', type = float, default = WEIGHT_BODY, help = "Weight of the body")
+    for field in FIELDS:
+        parser.add_argument('--{}'.format(field), type = float, default = WEIGHTS[field],
+                            help = "Weight of the {} text".format(field))
+    parser.add_argument('--layout', choices = [LAYOUT_FLAT, LAYOUT_BUCKETS], default = INDEX_LAYOUT,
+                        help = "Storage layout of the postings of the terms")
+    parser.add_argument('--shards', type = int, default = NUM_SHARDS,
+                        help = "Number of document-partitioned shards of the index")
+    args = parser.parse_args()
+
+    # Imported here, only needed to restore the impact order of the buckets
+    from migrate_buckets import migrate
+
+    weights = {field: getattr(args, field) for field in WEIGHTS}
+    for shard in shards(args.shards):
+        start = perf_counter()
+        q = Query(args.layout, shard = shard)
+        s = Storage(args.layout, shard)
+        reweight(q, weights)
+        # Buckets sorted by TF-IDF are not in order anymore
+        if args.layout == LAYOUT_BUCKETS and q.collection_headers.find_one({ 'order': ORDER_SCORE }):
+            migrate(q, s, ORDER_SCORE, BUCKET_SIZE)
+        logger.info("Re-weighted shard {} in {} seconds: {}".format(shard, round(perf_counter() - start, 2), weights))
+
+    # Invalidates the postings cache, the snapshots and the quantized scores
+    Storage(args.layout).bump_index_version()